@@ -1,3 +1,9 @@
+from config import Config
+from startup_profiler import StartupProfiler
+
+# Installed before anything else is imported, so every import is timed
+STARTUP_PROFILER = StartupProfiler.install() if Config.STARTUP_PROFILE else None
+
 from flask import Flask
 from flask_cors import CORS
 
@@ -6,10 +12,16 @@ from blueprints.main import main_bp
 from blueprints.auth.routes import auth_bp
 from models.base_model import Base, init_db
 from models.user_session import UserSession
+from models.ingestion_job import IngestionJob
+from models.cached_answer import CachedAnswer, CachedAnswerSource
+from models.conversation import Conversation, ConversationMessage
+from services.tracing import configure_tracing, instrument_flask
 
 def create_app():
     app = Flask(__name__)
     CORS(app)  # Enable CORS for all routes
+    if configure_tracing():
+        instrument_flask(app)
 
     # Set the directory for the built frontend (React) app
     import os
@@ -23,8 +35,14 @@ def create_app():
     
     # Set up the application context
     with app.app_context():
-        setup_application()
+        # The database comes first, the ingestion queue lives in it
         init_db(Base)
+        setup_application()
+
+    if STARTUP_PROFILER:
+        STARTUP_PROFILER.app_created()
+        app.before_request(STARTUP_PROFILER.request_started)
+        app.config["STARTUP_PROFILER"] = STARTUP_PROFILER
     
     return app
 
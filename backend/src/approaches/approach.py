@@ -1,8 +1,13 @@
+import asyncio
 from models import Document
 from abc import ABC
 from services.search_service import SearchService
 from typing import List, AsyncGenerator, Any
 from services.llm_service import LLMService
+from services.metrics import RETRIEVAL_SECONDS
+from config import Config
+
+RETRIEVAL_MODES = ("vector", "keyword", "hybrid")
 
 class Approach(ABC):
 
@@ -18,10 +23,28 @@ class Approach(ABC):
         self, 
         text: str, 
         top: int,
-        history: dict[str, str] = None
+        history: dict[str, str] = None,
+        retrieval_mode: str = None
+    ) -> List[Document]:
+        top = top if top else 5
+        retrieval_mode = retrieval_mode or Config.RETRIEVAL_MODE
+        with RETRIEVAL_SECONDS.time(mode=retrieval_mode):
+            if retrieval_mode == "hybrid":
+                return self.search_service.hybrid_search(text, top)
+            if retrieval_mode == "keyword":
+                return self.search_service.keyword_search(text, top)
+            result = self.search_service.search_documents(text, top)
+            return result
+
+    async def asearch(
+        self,
+        text: str,
+        top: int,
+        history: dict[str, str] = None,
+        retrieval_mode: str = None
     ) -> List[Document]:
-        result = self.search_service.search_documents(text, top if top else 5)
-        return result
+        # Embedding and Chroma calls block, so they run on a worker thread
+        return await asyncio.to_thread(self.search, text, top, history, retrieval_mode)
     
     async def run_with_streaming(
         self,
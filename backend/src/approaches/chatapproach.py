@@ -1,33 +1,270 @@
 from .approach import Approach
 from services.search_service import SearchService
 from services.llm_service import LLMService
-from typing import Generator, Any
+from services.context_assembler import ContextAssembler
+from services.query_cache import QueryCache
+from services.single_flight import SingleFlight, AsyncSingleFlight
+from services.answer_cache import AnswerCache
+from services.conversation_service import ConversationService
+from services.sse_encoder import SSEEncoder
+from models import Document
+from config import Config
+from typing import AsyncGenerator, Generator, Any
 
 
-import json
+import asyncio
+
+# Sent instead of resuming when the answer is generated again: the client
+# drops the partial answer it has, the new one follows from the start
+RESET_EVENT = {"reset": True}
 
 class ChatApproach(Approach):
     def __init__(
             self, 
             search_service: SearchService, 
-            llm_service: LLMService
+            llm_service: LLMService,
+            answer_cache: AnswerCache = None,
+            conversation_service: ConversationService = None
         ):
         super().__init__(
             search_service, 
             llm_service
         )
+        self.context_assembler = ContextAssembler() if Config.CONTEXT_MERGE_ADJACENT else None
+        # Identical queries in flight at the same time share one stream
+        self.single_flight = SingleFlight() if Config.COALESCE_QUERIES else None
+        self.async_single_flight = AsyncSingleFlight() if Config.COALESCE_QUERIES else None
+        # Complete answers replayed for a repeated prompt
+        self.answer_cache = answer_cache
+        # Server-side history for queries sent with a conversation id
+        self.conversation_service = conversation_service
+        self.encoder = SSEEncoder()
 
     def run_with_streaming(
             self, 
             query_text: str, 
             top: int = 5, 
-            history: list[dict[str, str]]=None
-        ) -> Generator[str, None, str]:
-        
+            history: list[dict[str, str]]=None,
+            retrieval_mode: str = None,
+            conversation_id: str = None,
+            user_id: str = None,
+            resume_from: int = 0
+        ) -> Generator[bytes, None, None]:
+        """
+        Stream the answer to a query as Server-Sent Events.
+
+        Args:
+            query_text: The question
+            top: Number of documents to retrieve
+            history: Earlier messages sent by the client
+            retrieval_mode: One of RETRIEVAL_MODES, Config.RETRIEVAL_MODE when not given
+            conversation_id: Stored conversation to take the history from
+                instead; the question and the complete answer are added to it
+            user_id: Owner of the conversation, from the access token
+            resume_from: Characters of the answer the client already has,
+                from its Last-Event-ID. Only honoured when the answer is
+                replayed, from the answer cache or a shared stream that is
+                still running; otherwise a reset event tells the client to
+                drop what it has and the new answer is sent from the start.
+                A resumed request does not record the turn again
+        """
+        if conversation_id:
+            history = self.conversation_service.get_history(conversation_id, user_id)
+
+        source = {}
+        shared = False
+        if self.single_flight and not history:
+            key = self._coalescing_key(query_text, top, retrieval_mode)
+            stream, shared = self.single_flight.join(
+                key, lambda: self._stream(query_text, top, history, retrieval_mode, source)
+            )
+        else:
+            stream = self._stream(query_text, top, history, retrieval_mode, source)
+
+        resumed = resume_from > 0
+        if resumed and not shared:
+            # Once the first chunk is out the stream knows whether it replays the cache
+            first = next(stream, None)
+            stream = self._prepend(first, stream)
+            if not source.get("cached"):
+                yield self.encoder.event(RESET_EVENT, 0)
+                resume_from = 0
+
+        answer = []
+        yield from self.encoder.encode(self._record(stream, answer), resume_from)
+
+        if conversation_id and not resumed:
+            self.conversation_service.add_turn(conversation_id, user_id, query_text, "".join(answer))
+
+    async def arun_with_streaming(
+            self,
+            query_text: str,
+            top: int = 5,
+            history: list[dict[str, str]]=None,
+            retrieval_mode: str = None,
+            conversation_id: str = None,
+            user_id: str = None,
+            resume_from: int = 0
+        ) -> AsyncGenerator[bytes, None]:
+        """
+        Async counterpart of run_with_streaming for ASGI servers. Search runs
+        on a worker thread; the response streams on the event loop.
+        """
+        if conversation_id:
+            history = await asyncio.to_thread(self.conversation_service.get_history, conversation_id, user_id)
+
+        source = {}
+        shared = False
+        if self.async_single_flight and not history:
+            key = self._coalescing_key(query_text, top, retrieval_mode)
+            stream, shared = self.async_single_flight.join(
+                key, lambda: self._astream(query_text, top, history, retrieval_mode, source)
+            )
+        else:
+            stream = self._astream(query_text, top, history, retrieval_mode, source)
+
+        resumed = resume_from > 0
+        if resumed and not shared:
+            first = await anext(stream, None)
+            stream = self._aprepend(first, stream)
+            if not source.get("cached"):
+                yield self.encoder.event(RESET_EVENT, 0)
+                resume_from = 0
+
+        answer = []
+        # The encoder closes the stream, leaving a shared one as soon as this client goes away
+        async for frame in self.encoder.aencode(self._arecord(stream, answer), resume_from):
+            yield frame
+
+        if conversation_id and not resumed:
+            await asyncio.to_thread(
+                self.conversation_service.add_turn, conversation_id, user_id, query_text, "".join(answer)
+            )
+
+    def _coalescing_key(
+            self,
+            query_text: str,
+            top: int,
+            retrieval_mode: str
+        ) -> tuple:
+        return QueryCache.normalize(query_text), top, retrieval_mode or Config.RETRIEVAL_MODE
+
+    def _stream(
+            self,
+            query_text: str,
+            top: int,
+            history: list[dict[str, str]],
+            retrieval_mode: str,
+            source: dict
+        ) -> Generator[str, None, None]:
         # First, get search results from the search service
-        search_results = self.search(query_text, top)
+        search_results = self.search(query_text, top, retrieval_mode=retrieval_mode)
+
+        cache_key, cached = self._cached_answer(query_text, search_results, history)
+        if cached is not None:
+            source["cached"] = True
+            yield from cached
+            return
+        retrieved = search_results
+
+        # Merge neighbouring chunks so their overlap is only sent once
+        if self.context_assembler:
+            search_results = self.context_assembler.assemble(search_results)
 
         # Use the LLM service to get a streaming response
+        answer = []
         for chunk in self.llm_service.query(query_text, search_results, history):
+            answer.append(chunk)
             # Yield each chunk as it comes in
-            yield f"{json.dumps({'text': chunk})}\n\n"
\ No newline at end of file
+            yield chunk
+
+        if cache_key:
+            self.answer_cache.put(cache_key, answer, retrieved)
+
+    async def _astream(
+            self,
+            query_text: str,
+            top: int,
+            history: list[dict[str, str]],
+            retrieval_mode: str,
+            source: dict
+        ) -> AsyncGenerator[str, None]:
+        search_results = await self.asearch(query_text, top, retrieval_mode=retrieval_mode)
+
+        cache_key, cached = None, None
+        if self.answer_cache:
+            cache_key, cached = await asyncio.to_thread(self._cached_answer, query_text, search_results, history)
+        if cached is not None:
+            source["cached"] = True
+            for chunk in cached:
+                yield chunk
+            return
+        retrieved = search_results
+
+        if self.context_assembler:
+            search_results = self.context_assembler.assemble(search_results)
+
+        answer = []
+        async for chunk in self.llm_service.aquery(query_text, search_results, history):
+            answer.append(chunk)
+            yield chunk
+
+        if cache_key:
+            await asyncio.to_thread(self.answer_cache.put, cache_key, answer, retrieved)
+
+    def _cached_answer(
+            self,
+            query_text: str,
+            documents: list[Document],
+            history: list[dict[str, str]]
+        ) -> tuple[str, list[str]]:
+        # Answer cache key for the prompt and the cached chunks, if any
+        if not self.answer_cache:
+            return None, None
+        key = self.answer_cache.key(
+            query_text,
+            [document.id for document in documents],
+            history,
+            self.llm_service.model,
+            self.llm_service.get_prefix().fingerprint
+        )
+        return key, self.answer_cache.get(key)
+
+    @staticmethod
+    def _prepend(first: str, stream: Generator[str, None, None]) -> Generator[str, None, None]:
+        # Put back a chunk taken from the stream
+        try:
+            if first is not None:
+                yield first
+            yield from stream
+        finally:
+            stream.close()
+
+    @staticmethod
+    async def _aprepend(first: str, stream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+        try:
+            if first is not None:
+                yield first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    @staticmethod
+    def _record(stream: Generator[str, None, None], answer: list[str]) -> Generator[str, None, None]:
+        # Pass chunks through, keeping a copy of the answer
+        try:
+            for chunk in stream:
+                answer.append(chunk)
+                yield chunk
+        finally:
+            stream.close()
+
+    @staticmethod
+    async def _arecord(stream: AsyncGenerator[str, None], answer: list[str]) -> AsyncGenerator[str, None]:
+        try:
+            async for chunk in stream:
+                answer.append(chunk)
+                yield chunk
+        finally:
+            await stream.aclose()
\ No newline at end of file
@@ -0,0 +1,200 @@
+import json
+import asyncio
+import logging
+import warnings
+from contextlib import asynccontextmanager
+
+from flask import Flask
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+with warnings.catch_warnings():
+    # Deprecated in favour of a2wsgi, which is not a dependency here
+    warnings.simplefilter("ignore", DeprecationWarning)
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+from app import create_app
+from approaches.approach import RETRIEVAL_MODES
+from approaches.chatapproach import ChatApproach
+from config import Config
+from services.auth_service import AuthService
+from services.admission_controller import AdmissionController, AdmissionRejected
+from services.conversation_service import ConversationService
+from services.sse_encoder import SSEEncoder
+from services.tracing import TRACER, configure_tracing
+from services.readiness_service import ReadinessService
+from startup_profiler import FirstRequestMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that runs callbacks once it is done with the client,
+    like Werkzeug's Response.call_on_close: after the last chunk, after an
+    error and after a disconnect, even one before the stream started.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = []
+
+    def call_on_close(self, func):
+        self.on_close.append(func)
+        return func
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # A disconnect can leave the stream suspended mid-chunk
+            close = getattr(self.body_iterator, "aclose", None)
+            if close:
+                await close()
+            for func in self.on_close:
+                func()
+
+
+def _authenticate(flask_app: Flask, access_token: str) -> str:
+    # Same check as validate_auth_token, run on a worker thread. Returns the
+    # user ID, empty when the token is not valid
+    LocalSession = flask_app.config.get("SESSION_LOCAL")
+    if not LocalSession:
+        return ""
+    with TRACER.start_as_current_span("validate_auth_token") as span, LocalSession() as session:
+        user_id, valid = AuthService(session).validate_access_token(access_token)
+        span.set_attribute("auth.valid", valid)
+        return user_id if valid else ""
+
+
+async def generate_llm_response(request: Request):
+    flask_app: Flask = request.app.state.flask_app
+
+    auth_token = request.cookies.get("access_token")
+    if not auth_token:
+        return JSONResponse({"error": "Authentication token is missing"}, status_code=401)
+    user_id = await asyncio.to_thread(_authenticate, flask_app, auth_token)
+    if not user_id:
+        return JSONResponse({"error": "Invalid or expired authentication token"}, status_code=401)
+
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        return JSONResponse({"error": "Request body must be JSON"}, status_code=400)
+    query = body.get("query")
+    history = body.get("history")
+    retrieval_mode = body.get("retrieval_mode")
+    use_conversation = "conversation_id" in body
+    conversation_id = body.get("conversation_id")
+
+    if not use_conversation and not isinstance(history, list):
+        return JSONResponse({"error" : "history must be a list of messages"})
+    if not query:
+        return JSONResponse({"error": "query is required"}, status_code=400)
+    if retrieval_mode and retrieval_mode not in RETRIEVAL_MODES:
+        return JSONResponse({"error": f"retrieval_mode must be one of {', '.join(RETRIEVAL_MODES)}"}, status_code=400)
+
+    chat_approach: ChatApproach = flask_app.config["CHAT_APPROACH"]
+
+    headers = {}
+    if use_conversation:
+        conversation_service: ConversationService = flask_app.config["CONVERSATION_SERVICE"]
+        if not conversation_id:
+            conversation_id = (await asyncio.to_thread(conversation_service.create, user_id)).id
+        elif not await asyncio.to_thread(conversation_service.get, conversation_id, user_id):
+            return JSONResponse({"error": "Conversation not found"}, status_code=404)
+        headers["X-Conversation-Id"] = conversation_id
+
+    admission: AdmissionController = flask_app.config.get("ADMISSION_CONTROLLER")
+    slot = None
+    if admission:
+        try:
+            slot = await admission.acquire_async()
+        except AdmissionRejected as e:
+            return JSONResponse(
+                {"error": str(e)}, status_code=e.status_code, headers={"Retry-After": str(e.retry_after)}
+            )
+
+    stream = chat_approach.arun_with_streaming(
+        query,
+        history=history,
+        retrieval_mode=retrieval_mode,
+        conversation_id=conversation_id,
+        user_id=user_id,
+        resume_from=SSEEncoder.parse_event_id(request.headers.get("last-event-id"))
+    )
+    if slot:
+        stream = admission.atrack(stream, slot)
+    response = ClosingStreamingResponse(stream, media_type="text/event-stream", headers=headers)
+    if slot:
+        response.call_on_close(slot.release)
+    return response
+
+
+async def readiness_check(request: Request):
+    readiness: ReadinessService = request.app.state.flask_app.config["READINESS_SERVICE"]
+    ready, report = await asyncio.to_thread(readiness.check)
+    return JSONResponse(report, status_code=200 if ready else 503)
+
+
+def create_asgi_app(flask_app: Flask = None) -> Starlette:
+    """
+    ASGI application serving /rag/query natively async and every other
+    route through the Flask app.
+
+    Args:
+        flask_app: Flask app whose services and routes are used, created
+            with create_app when not given
+    """
+    flask_app = flask_app or create_app()
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette):
+        yield
+        # uvicorn only gets here once open responses have finished or
+        # --timeout-graceful-shutdown has passed and it cancelled them
+        job_service = flask_app.config.get("INGESTION_JOB_SERVICE")
+        if job_service:
+            # Queued uploads stay in the database for the next start
+            job_service.shutdown(wait=False)
+        conversation_service = flask_app.config.get("CONVERSATION_SERVICE")
+        if conversation_service:
+            # A pending compaction runs again after the next turn
+            conversation_service.shutdown(wait=False)
+        document_service = flask_app.config.get("DOCUMENT_SERVICE")
+        if document_service:
+            # Spawned extraction workers would otherwise outlive the server
+            document_service.parser.close()
+
+    app = Starlette(
+        routes=[
+            Route("/rag/query", generate_llm_response, methods=["POST"]),
+            Route("/ready", readiness_check, methods=["GET"]),
+            Mount("/", app=WSGIMiddleware(flask_app))
+        ],
+        lifespan=lifespan
+    )
+    app.state.flask_app = flask_app
+    if configure_tracing():
+        from opentelemetry.instrumentation.asgi import OpenTelemetryMiddleware
+        # Server span for every request, Flask routes get theirs inside it.
+        # A span per streamed chunk would bury the rest of the waterfall
+        app.add_middleware(OpenTelemetryMiddleware, exclude_spans=["receive", "send"])
+    profiler = flask_app.config.get("STARTUP_PROFILER")
+    if profiler:
+        # /rag/query does not go through Flask
+        app.add_middleware(FirstRequestMiddleware, profiler=profiler)
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "asgi:create_asgi_app",
+        factory=True,
+        host="0.0.0.0",
+        port=5000,
+        timeout_graceful_shutdown=Config.ASGI_SHUTDOWN_TIMEOUT
+    )
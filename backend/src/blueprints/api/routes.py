@@ -1,15 +1,29 @@
-from flask import Blueprint, request, current_app, jsonify, stream_with_context, Response
+import time
+import logging
+import functools
+from flask import Blueprint, request, current_app, jsonify, Response, g
 from decorators.decorators import validate_auth_token
 from services.document_service import DocumentService
+from services.ingestion_job_service import IngestionJobService
 from models import Document
 from services.llm_service import LLMService
+from services.llm_backend import create_llm_backend
 from services.search_service import SearchService
+from services.embedding_cache import create_embedding_function
+from services.bm25_index import BM25Index
+from services.answer_cache import AnswerCache
+from services.admission_controller import AdmissionController, AdmissionRejected
+from services.conversation_service import ConversationService
+from services.sse_encoder import SSEEncoder
+from services.metrics import REGISTRY as METRICS
+from services.readiness_service import ReadinessService
+from services.tracing import in_current_context
 
+from approaches.approach import RETRIEVAL_MODES
 from approaches.chatapproach import ChatApproach
 from config import Config
 
-
-from google.genai import Client
+logger = logging.getLogger(__name__)
 
 # Create the Blueprint for API routes
 api_bp = Blueprint('api', __name__)
@@ -98,16 +112,37 @@ def upload_file(): # Removed async as Flask doesn't need it here for standard re
     if not file.filename.lower().endswith(".pdf"):
         return jsonify({"message" : "File uploaded must be a PDF"}), 400
     
-    # Correctly get the service from app config
-    document_service: DocumentService = current_app.config["DOCUMENT_SERVICE"] 
+    # Parsing and embedding happen on the ingestion workers, not in this request
+    job_service: IngestionJobService = current_app.config["INGESTION_JOB_SERVICE"]
     try:
-        # Pass the file object to the service method
-        document_service.upload_document(file)
+        job, queued = job_service.enqueue(file)
     except Exception as e:
-        current_app.logger.error(f"Error uploading document: {e}", exc_info=True)
-        return jsonify({"message" : "Some error occurred while parsing or saving the PDF"}), 500
+        current_app.logger.error(f"Error queueing document: {e}", exc_info=True)
+        return jsonify({"message" : "Some error occurred while saving the PDF"}), 500
+
+    if not queued:
+        return jsonify({
+            "message": f"PDF has already been uploaded: {file.filename}",
+            "job_id": job.id,
+            "status": job.status
+        }), 200
 
-    return jsonify({"message": f"Successfully processed PDF: {file.filename}"}), 200 # Use 200 for success
+    return jsonify({
+        "message": f"Queued PDF for processing: {file.filename}",
+        "job_id": job.id,
+        "status": job.status
+    }), 202
+
+
+@api_bp.route("/document/jobs/<string:job_id>", methods=["GET"])
+@validate_auth_token
+def get_ingestion_job(job_id: str):
+    job_service: IngestionJobService = current_app.config["INGESTION_JOB_SERVICE"]
+    job = job_service.get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(job.to_dict()), 200
 
 
 @api_bp.route('/rag/query', methods=['POST'])
@@ -115,38 +150,190 @@ def upload_file(): # Removed async as Flask doesn't need it here for standard re
 async def generate_llm_response():
     query = request.json.get("query")
     history = request.json.get("history")
+    retrieval_mode = request.json.get("retrieval_mode")
+    # With a conversation id the server keeps the history; an empty id starts a conversation
+    use_conversation = "conversation_id" in request.json
+    conversation_id = request.json.get("conversation_id")
 
-    if not isinstance(history, list):
+    if not use_conversation and not isinstance(history, list):
         return jsonify({"error" : "history must be a list of messages"})
     if not query:
         return jsonify({"error": "query is required"}), 400
+    if retrieval_mode and retrieval_mode not in RETRIEVAL_MODES:
+        return jsonify({"error": f"retrieval_mode must be one of {', '.join(RETRIEVAL_MODES)}"}), 400
     
     chat_approach: ChatApproach = current_app.config["CHAT_APPROACH"]
+
+    headers = {}
+    if use_conversation:
+        conversation_service: ConversationService = current_app.config["CONVERSATION_SERVICE"]
+        if not conversation_id:
+            conversation_id = conversation_service.create(g.user_id).id
+        elif not conversation_service.get(conversation_id, g.user_id):
+            return jsonify({"error": "Conversation not found"}), 404
+        headers["X-Conversation-Id"] = conversation_id
+
+    # Wait for a free stream slot before committing to a 200
+    admission: AdmissionController = current_app.config.get("ADMISSION_CONTROLLER")
+    slot = None
+    if admission:
+        try:
+            slot = admission.acquire()
+        except AdmissionRejected as e:
+            return jsonify({"error": str(e)}), e.status_code, {"Retry-After": str(e.retry_after)}
     
+    # A reconnecting client only needs the part of the answer it has not seen
+    resume_from = SSEEncoder.parse_event_id(request.headers.get("Last-Event-ID"))
+    user_id = g.user_id
+
     def generate():
-        for chunk in chat_approach.run_with_streaming(query, history=history):
+        stream = chat_approach.run_with_streaming(
+            query,
+            history=history,
+            retrieval_mode=retrieval_mode,
+            conversation_id=conversation_id,
+            user_id=user_id,
+            resume_from=resume_from
+        )
+        if slot:
+            stream = admission.track(stream, slot)
+        for chunk in stream:
             yield chunk
 
-    return Response(generate(), content_type='text/event-stream')
+    # The body streams after the request context is gone, keep it in the request's trace
+    response = Response(in_current_context(generate)(), content_type='text/event-stream', headers=headers)
+    if slot:
+        # The server closes the response even if the client left before the stream started
+        response.call_on_close(slot.release)
+    return response
+
+
+@api_bp.route("/conversations", methods=["POST"])
+@validate_auth_token
+def create_conversation():
+    conversation_service: ConversationService = current_app.config["CONVERSATION_SERVICE"]
+    conversation = conversation_service.create(g.user_id)
+    return jsonify(conversation.to_dict()), 201
+
+
+@api_bp.route("/conversations/<string:conversation_id>", methods=["GET"])
+@validate_auth_token
+def get_conversation(conversation_id: str):
+    conversation_service: ConversationService = current_app.config["CONVERSATION_SERVICE"]
+    conversation = conversation_service.get(conversation_id, g.user_id)
+    if not conversation:
+        return jsonify({"error": "Conversation not found"}), 404
+
+    return jsonify({
+        **conversation.to_dict(),
+        "history": conversation_service.get_history(conversation_id, g.user_id)
+    }), 200
+
+
+@api_bp.route("/conversations/<string:conversation_id>", methods=["DELETE"])
+@validate_auth_token
+def delete_conversation(conversation_id: str):
+    conversation_service: ConversationService = current_app.config["CONVERSATION_SERVICE"]
+    if not conversation_service.delete(conversation_id, g.user_id):
+        return jsonify({"error": "Conversation not found"}), 404
+
+    return jsonify({"message": f"Conversation {conversation_id} deleted successfully"}), 200
 
 # Health check route
 @api_bp.route('/health', methods=['GET'])
 def health_check():
-    return {"status": "ok"}, 200
+    search_service: SearchService = current_app.config["SEARCH_SERVICE"]
+    status = {"status": "ok", "search": search_service.healthcheck()}
+    answer_cache: AnswerCache = current_app.config.get("ANSWER_CACHE")
+    if answer_cache:
+        status["answer_cache"] = answer_cache.healthcheck()
+    admission: AdmissionController = current_app.config.get("ADMISSION_CONTROLLER")
+    if admission:
+        status["admission"] = admission.healthcheck()
+    return status, 200
+
+# Readiness route, for load balancers and rolling deploys
+@api_bp.route('/ready', methods=['GET'])
+def readiness_check():
+    readiness: ReadinessService = current_app.config["READINESS_SERVICE"]
+    ready, report = readiness.check()
+    return report, 200 if ready else 503
+
+# Prometheus scrape endpoint
+@api_bp.route('/metrics', methods=['GET'])
+def metrics():
+    if not METRICS.enabled:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(METRICS.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 def setup_application() -> None:
-    initialize_google_client()
-    document_service = DocumentService()
-    search_service = SearchService()
-    llm_service = LLMService(current_app.config["GOOGLE_CLIENT"], current_app.config["CONFIG"].MODEL, current_app.config["CONFIG"].SYSTEM_PROMPT)
-    chat_approach = ChatApproach(search_service, llm_service)
+    initialize_config()
+    METRICS.start()
+    # One embedding function (and cache) for ingestion and queries
+    embedding_function = create_embedding_function()
+    keyword_index = BM25Index(
+        current_app.config["CONFIG"].BM25_INDEX_DIRECTORY,
+        save_delay=current_app.config["CONFIG"].BM25_SAVE_DELAY
+    )
+    answer_cache = None
+    if current_app.config["CONFIG"].ANSWER_CACHE_ENABLED:
+        answer_cache = AnswerCache(current_app.config["SESSION_LOCAL"])
+    document_service = DocumentService(
+        embedding_function=embedding_function,
+        keyword_index=keyword_index,
+        answer_cache=answer_cache
+    )
+    search_service = SearchService(
+        embedding_function=embedding_function,
+        keyword_index=keyword_index
+    )
+    llm_backend = create_llm_backend()
+    llm_service = LLMService(llm_backend, current_app.config["CONFIG"].MODEL, current_app.config["CONFIG"].SYSTEM_PROMPT)
+    conversation_service = ConversationService(current_app.config["SESSION_LOCAL"], summarize=llm_service.summarize)
+    chat_approach = ChatApproach(search_service, llm_service, answer_cache, conversation_service)
+    ingestion_job_service = IngestionJobService(current_app.config["SESSION_LOCAL"], document_service)
+    current_app.config["ANSWER_CACHE"] = answer_cache
+    current_app.config["ADMISSION_CONTROLLER"] = (
+        AdmissionController() if current_app.config["CONFIG"].LLM_MAX_CONCURRENCY > 0 else None
+    )
     current_app.config["CHAT_APPROACH"] = chat_approach
+    current_app.config["CONVERSATION_SERVICE"] = conversation_service
     current_app.config["DOCUMENT_SERVICE"] = document_service
+    current_app.config["INGESTION_JOB_SERVICE"] = ingestion_job_service
     current_app.config["SEARCH_SERVICE"] = search_service
+    readiness_service = ReadinessService(
+        current_app.config["SESSION_LOCAL"],
+        search_service,
+        llm_service,
+        preload=functools.partial(preload_services, document_service, ingestion_job_service)
+    )
+    readiness_service.start()
+    current_app.config["READINESS_SERVICE"] = readiness_service
+
+def preload_services(
+        document_service: DocumentService,
+        ingestion_job_service: IngestionJobService
+    ) -> dict[str, float]:
+    """
+    Startup work that needs the vector store, run by the readiness service
+    after the deferred imports so create_app does not wait for chromadb.
+
+    Returns:
+        Seconds spent on each step
+    """
+    start = time.perf_counter()
+    synced = document_service.sync_keyword_index()
+    if synced["added"] or synced["removed"]:
+        logger.info(
+            "Keyword index synced with the collection: %d documents added, %d removed",
+            synced["added"], synced["removed"]
+        )
+    synced_at = time.perf_counter()
+    # Only once the index is in sync, which a running upload would race with
+    ingestion_job_service.resume_pending()
+    return {"keyword_index": synced_at - start, "resume_jobs": time.perf_counter() - synced_at}
 
-def initialize_google_client() -> None:
-    config = Config()
-    client = Client(api_key=config.GOOGLE_API_KEY)
-    current_app.config["GOOGLE_CLIENT"] = client
-    current_app.config["CONFIG"] = config
+def initialize_config() -> None:
+    # The genai client is created by the Gemini backend on first use
+    current_app.config["CONFIG"] = Config()
 
@@ -20,7 +20,105 @@ class Config:
 
     # ChromaDB settings
     CHROMA_PERSIST_DIRECTORY = os.environ.get('CHROMA_PERSIST_DIRECTORY') or os.path.join(BASE_DIR, '..', 'pdf_data', 'chroma')
+    # Seconds the document counts and disk size reported by /health are reused for
+    VECTOR_STORE_STATS_TTL = float(os.environ.get('VECTOR_STORE_STATS_TTL', '60'))
+
+    # Ingestion settings - number of chunks embedded and written per collection.add call
+    INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', '64'))
+    # Content-addressed chunk ids - skip files and chunks that are already stored
+    INGEST_DEDUPLICATE = os.environ.get('INGEST_DEDUPLICATE', 'True').lower() in ('true', '1', 't')
+
+    # Embedding cache - vectors are kept on disk keyed by text hash, up to EMBEDDING_CACHE_SIZE entries
+    EMBEDDING_CACHE_ENABLED = os.environ.get('EMBEDDING_CACHE_ENABLED', 'True').lower() in ('true', '1', 't')
+    EMBEDDING_CACHE_DIRECTORY = os.environ.get('EMBEDDING_CACHE_DIRECTORY') or os.path.join(BASE_DIR, '..', 'pdf_data', 'embedding_cache')
+    EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', '200000'))
+    # Embedding cache - seconds between forced writes of the cache files to disk; close() and exit always write
+    EMBEDDING_CACHE_FLUSH_INTERVAL = float(os.environ.get('EMBEDDING_CACHE_FLUSH_INTERVAL', '5'))
+
+    # Search cache - in-process LRU of query embeddings and result IDs per layer
+    QUERY_CACHE_ENABLED = os.environ.get('QUERY_CACHE_ENABLED', 'True').lower() in ('true', '1', 't')
+    QUERY_CACHE_SIZE = int(os.environ.get('QUERY_CACHE_SIZE', '1024'))
+
+    # Retrieval - "vector", "keyword" (BM25) or "hybrid" (both, fused by reciprocal rank)
+    RETRIEVAL_MODE = os.environ.get('RETRIEVAL_MODE', 'vector')
+    BM25_INDEX_DIRECTORY = os.environ.get('BM25_INDEX_DIRECTORY') or os.path.join(BASE_DIR, '..', 'pdf_data', 'bm25')
+    # Seconds single-document adds and deletes are collected for before the BM25 index is saved
+    BM25_SAVE_DELAY = float(os.environ.get('BM25_SAVE_DELAY', '5'))
+    # Candidates taken from each retriever before fusion
+    HYBRID_CANDIDATES = int(os.environ.get('HYBRID_CANDIDATES', '20'))
+
+    # Merge retrieved chunks that are neighbours on a page before building the prompt
+    CONTEXT_MERGE_ADJACENT = os.environ.get('CONTEXT_MERGE_ADJACENT', 'True').lower() in ('true', '1', 't')
+
+    # Share one retrieval and one Gemini stream between identical concurrent queries without history
+    COALESCE_QUERIES = os.environ.get('COALESCE_QUERIES', 'True').lower() in ('true', '1', 't')
+
+    # Answer cache - complete answers stored in the database and replayed for the same prompt (opt-in)
+    ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', 'False').lower() in ('true', '1', 't')
+    ANSWER_CACHE_TTL = int(os.environ.get('ANSWER_CACHE_TTL', '86400'))
+    ANSWER_CACHE_SIZE = int(os.environ.get('ANSWER_CACHE_SIZE', '10000'))
+
+    # Token cache - verified access tokens remembered until they expire (0 disables)
+    TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '10000'))
+
+    # Conversation store - estimated tokens of unsummarised messages before older ones are summarised, recent messages kept verbatim
+    CONVERSATION_COMPACT_TOKENS = int(os.environ.get('CONVERSATION_COMPACT_TOKENS', '2000'))
+    CONVERSATION_KEEP_MESSAGES = int(os.environ.get('CONVERSATION_KEEP_MESSAGES', '4'))
+
+    # Chat stream events - bytes and milliseconds of text buffered into one event after the first (0 for no limit), idle seconds before a heartbeat (0 disables); WSGI streams check both as chunks arrive
+    SSE_COALESCE_BYTES = int(os.environ.get('SSE_COALESCE_BYTES', '1024'))
+    SSE_COALESCE_MS = float(os.environ.get('SSE_COALESCE_MS', '50'))
+    SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', '15'))
+
+    # Metrics - record stage latencies and serve them on /metrics, directory shared by worker processes (empty for one process), seconds between writes to it
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() in ('true', '1', 't')
+    METRICS_DIRECTORY = os.environ.get('METRICS_DIRECTORY', '')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+
+    # Tracing - none, console, memory or otlp (sent to OTEL_EXPORTER_OTLP_ENDPOINT), service name on the spans
+    TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', 'none')
+    TRACING_SERVICE_NAME = os.environ.get('TRACING_SERVICE_NAME', 'wsp-rag-app')
+
+    # Warm-up - load the embedding model and HNSW index and compile the prompt prefix before /ready reports ready
+    WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', 'True').lower() in ('true', '1', 't')
+    # Seconds before a failed warm-up is retried, doubled after every further failure up to 5 minutes
+    WARMUP_RETRY_SECONDS = float(os.environ.get('WARMUP_RETRY_SECONDS', '5'))
+
+    # Startup profile - time every import, create_app and the first request, and log the slowest modules
+    STARTUP_PROFILE = os.environ.get('STARTUP_PROFILE', 'False').lower() in ('true', '1', 't')
+
+    # Admission control - chat streams running at once (0 for no limit), requests allowed to wait
+    # for a slot, seconds they may wait and the longest pause after upstream rate limiting
+    LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '32'))
+    LLM_QUEUE_SIZE = int(os.environ.get('LLM_QUEUE_SIZE', '64'))
+    LLM_QUEUE_TIMEOUT = float(os.environ.get('LLM_QUEUE_TIMEOUT', '10'))
+    LLM_BACKOFF_MAX = float(os.environ.get('LLM_BACKOFF_MAX', '60'))
+
+    # Approximate token budget for the whole prompt; 0 sends everything
+    PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', '8000'))
+    # Seconds to keep the system prompt and few-shot examples in Gemini's context cache; 0 disables it
+    LLM_CONTEXT_CACHE_TTL = int(os.environ.get('LLM_CONTEXT_CACHE_TTL', '0'))
+
+    # Background ingestion - where queued uploads are kept and how many are processed at once
+    UPLOAD_DIRECTORY = os.environ.get('UPLOAD_DIRECTORY') or os.path.join(BASE_DIR, '..', 'pdf_data', 'uploads')
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', '2'))
+
+    # PDF parsing settings - worker processes for page extraction (0 or 1 extracts in-thread),
+    # seconds allowed per page and the smallest document worth farming out
+    PDF_PARSE_WORKERS = int(os.environ.get('PDF_PARSE_WORKERS', '0'))
+    PDF_PAGE_TIMEOUT = float(os.environ.get('PDF_PAGE_TIMEOUT', '30'))
+    PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', '16'))
     
+    # LLM backend - "gemini", or "simulated" to stream deterministic text locally for load tests
+    LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini')
+    # Simulated backend - seconds to first token and between tokens, tokens per answer,
+    # fraction of failed requests and requests allowed per minute (0 for no limit)
+    SIMULATED_LLM_TTFT = float(os.environ.get('SIMULATED_LLM_TTFT', '0.5'))
+    SIMULATED_LLM_TOKEN_DELAY = float(os.environ.get('SIMULATED_LLM_TOKEN_DELAY', '0.02'))
+    SIMULATED_LLM_TOKENS = int(os.environ.get('SIMULATED_LLM_TOKENS', '200'))
+    SIMULATED_LLM_ERROR_RATE = float(os.environ.get('SIMULATED_LLM_ERROR_RATE', '0'))
+    SIMULATED_LLM_RATE_LIMIT = int(os.environ.get('SIMULATED_LLM_RATE_LIMIT', '0'))
+
     # Google API settings for Gemini
     GOOGLE_API_KEY = os.environ.get('GOOGLE_GENAI_API_KEY')
 
@@ -30,6 +128,10 @@ class Config:
     
     # Flask settings
     DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() in ('true', '1', 't')
+
+    # ASGI server settings - seconds open streams get to finish on shutdown before they are cancelled,
+    # passed to uvicorn as timeout_graceful_shutdown by `python asgi.py`
+    ASGI_SHUTDOWN_TIMEOUT = int(os.environ.get('ASGI_SHUTDOWN_TIMEOUT', '30'))
     
     # CORS settings - allow frontend to access API
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:5173').split(',')
\ No newline at end of file
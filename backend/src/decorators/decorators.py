@@ -1,14 +1,22 @@
 from functools import wraps
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, g
 from services.auth_service import AuthService
+from services.tracing import TRACER
 import asyncio
 from functools import wraps
 from flask import request, jsonify, current_app
 
+
+def _auth_token():
+    # Login sets access_token. The sync wrapper used to read auth_token,
+    # which nothing sets, so clients that send it are still accepted
+    return request.cookies.get('access_token') or request.cookies.get('auth_token')
+
+
 def validate_auth_token(func):
     @wraps(func)
     async def async_wrapper(*args, **kwargs):
-        auth_token = request.cookies.get('access_token')
+        auth_token = _auth_token()
         if not auth_token:
             return jsonify({"error": "Authentication token is missing"}), 401
         
@@ -17,16 +25,21 @@ def validate_auth_token(func):
         if not LocalSession:
             return jsonify({"error": "Database session not initialized"}), 500
         
-        auth_service = AuthService(LocalSession())
+        with TRACER.start_as_current_span("validate_auth_token") as span:
+            auth_service = AuthService(LocalSession())
+            user_id, valid = auth_service.validate_access_token(auth_token)
+            span.set_attribute("auth.valid", valid)
 
-        if not auth_service.validate_access_token(auth_token)[1]:
+        if not valid:
             return jsonify({"error": "Invalid or expired authentication token"}), 401
+        # For views acting on the user's own data
+        g.user_id = user_id
         
         return await func(*args, **kwargs)
 
     @wraps(func)
     def sync_wrapper(*args, **kwargs):
-        auth_token = request.cookies.get('auth_token')
+        auth_token = _auth_token()
         if not auth_token:
             return jsonify({"error": "Authentication token is missing"}), 401
         
@@ -34,10 +47,15 @@ def validate_auth_token(func):
         if not LocalSession:
             return jsonify({"error": "Database session not initialized"}), 500
         
-        auth_service = AuthService(LocalSession())
+        with TRACER.start_as_current_span("validate_auth_token") as span:
+            auth_service = AuthService(LocalSession())
+            user_id, valid = auth_service.validate_access_token(auth_token)
+            span.set_attribute("auth.valid", valid)
 
-        if not auth_service.validate_access_token(auth_token)[1]:
+        if not valid:
             return jsonify({"error": "Invalid or expired authentication token"}), 401
+        # For views acting on the user's own data
+        g.user_id = user_id
         
         return func(*args, **kwargs)
 
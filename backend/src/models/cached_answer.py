@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, Text, DATETIME, ForeignKey
+
+from .base_model import Base
+from sqlalchemy.sql import func
+
+class CachedAnswer(Base):
+    __tablename__ = "cached_answer"
+    key = Column(String, primary_key=True)
+    # JSON list of the streamed chunks, replayed one frame each
+    chunks = Column(Text)
+    created_at = Column(DATETIME, default=func.now())
+    expires_at = Column(DATETIME, index=True)
+    last_used_at = Column(DATETIME, default=func.now(), index=True)
+
+
+class CachedAnswerSource(Base):
+    """
+    A document chunk that was in the prompt of a cached answer.
+    """
+    __tablename__ = "cached_answer_source"
+    id = Column(Integer, primary_key=True)
+    answer_key = Column(String, ForeignKey("cached_answer.key", ondelete="CASCADE"), index=True)
+    document_id = Column(String, index=True)
+    name = Column(String, index=True)
@@ -0,0 +1,41 @@
+from sqlalchemy import Column, Integer, String, Text, DATETIME, ForeignKey, UniqueConstraint
+
+from .base_model import Base
+from sqlalchemy.sql import func
+
+class Conversation(Base):
+    __tablename__ = "conversation"
+    id = Column(String, primary_key=True)
+    # User ID from the access token of the user who started it
+    user_id = Column(String, index=True)
+    # Running summary of the messages that were compacted
+    summary = Column(Text, default="")
+    # Messages folded into the summary, counted from the start
+    compacted = Column(Integer, default=0)
+    created_at = Column(DATETIME, default=func.now())
+    updated_at = Column(DATETIME, default=func.now(), onupdate=func.now())
+
+    def to_dict(self):
+        """
+        Convert the conversation to a dictionary.
+        """
+        return {
+            "conversation_id": self.id,
+            "summary": self.summary,
+            "compacted": self.compacted,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class ConversationMessage(Base):
+    __tablename__ = "conversation_message"
+    # Two turns recorded at once cannot take the same positions
+    __table_args__ = (UniqueConstraint("conversation_id", "position"),)
+    id = Column(Integer, primary_key=True)
+    conversation_id = Column(String, ForeignKey("conversation.id", ondelete="CASCADE"), index=True)
+    # Position of the message in the conversation, from 0
+    position = Column(Integer)
+    role = Column(String)
+    text = Column(Text)
+    created_at = Column(DATETIME, default=func.now())
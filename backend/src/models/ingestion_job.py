@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, DATETIME
+
+from .base_model import Base
+from sqlalchemy.sql import func
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_job"
+    id = Column(String, primary_key=True)
+    name = Column(String)
+    file_path = Column(String)
+    file_hash = Column(String, index=True)
+    status = Column(String, default="queued")
+    pages_parsed = Column(Integer, default=0)
+    chunks_embedded = Column(Integer, default=0)
+    failures = Column(Integer, default=0)
+    error = Column(String)
+    created_at = Column(DATETIME, default=func.now())
+    updated_at = Column(DATETIME, default=func.now(), onupdate=func.now())
+
+    def to_dict(self):
+        """
+        Convert the job to a dictionary.
+        """
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "pages_parsed": self.pages_parsed,
+            "chunks_embedded": self.chunks_embedded,
+            "failures": self.failures,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -0,0 +1,316 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, AsyncIterator, Iterator
+from config import Config
+from .base_service import BaseService
+from .metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS
+
+if TYPE_CHECKING:
+    from google.genai import errors
+
+logger = logging.getLogger(__name__)
+
+# Upstream statuses that mean the model provider wants less traffic
+BACKOFF_STATUSES = (429, 503)
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request cannot be admitted.
+
+    Args:
+        message: Reason for the client
+        status_code: 429 when the queue is full, 503 when the wait deadline
+            passed or upstream asked to back off
+        retry_after: Seconds the client should wait before retrying
+    """
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    # A queued request; granted once a slot has been handed to it
+    def __init__(self, loop: asyncio.AbstractEventLoop = None):
+        self.granted = False
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.loop = loop
+
+    def grant(self):
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class Slot:
+    """
+    A place among the running streams. Released once: by track when the
+    stream ends, or by the route when the response is closed, which also
+    covers a stream the client dropped before it ever ran.
+    """
+    def __init__(self, controller: "AdmissionController"):
+        self.controller = controller
+        self.released = False
+        self.lock = threading.Lock()
+
+    def release(self):
+        with self.lock:
+            if self.released:
+                return
+            self.released = True
+        self.controller._release()
+
+
+class AdmissionController(BaseService):
+    """
+    Limits how many chat streams run at once.
+
+    Requests beyond the concurrency limit wait in a bounded FIFO queue for
+    at most `queue_timeout` seconds. A full queue is rejected at once with a
+    429, an expired wait with a 503. When the model provider answers with
+    429 or 503 the limit is halved and new requests are turned away for an
+    exponentially growing backoff period; every completed stream raises the
+    limit by one again, up to `max_concurrency`.
+
+    acquire returns a Slot; wrapping the response stream with track hands
+    it back when the stream ends and feeds upstream errors into the limit.
+    Routes also release the slot when the response is closed, for streams
+    that never ran.
+
+    Works for threads and event loops alike, so the Flask and ASGI paths
+    share one set of slots.
+    """
+    def __init__(
+            self,
+            max_concurrency: int = None,
+            max_queue: int = None,
+            queue_timeout: float = None,
+            max_backoff: float = None
+        ):
+        """
+        Args:
+            max_concurrency: Streams that may run at once
+            max_queue: Requests that may wait for a slot
+            queue_timeout: Seconds a request may wait for a slot
+            max_backoff: Longest pause after upstream rate limiting, in seconds
+        """
+        super().__init__()
+        self.max_concurrency = max_concurrency or Config.LLM_MAX_CONCURRENCY
+        self.max_queue = Config.LLM_QUEUE_SIZE if max_queue is None else max_queue
+        self.queue_timeout = Config.LLM_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self.max_backoff = max_backoff or Config.LLM_BACKOFF_MAX
+        self.limit = self.max_concurrency
+        self.active = 0
+        self.waiters = deque()
+        self.backoff = 0.0
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        # Counters
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "timeout": 0, "backoff": 0}
+        self.upstream_throttled = 0
+        self.last_error = None
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def acquire(self) -> Slot:
+        """
+        Take a slot, waiting in the queue if none is free.
+
+        Raises:
+            AdmissionRejected: If the queue is full, the wait deadline passed
+                or upstream asked to back off
+        """
+        start = time.monotonic()
+        with self.lock:
+            waiter = self._admit_or_enqueue(start)
+        if waiter is not None:
+            waiter.event.wait(self.queue_timeout)
+            self._finish_wait(waiter, start)
+        return Slot(self)
+
+    async def acquire_async(self) -> Slot:
+        """
+        Take a slot without blocking the event loop.
+
+        Raises:
+            AdmissionRejected: If the queue is full, the wait deadline passed
+                or upstream asked to back off
+        """
+        start = time.monotonic()
+        with self.lock:
+            waiter = self._admit_or_enqueue(start, asyncio.get_running_loop())
+        if waiter is None:
+            return Slot(self)
+
+        try:
+            # asyncio.wait leaves the future alone on timeout
+            await asyncio.wait({waiter.future}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            with self.lock:
+                if waiter.granted:
+                    self._release_locked()
+                else:
+                    self.waiters.remove(waiter)
+                    self._publish_locked()
+            raise
+        self._finish_wait(waiter, start)
+        return Slot(self)
+
+    def track(self, stream: Iterator[bytes], slot: Slot) -> Iterator[bytes]:
+        """
+        Pass a stream through, learning from how it ends and releasing its
+        slot when it is closed.
+        """
+        # Already loaded by the backend that produces the stream
+        from google.genai import errors
+
+        try:
+            for chunk in stream:
+                yield chunk
+        except errors.APIError as e:
+            self._record_failure(e)
+            raise
+        else:
+            self._record_success()
+        finally:
+            slot.release()
+
+    async def atrack(self, stream: AsyncIterator[bytes], slot: Slot) -> AsyncIterator[bytes]:
+        """
+        Async counterpart of track.
+        """
+        from google.genai import errors
+
+        try:
+            async for chunk in stream:
+                yield chunk
+        except errors.APIError as e:
+            self._record_failure(e)
+            raise
+        else:
+            self._record_success()
+        finally:
+            slot.release()
+
+    def healthcheck(self):
+        """
+        Check if the service is healthy, with slot, queue and wait statistics.
+        """
+        status = super().healthcheck()
+        with self.lock:
+            status.update({
+                "active": self.active,
+                "limit": self.limit,
+                "max_concurrency": self.max_concurrency,
+                "queue_depth": len(self.waiters),
+                "backoff_seconds": max(0.0, self.paused_until - time.monotonic()),
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "upstream_throttled": self.upstream_throttled,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_max": self.wait_seconds_max
+            })
+        return status
+
+    def _admit_or_enqueue(
+            self,
+            now: float,
+            loop: asyncio.AbstractEventLoop = None
+        ) -> _Waiter:
+        # Caller holds the lock. Returns None when a slot was taken at once
+        if now < self.paused_until:
+            self.rejected["backoff"] += 1
+            ADMISSION_REJECTIONS.inc(reason="backoff")
+            raise AdmissionRejected(
+                "The model is rate limited, try again later", 503, self._retry_after(self.paused_until - now)
+            )
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            self._publish_locked()
+            ADMISSION_WAIT_SECONDS.observe(0.0)
+            return None
+        if len(self.waiters) >= self.max_queue:
+            self.rejected["queue_full"] += 1
+            ADMISSION_REJECTIONS.inc(reason="queue_full")
+            raise AdmissionRejected("Too many requests in flight", 429, self._retry_after(self.queue_timeout))
+        waiter = _Waiter(loop)
+        self.waiters.append(waiter)
+        self._publish_locked()
+        return waiter
+
+    def _finish_wait(self, waiter: _Waiter, start: float):
+        waited = time.monotonic() - start
+        with self.lock:
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            ADMISSION_WAIT_SECONDS.observe(waited)
+            if waiter.granted:
+                self.admitted += 1
+                return
+            self.waiters.remove(waiter)
+            self._publish_locked()
+            self.rejected["timeout"] += 1
+            ADMISSION_REJECTIONS.inc(reason="timeout")
+        raise AdmissionRejected("Timed out waiting for a free slot", 503, self._retry_after(self.queue_timeout))
+
+    def _release(self):
+        with self.lock:
+            self._release_locked()
+
+    def _release_locked(self):
+        self.active -= 1
+        self._grant_locked()
+
+    def _grant_locked(self):
+        # Hand free slots to waiters in arrival order. A backoff pause only
+        # turns away new arrivals; queued requests keep their place
+        while self.waiters and self.active < self.limit:
+            self.active += 1
+            self.waiters.popleft().grant()
+        self._publish_locked()
+
+    def _publish_locked(self):
+        # Caller holds the lock, so the gauges follow the changes in order
+        ADMISSION_QUEUE_DEPTH.set(len(self.waiters))
+        ADMISSION_IN_FLIGHT.set(self.active)
+
+    def _record_success(self):
+        with self.lock:
+            self.backoff = 0.0
+            if self.limit < self.max_concurrency:
+                self.limit += 1
+                self._grant_locked()
+
+    def _record_failure(self, error: "errors.APIError"):
+        if error.code not in BACKOFF_STATUSES:
+            return
+        with self.lock:
+            if error is self.last_error:
+                # Coalesced streams all see the same upstream error
+                return
+            self.last_error = error
+            self.upstream_throttled += 1
+            self.backoff = min(self.max_backoff, self.backoff * 2 or 1.0)
+            self.paused_until = max(self.paused_until, time.monotonic() + self.backoff)
+            self.limit = max(1, self.limit // 2)
+        logger.warning(
+            "Upstream returned %d, limiting to %d streams and pausing admissions for %.1fs",
+            error.code, self.limit, self.backoff
+        )
+
+    @staticmethod
+    def _retry_after(seconds: float) -> int:
+        return max(1, int(seconds + 0.999))
@@ -0,0 +1,204 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, func
+from sqlalchemy.exc import SQLAlchemyError
+from config import Config
+from models import Document
+from models.cached_answer import CachedAnswer, CachedAnswerSource
+from .base_service import BaseService
+from .query_cache import QueryCache
+
+logger = logging.getLogger(__name__)
+
+# Seconds the entry count reported by /health is reused for
+ENTRY_COUNT_TTL = 60.0
+
+
+class AnswerCache(BaseService):
+    """
+    Persistent cache of complete LLM answers in the application database.
+
+    Answers are keyed on everything that went into the prompt, so they are
+    only replayed for the same question over the same retrieved chunks. The
+    chunks and source files each answer was built from are recorded, so
+    deleting or re-ingesting a source drops the answers that cite it.
+    Entries expire after a TTL, and the least recently used are evicted
+    beyond the size limit.
+    """
+    def __init__(
+            self,
+            session_factory,
+            ttl: int = None,
+            max_entries: int = None
+        ):
+        """
+        Args:
+            session_factory: SQLAlchemy sessionmaker for the application database
+            ttl: Seconds an answer is kept
+            max_entries: Number of answers kept before the least recently used are evicted
+        """
+        super().__init__()
+        self.session_factory = session_factory
+        self.ttl = ttl or Config.ANSWER_CACHE_TTL
+        self.max_entries = max_entries or Config.ANSWER_CACHE_SIZE
+        self.hits = 0
+        self.misses = 0
+        self.entries = None
+        self.counted_at = 0.0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(
+            query: str,
+            document_ids: list[str],
+            history: list[dict[str, str]],
+            model: str,
+            prompt_fingerprint: str
+        ) -> str:
+        """
+        Cache key for an answer.
+
+        Args:
+            query: The user's query, normalized like search cache keys
+            document_ids: IDs of the retrieved chunks, in rank order
+            history: Conversation turns sent with the query
+            model: The Gemini model
+            prompt_fingerprint: Hash of the system prompt and few-shot examples
+        """
+        history_hash = hashlib.sha256(json.dumps(history or [], sort_keys=True).encode()).hexdigest()
+        parts = [QueryCache.normalize(query), document_ids, history_hash, model, prompt_fingerprint]
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> list[str]:
+        """
+        The chunks of a cached answer, or None if it is missing or expired.
+        """
+        now = datetime.now()
+        try:
+            with self.session_factory() as session:
+                answer = session.get(CachedAnswer, key)
+                if answer is None or answer.expires_at <= now:
+                    if answer is not None:
+                        self._delete(session, [key])
+                        session.commit()
+                    with self.lock:
+                        self.misses += 1
+                    return None
+                answer.last_used_at = now
+                chunks = json.loads(answer.chunks)
+                session.commit()
+        except SQLAlchemyError as e:
+            logger.warning("Answer cache lookup failed: %s", e)
+            return None
+        with self.lock:
+            self.hits += 1
+        return chunks
+
+    def put(
+            self,
+            key: str,
+            chunks: list[str],
+            documents: list[Document]
+        ):
+        """
+        Store an answer with the documents it was generated from.
+        """
+        now = datetime.now()
+        try:
+            with self.session_factory() as session:
+                self._delete(session, [key])
+                session.add(CachedAnswer(
+                    key=key,
+                    chunks=json.dumps(chunks),
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=self.ttl),
+                    last_used_at=now
+                ))
+                session.add_all(
+                    CachedAnswerSource(answer_key=key, document_id=document.id, name=document.metadata.get("name"))
+                    for document in documents
+                )
+                self._evict(session, now)
+                session.commit()
+        except SQLAlchemyError as e:
+            logger.warning("Could not cache answer: %s", e)
+
+    def invalidate_documents(self, document_ids: list[str]) -> int:
+        """
+        Drop every answer generated from any of the given chunks.
+
+        Returns:
+            Number of answers dropped
+        """
+        return self._invalidate(CachedAnswerSource.document_id.in_(document_ids))
+
+    def invalidate_sources(self, names: list[str]) -> int:
+        """
+        Drop every answer generated from chunks of the given source files.
+
+        Returns:
+            Number of answers dropped
+        """
+        return self._invalidate(CachedAnswerSource.name.in_(names))
+
+    def healthcheck(self):
+        """
+        Check if the service is healthy, with entry and hit/miss counts.
+        The entries are counted at most once every ENTRY_COUNT_TTL seconds.
+        """
+        status = super().healthcheck()
+        try:
+            status["entries"] = self._count_entries()
+        except SQLAlchemyError as e:
+            logger.warning("Answer cache health check failed: %s", e)
+            status["status"] = "error"
+            status["error"] = str(e)
+        with self.lock:
+            status["hits"] = self.hits
+            status["misses"] = self.misses
+        return status
+
+    def _count_entries(self) -> int:
+        with self.lock:
+            if self.entries is not None and time.monotonic() - self.counted_at < ENTRY_COUNT_TTL:
+                return self.entries
+        with self.session_factory() as session:
+            entries = session.scalar(select(func.count()).select_from(CachedAnswer))
+        with self.lock:
+            self.entries, self.counted_at = entries, time.monotonic()
+        return entries
+
+    def _invalidate(self, condition) -> int:
+        # Called after a document write has succeeded, which a cache failure must not undo
+        try:
+            with self.session_factory() as session:
+                keys = list(session.scalars(select(CachedAnswerSource.answer_key).where(condition).distinct()))
+                if keys:
+                    self._delete(session, keys)
+                    session.commit()
+                    logger.info("Invalidated %d cached answers", len(keys))
+        except SQLAlchemyError as e:
+            logger.warning("Could not invalidate cached answers: %s", e)
+            return 0
+        return len(keys)
+
+    def _delete(self, session, keys: list[str]):
+        # SQLite does not enforce the foreign key cascade by default
+        session.execute(delete(CachedAnswerSource).where(CachedAnswerSource.answer_key.in_(keys)))
+        session.execute(delete(CachedAnswer).where(CachedAnswer.key.in_(keys)))
+
+    def _evict(self, session, now: datetime):
+        expired = list(session.scalars(select(CachedAnswer.key).where(CachedAnswer.expires_at <= now)))
+        if expired:
+            self._delete(session, expired)
+        session.flush()
+        overflow = session.scalar(select(func.count()).select_from(CachedAnswer)) - self.max_entries
+        if overflow > 0:
+            oldest = list(session.scalars(
+                select(CachedAnswer.key).order_by(CachedAnswer.last_used_at).limit(overflow)
+            ))
+            self._delete(session, oldest)
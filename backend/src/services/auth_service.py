@@ -4,17 +4,22 @@ from .jwt_service import JWTService
 from .user_session_service import UserSessionService
 from google.oauth2 import id_token
 from google.auth.transport import requests
-from google_auth_oauthlib.flow import Flow
 import os
 
 class AuthService(BaseService):
     """Service for handling authentication logic."""
 
-    def __init__(self, db_session):
-        """Initialize the auth service with necessary dependencies."""
+    def __init__(self, db_session, jwt_service: JWTService = None):
+        """
+        Initialize the auth service with necessary dependencies.
+
+        Args:
+            db_session: Database session for user sessions
+            jwt_service: Token signer and verifier, the process-wide one by default
+        """
         super().__init__()
         self.user_session_service = UserSessionService(db_session)
-        self.jwt_service = JWTService()
+        self.jwt_service = jwt_service or JWTService.shared()
         self.db_session = db_session
 
     def authenticate_with_google(self, authorization_code: str, redirect_uri: str, client_id: str) -> tuple[str, bool, str]:
@@ -29,6 +34,9 @@ class AuthService(BaseService):
         Returns:
             Tuple of (user_id, success, error_message)
         """
+        # Only the login callback needs the OAuth flow
+        from google_auth_oauthlib.flow import Flow
+
         try:
             # Find path to client_secret.json
             base_path = os.path.dirname(
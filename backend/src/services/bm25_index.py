@@ -0,0 +1,343 @@
+import os
+import re
+import json
+import math
+import shutil
+import logging
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Runs of letters and digits, keeping part numbers and versions such as
+# "xj-900" or "v2.1" together
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercase tokens of a text. Compound tokens are followed by their parts,
+    so "XJ-900" matches both "xj-900" and "xj 900".
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """
+    Incrementally maintained inverted index with BM25 scoring.
+
+    The index is a persisted base segment plus an in-memory delta of
+    documents added since the last save. A segment is a directory of .npy
+    arrays in CSR layout (term offsets into flat doc and term-frequency
+    postings) that are memory-mapped on load, with the vocabulary and
+    document IDs as JSON. save() merges the delta into a new segment and
+    switches to it by rewriting the CURRENT pointer file, so readers of the
+    directory never see a half-written segment. save_later() folds the
+    changes of several single-document writes into one save.
+    """
+    def __init__(
+            self,
+            directory: str,
+            k1: float = 1.5,
+            b: float = 0.75,
+            save_delay: float = 5.0
+        ):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self.save_delay = save_delay
+        self.save_timer = None
+        self.lock = threading.RLock()
+        self.save_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._reset()
+        self._load()
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.doc_ids) - len(self.deleted)
+
+    def ids(self) -> set[str]:
+        """
+        IDs of the documents currently indexed.
+        """
+        with self.lock:
+            return {id for id, doc in self.doc_index.items() if doc not in self.deleted}
+
+    def add(
+            self,
+            ids: list[str],
+            texts: list[str]
+        ) -> int:
+        """
+        Index documents. IDs that are already indexed are skipped, removed
+        ones are indexed again.
+
+        Returns:
+            Number of documents added
+        """
+        added = 0
+        with self.lock:
+            for id, text in zip(ids, texts):
+                doc = self.doc_index.get(id)
+                if doc is not None and doc not in self.deleted:
+                    continue
+                tokens = tokenize(text)
+                doc = len(self.doc_ids)
+                self.doc_ids.append(id)
+                self.doc_index[id] = doc
+                self.delta_lengths.append(len(tokens))
+                self.total_length += len(tokens)
+                self.length_cache = None
+                for term, tf in Counter(tokens).items():
+                    self.delta_postings[term].append((doc, tf))
+                added += 1
+        return added
+
+    def remove(self, ids: list[str]):
+        """
+        Exclude documents from results. They are dropped for good on the next save.
+        """
+        with self.lock:
+            for id in ids:
+                doc = self.doc_index.get(id)
+                if doc is not None and doc not in self.deleted:
+                    self.deleted.add(doc)
+                    self.total_length -= int(self._length(doc))
+
+    def search(
+            self,
+            query: str,
+            limit: int = 5
+        ) -> list[tuple[str, float]]:
+        """
+        Rank documents against a query.
+
+        Returns:
+            Up to limit (id, score) pairs, best first
+        """
+        with self.lock:
+            if not self.doc_count:
+                return []
+
+            lengths = self._lengths()
+            average_length = max(self.total_length / self.doc_count, 1.0)
+            scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+
+            for term in set(tokenize(query)):
+                docs, tfs = self._postings(term)
+                if not len(docs):
+                    continue
+                idf = math.log(1 + (self.doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+                tfs = tfs.astype(np.float32)
+                norms = self.k1 * (1 - self.b + self.b * lengths[docs] / average_length)
+                np.add.at(scores, docs, idf * tfs * (self.k1 + 1) / (tfs + norms))
+
+            if self.deleted:
+                scores[list(self.deleted)] = 0
+            matched = np.flatnonzero(scores)
+            if not len(matched):
+                return []
+            best = matched[np.argsort(-scores[matched], kind="stable")][:limit]
+            return [(self.doc_ids[doc], float(scores[doc])) for doc in best]
+
+    def save_later(self):
+        """
+        Save within save_delay seconds, together with any other changes
+        made in the meantime.
+        """
+        with self.lock:
+            if self.save_timer is None:
+                self.save_timer = threading.Timer(self.save_delay, self._save_scheduled)
+                self.save_timer.daemon = True
+                self.save_timer.start()
+
+    def save(self):
+        """
+        Merge the delta and deletions into a new on-disk segment and map it.
+
+        The merge and the writes work on a snapshot taken under the lock, so
+        searches and writes go on while the segment is written; documents
+        added or removed in the meantime are carried over into the new delta.
+        """
+        # The base segment only changes here, so it can be read without the
+        # lock while save_lock is held
+        with self.save_lock:
+            with self.lock:
+                if not self.delta_lengths and not self.deleted and self.segment is not None:
+                    return
+                snapshot = {
+                    "count": len(self.doc_ids),
+                    "doc_ids": list(self.doc_ids),
+                    "deleted": set(self.deleted),
+                    "lengths": self._lengths(),
+                    "delta_postings": {term: list(entries) for term, entries in self.delta_postings.items()}
+                }
+
+            # Surviving documents, renumbered densely
+            keep = [doc for doc in range(snapshot["count"]) if doc not in snapshot["deleted"]]
+            remap = np.full(snapshot["count"], -1, dtype=np.int64)
+            remap[keep] = np.arange(len(keep))
+            lengths = snapshot["lengths"][keep].astype(np.uint32)
+
+            terms = sorted(set(self.vocabulary) | set(snapshot["delta_postings"]))
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            docs_parts, tfs_parts = [], []
+            for position, term in enumerate(terms):
+                docs, tfs = self._postings(term, snapshot["delta_postings"])
+                alive = remap[docs] >= 0
+                docs_parts.append(remap[docs][alive].astype(np.int32))
+                tfs_parts.append(np.minimum(tfs[alive], np.iinfo(np.uint16).max).astype(np.uint16))
+                offsets[position + 1] = offsets[position] + int(alive.sum())
+
+            vocabulary = {term: position for position, term in enumerate(terms) if offsets[position + 1] > offsets[position]}
+            doc_ids = [snapshot["doc_ids"][doc] for doc in keep]
+
+            # Written under a temporary name and renamed, so a crash never
+            # leaves a half-written segment behind
+            segment = f"segment-{self._next_segment_number()}"
+            path = os.path.join(self.directory, segment)
+            shutil.rmtree(path + ".tmp", ignore_errors=True)
+            os.makedirs(path + ".tmp")
+            np.save(os.path.join(path + ".tmp", "offsets.npy"), offsets)
+            np.save(os.path.join(path + ".tmp", "postings_docs.npy"), np.concatenate(docs_parts) if docs_parts else np.zeros(0, dtype=np.int32))
+            np.save(os.path.join(path + ".tmp", "postings_tfs.npy"), np.concatenate(tfs_parts) if tfs_parts else np.zeros(0, dtype=np.uint16))
+            np.save(os.path.join(path + ".tmp", "doc_lengths.npy"), lengths)
+            with open(os.path.join(path + ".tmp", "vocabulary.json"), "w") as vocabulary_file:
+                json.dump(vocabulary, vocabulary_file)
+            with open(os.path.join(path + ".tmp", "doc_ids.json"), "w") as doc_ids_file:
+                json.dump(doc_ids, doc_ids_file)
+            os.replace(path + ".tmp", path)
+
+            current = os.path.join(self.directory, "CURRENT")
+            with open(current + ".tmp", "w") as current_file:
+                current_file.write(segment)
+            os.replace(current + ".tmp", current)
+
+            with self.lock:
+                previous = self.segment
+                self._switch(snapshot, remap)
+            logger.info("Saved keyword index %s with %d documents and %d terms", segment, len(doc_ids), len(vocabulary))
+            if previous:
+                shutil.rmtree(os.path.join(self.directory, previous), ignore_errors=True)
+
+    def _save_scheduled(self):
+        with self.lock:
+            self.save_timer = None
+        try:
+            self.save()
+        except Exception:
+            # The delta stays in memory for the next save
+            logger.error("Failed to save keyword index", exc_info=True)
+
+    def _switch(self, snapshot: dict, remap: np.ndarray):
+        # Caller holds the lock. Maps the segment CURRENT points to and
+        # replays the changes made since the snapshot on top of it
+        count = snapshot["count"]
+        late_ids = self.doc_ids[count:]
+        late_lengths = self.delta_lengths[len(self.delta_lengths) - len(late_ids):]
+        late_postings = {
+            term: [(doc, tf) for doc, tf in entries if doc >= count]
+            for term, entries in self.delta_postings.items()
+        }
+        removed = self.deleted - snapshot["deleted"]
+
+        self._reset()
+        self._load()
+
+        base = len(self.doc_ids)
+        for id, length in zip(late_ids, late_lengths):
+            self.doc_index[id] = len(self.doc_ids)
+            self.doc_ids.append(id)
+            self.delta_lengths.append(length)
+            self.total_length += length
+        for term, entries in late_postings.items():
+            if entries:
+                self.delta_postings[term].extend((base + doc - count, tf) for doc, tf in entries)
+        for doc in removed:
+            doc = int(remap[doc]) if doc < count else base + doc - count
+            self.deleted.add(doc)
+            self.total_length -= int(self._length(doc))
+
+    def _reset(self):
+        # Base segment
+        self.segment = None
+        self.vocabulary = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings_docs = np.zeros(0, dtype=np.int32)
+        self.postings_tfs = np.zeros(0, dtype=np.uint16)
+        self.base_lengths = np.zeros(0, dtype=np.uint32)
+
+        # Documents of both the base segment and the delta
+        self.doc_ids = []
+        self.doc_index = {}
+        self.deleted = set()
+        self.total_length = 0
+        self.length_cache = None
+
+        # Delta since the last save
+        self.delta_postings = defaultdict(list)
+        self.delta_lengths = []
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.directory, "CURRENT")) as current_file:
+                segment = current_file.read().strip()
+        except FileNotFoundError:
+            return
+
+        path = os.path.join(self.directory, segment)
+        self.segment = segment
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.postings_docs = np.load(os.path.join(path, "postings_docs.npy"), mmap_mode="r")
+        self.postings_tfs = np.load(os.path.join(path, "postings_tfs.npy"), mmap_mode="r")
+        self.base_lengths = np.load(os.path.join(path, "doc_lengths.npy"), mmap_mode="r")
+        with open(os.path.join(path, "vocabulary.json")) as vocabulary_file:
+            self.vocabulary = json.load(vocabulary_file)
+        with open(os.path.join(path, "doc_ids.json")) as doc_ids_file:
+            self.doc_ids = json.load(doc_ids_file)
+        self.doc_index = {id: doc for doc, id in enumerate(self.doc_ids)}
+        self.total_length = int(self.base_lengths.sum(dtype=np.int64))
+
+    def _next_segment_number(self) -> int:
+        numbers = [
+            int(name.split("-", 1)[1])
+            for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.split("-", 1)[1].isdigit()
+        ]
+        return max(numbers, default=0) + 1
+
+    def _postings(self, term: str, delta_postings: dict = None) -> tuple[np.ndarray, np.ndarray]:
+        docs = np.zeros(0, dtype=np.int64)
+        tfs = np.zeros(0, dtype=np.int64)
+        position = self.vocabulary.get(term)
+        if position is not None:
+            start, end = self.offsets[position], self.offsets[position + 1]
+            docs = np.asarray(self.postings_docs[start:end], dtype=np.int64)
+            tfs = np.asarray(self.postings_tfs[start:end], dtype=np.int64)
+        delta = (self.delta_postings if delta_postings is None else delta_postings).get(term)
+        if delta:
+            delta = np.asarray(delta, dtype=np.int64)
+            docs = np.concatenate([docs, delta[:, 0]])
+            tfs = np.concatenate([tfs, delta[:, 1]])
+        return docs, tfs
+
+    def _lengths(self) -> np.ndarray:
+        if self.length_cache is None:
+            self.length_cache = np.concatenate([
+                np.asarray(self.base_lengths, dtype=np.float32),
+                np.asarray(self.delta_lengths, dtype=np.float32)
+            ])
+        return self.length_cache
+
+    def _length(self, doc: int) -> int:
+        base = len(self.base_lengths)
+        return self.base_lengths[doc] if doc < base else self.delta_lengths[doc - base]
@@ -0,0 +1,113 @@
+import logging
+from models.document import Document
+
+logger = logging.getLogger(__name__)
+
+
+class ContextAssembler:
+    """
+    Prepares retrieved chunks for the prompt by merging chunks that are
+    adjacent on the same page into one span, so the words they share through
+    the chunking overlap are sent once.
+    """
+    def __init__(
+            self,
+            overlap: int = 80
+        ):
+        # Overlap used by PDFParser.chunk_text; tried first when joining two chunks
+        self.overlap = overlap
+
+    def assemble(
+            self,
+            documents: list[Document]
+        ) -> list[Document]:
+        """
+        Merge runs of consecutive chunks from the same page.
+
+        Each merged span takes the place of its best-ranked chunk, so the
+        result stays in relevance order. Documents without page and chunk
+        numbers are passed through unchanged.
+        """
+        runs = {}
+        for rank, document in enumerate(documents):
+            key = self._page_key(document)
+            if key is None:
+                continue
+            runs.setdefault(key, []).append((document.metadata["chunk_no"], rank))
+
+        # Rank of the chunk that heads each merged span -> members in chunk order
+        spans = {}
+        merged_ranks = set()
+        for chunks in runs.values():
+            chunks.sort()
+            run = [chunks[0]]
+            for chunk in chunks[1:]:
+                if chunk[0] == run[-1][0] + 1:
+                    run.append(chunk)
+                    continue
+                self._add_span(run, spans, merged_ranks)
+                run = [chunk]
+            self._add_span(run, spans, merged_ranks)
+
+        assembled = []
+        for rank, document in enumerate(documents):
+            if rank in spans:
+                assembled.append(self._merge([documents[member] for member in spans[rank]], document))
+            elif rank not in merged_ranks:
+                assembled.append(document)
+
+        if len(assembled) < len(documents):
+            logger.debug("Merged %d retrieved chunks into %d spans", len(documents), len(assembled))
+        return assembled
+
+    def _page_key(self, document: Document) -> tuple:
+        metadata = document.metadata
+        if "name" not in metadata or "page_no" not in metadata or "chunk_no" not in metadata:
+            return None
+        return metadata["name"], metadata["page_no"]
+
+    def _add_span(
+            self,
+            run: list[tuple[int, int]],
+            spans: dict[int, list[int]],
+            merged_ranks: set[int]
+        ):
+        if len(run) < 2:
+            return
+        ranks = [rank for _, rank in run]
+        spans[min(ranks)] = ranks
+        merged_ranks.update(ranks)
+
+    def _merge(
+            self,
+            chunks: list[Document],
+            head: Document
+        ) -> Document:
+        # chunks are in page order, head is the best-ranked of them
+        words = chunks[0].text.split()
+        for chunk in chunks[1:]:
+            next_words = chunk.text.split()
+            words.extend(next_words[self._overlap(words, next_words):])
+
+        metadata = {
+            **chunks[0].metadata,
+            "chunk_no": chunks[0].metadata["chunk_no"],
+            "chunk_end": chunks[-1].metadata["chunk_no"],
+            "merged_ids": [chunk.id for chunk in chunks]
+        }
+        return Document(" ".join(words), metadata, head.id)
+
+    def _overlap(
+            self,
+            words: list[str],
+            next_words: list[str]
+        ) -> int:
+        # Words at the start of next_words that repeat the end of words
+        longest = min(len(words), len(next_words))
+        expected = min(self.overlap, longest)
+        if expected and words[-expected:] == next_words[:expected]:
+            return expected
+        for size in range(longest, 0, -1):
+            if words[-size:] == next_words[:size]:
+                return size
+        return 0
@@ -0,0 +1,223 @@
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from sqlalchemy import select, func, delete, update
+from config import Config
+from models.conversation import Conversation, ConversationMessage
+from .base_service import BaseService
+from .prompt_builder import SUMMARY_PREFIX, estimate_tokens
+from .tracing import in_current_context
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationService(BaseService):
+    """
+    Keeps conversation history in the application database, so clients only
+    send the new message.
+
+    Once the messages that are not yet summarised pass `compact_tokens`,
+    all but the last `keep_messages` of them are folded into the
+    conversation's running summary on a background thread. The history sent
+    to the model is the summary followed by the recent messages, so it stays
+    roughly the same size however long the conversation gets.
+
+    Conversations belong to the user who started them. For any other user
+    they do not exist: get returns None, get_history an empty history and
+    add_turn and delete do nothing.
+    """
+    def __init__(
+            self,
+            session_factory,
+            summarize: Callable[[str, list[dict[str, str]]], str] = None,
+            compact_tokens: int = None,
+            keep_messages: int = None
+        ):
+        """
+        Args:
+            session_factory: SQLAlchemy sessionmaker for the application database
+            summarize: Called with the current summary and the messages to
+                fold into it, returns the new summary. Without it,
+                conversations are never compacted
+            compact_tokens: Estimated tokens of unsummarised messages that
+                trigger compaction
+            keep_messages: Most recent messages that are never compacted
+        """
+        super().__init__()
+        self.session_factory = session_factory
+        self.summarize = summarize
+        self.compact_tokens = compact_tokens or Config.CONVERSATION_COMPACT_TOKENS
+        self.keep_messages = Config.CONVERSATION_KEEP_MESSAGES if keep_messages is None else keep_messages
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compact")
+        self.compacting = set()
+        self.compacting_lock = threading.Lock()
+
+    def create(self, user_id: str) -> Conversation:
+        """
+        Start a new, empty conversation.
+
+        Args:
+            user_id: The user the conversation belongs to
+        """
+        with self.session_factory(expire_on_commit=False) as session:
+            conversation = Conversation(id=str(uuid.uuid4()), user_id=user_id, summary="", compacted=0)
+            session.add(conversation)
+            session.commit()
+        return conversation
+
+    def get(self, conversation_id: str, user_id: str) -> Conversation:
+        """
+        A conversation of the user, None if it does not exist or belongs to someone else.
+        """
+        with self.session_factory(expire_on_commit=False) as session:
+            return self._owned(session, conversation_id, user_id)
+
+    def get_history(self, conversation_id: str, user_id: str) -> list[dict[str, str]]:
+        """
+        History to send with the next query: the running summary, if any,
+        followed by the messages that have not been summarised.
+
+        Returns:
+            Messages as {"role", "text"} dicts, oldest first
+        """
+        with self.session_factory() as session:
+            conversation = self._owned(session, conversation_id, user_id)
+            if conversation is None:
+                return []
+            messages = session.execute(
+                select(ConversationMessage.role, ConversationMessage.text)
+                .where(
+                    ConversationMessage.conversation_id == conversation_id,
+                    ConversationMessage.position >= conversation.compacted
+                )
+                .order_by(ConversationMessage.position)
+            ).all()
+            summary = conversation.summary
+
+        history = [{"role": role, "text": text} for role, text in messages]
+        if summary:
+            history.insert(0, {"role": "user", "text": SUMMARY_PREFIX + summary})
+        return history
+
+    def add_turn(
+            self,
+            conversation_id: str,
+            user_id: str,
+            query: str,
+            answer: str
+        ) -> bool:
+        """
+        Record a question and its answer, and compact the conversation in
+        the background if it has grown past the threshold.
+
+        Returns:
+            Whether the turn was recorded, False if the conversation does not
+            exist or belongs to someone else
+        """
+        with self.session_factory() as session:
+            # Writing the conversation row first locks it until commit, so
+            # turns of one conversation are recorded one after the other
+            owned = session.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id, Conversation.user_id == user_id)
+                .values(updated_at=func.now())
+            ).rowcount
+            if not owned:
+                return False
+            position = session.scalar(
+                select(func.coalesce(func.max(ConversationMessage.position) + 1, 0))
+                .where(ConversationMessage.conversation_id == conversation_id)
+            )
+            session.add_all([
+                ConversationMessage(conversation_id=conversation_id, position=position, role="user", text=query),
+                ConversationMessage(conversation_id=conversation_id, position=position + 1, role="model", text=answer)
+            ])
+            session.commit()
+
+        if self.summarize:
+            self.executor.submit(in_current_context(self.compact), conversation_id)
+        return True
+
+    def compact(self, conversation_id: str) -> bool:
+        """
+        Fold older messages into the running summary if the unsummarised
+        messages are over the threshold.
+
+        Returns:
+            Whether the conversation was compacted
+        """
+        with self.compacting_lock:
+            if conversation_id in self.compacting:
+                return False
+            self.compacting.add(conversation_id)
+        try:
+            return self._compact(conversation_id)
+        except Exception:
+            # The conversation still works uncompacted, the prompt builder caps it
+            logger.warning("Could not compact conversation %s", conversation_id, exc_info=True)
+            return False
+        finally:
+            with self.compacting_lock:
+                self.compacting.discard(conversation_id)
+
+    def delete(self, conversation_id: str, user_id: str) -> bool:
+        """
+        Delete a conversation of the user and its messages.
+
+        Returns:
+            Whether it was deleted, False if it does not exist or belongs to someone else
+        """
+        with self.session_factory() as session:
+            if self._owned(session, conversation_id, user_id) is None:
+                return False
+            session.execute(delete(ConversationMessage).where(ConversationMessage.conversation_id == conversation_id))
+            session.execute(delete(Conversation).where(Conversation.id == conversation_id))
+            session.commit()
+        return True
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+    @staticmethod
+    def _owned(session, conversation_id: str, user_id: str) -> Conversation:
+        conversation = session.get(Conversation, conversation_id)
+        if conversation is None or conversation.user_id != user_id:
+            return None
+        return conversation
+
+    def _compact(self, conversation_id: str) -> bool:
+        with self.session_factory() as session:
+            conversation = session.get(Conversation, conversation_id)
+            if conversation is None:
+                return False
+            compacted = conversation.compacted
+            summary = conversation.summary
+            messages = session.execute(
+                select(ConversationMessage.position, ConversationMessage.role, ConversationMessage.text)
+                .where(
+                    ConversationMessage.conversation_id == conversation_id,
+                    ConversationMessage.position >= compacted
+                )
+                .order_by(ConversationMessage.position)
+            ).all()
+
+        if sum(estimate_tokens(text) for _, _, text in messages) <= self.compact_tokens:
+            return False
+        fold = messages[:len(messages) - self.keep_messages] if self.keep_messages else messages
+        if not fold:
+            return False
+
+        # The model call happens outside any transaction
+        new_summary = self.summarize(summary, [{"role": role, "text": text} for _, role, text in fold])
+
+        with self.session_factory() as session:
+            conversation = session.get(Conversation, conversation_id)
+            if conversation is None or conversation.compacted != compacted:
+                return False
+            conversation.summary = new_summary
+            conversation.compacted = fold[-1][0] + 1
+            session.commit()
+        logger.info("Compacted %d messages of conversation %s", len(fold), conversation_id)
+        return True
@@ -1,30 +1,66 @@
 import os
-import chromadb
-import chromadb.errors
+import time
+import hashlib
+import logging
+import unicodedata
 from config import Config
 from models import Document
 from .base_service import BaseService
 from .pdf_parser import PDFParser
+from .embedding_cache import create_embedding_function
+from .vector_store import VectorStore
+from .bm25_index import BM25Index
+from .answer_cache import AnswerCache
+from .metrics import UPLOAD_STAGE_SECONDS
+from .tracing import TRACER
+from opentelemetry import trace
 from werkzeug.datastructures import FileStorage
 import uuid
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    from chromadb.api.models.Collection import Collection
+    from chromadb.api.types import Documents, EmbeddingFunction
+
+logger = logging.getLogger(__name__)
 
 class DocumentService(BaseService):
     """
     Service for handling document operations using ChromaDB.
     """
-    def __init__(self):
+    def __init__(
+            self,
+            batch_size: int = None,
+            deduplicate: bool = None,
+            embedding_function: "EmbeddingFunction[Documents]" = None,
+            keyword_index: BM25Index = None,
+            vector_store: VectorStore = None,
+            answer_cache: AnswerCache = None
+        ):
         """
         Initialize the document service with ChromaDB connection.
+
+        Writes go through the shared vector store, which bumps the collection
+        generation so cached search results are invalidated. The keyword
+        index, when given, is kept in step with the collection, and cached
+        answers built from deleted or re-ingested sources are dropped.
         """
         super().__init__()
-        self.client = chromadb.PersistentClient(path=Config.CHROMA_PERSIST_DIRECTORY)
+        self.vector_store = vector_store or VectorStore.get()
         self.parser = PDFParser()
-        # Create collection if it doesn't exist
-        try:
-            self.collection = self.client.get_or_create_collection("documents")
-        except chromadb.errors.NotFoundError:
-            self.collection = self.client.create_collection("documents")
+        self.batch_size = batch_size or Config.INGEST_BATCH_SIZE
+        self.deduplicate = Config.INGEST_DEDUPLICATE if deduplicate is None else deduplicate
+        # Same model the collection uses by default, called explicitly so a
+        # whole batch is embedded in one pass and vectors can be cached
+        self.embedding_function = embedding_function or create_embedding_function()
+        self.keyword_index = keyword_index
+        self.answer_cache = answer_cache
     
+    @property
+    def collection(self) -> "Collection":
+        # Opened on first use, so constructing the service does not import chromadb
+        return self.vector_store.collection("documents")
+
     def add_document(
             self, 
             document: Document
@@ -32,13 +68,95 @@ class DocumentService(BaseService):
         """
         Add a document to the ChromaDB collection.
         """
-        self.collection.add(
-            ids=[document.id],
-            documents=[document.text],
-            metadatas=[document.metadata]
-        )
+        embeddings = self.embedding_function([document.text])
+        with self.vector_store.writing("documents"):
+            self.collection.add(
+                ids=[document.id],
+                documents=[document.text],
+                metadatas=[document.metadata],
+                embeddings=embeddings
+            )
+            if self.keyword_index:
+                self.keyword_index.add([document.id], [document.text])
+        if self.keyword_index:
+            self.keyword_index.save_later()
+        if self.answer_cache and document.metadata.get("name"):
+            self.answer_cache.invalidate_sources([document.metadata["name"]])
         return document
+
+    def add_documents(
+            self,
+            documents: list[Document],
+            skip_existing: bool = False
+        ) -> dict[str, float]:
+        """
+        Embed and add a batch of documents with a single collection.add call.
+
+        Args:
+            documents: The documents to store
+            skip_existing: Leave out documents whose ID is repeated in the
+                batch or already stored, without embedding them. A stored
+                document is kept as it is; of IDs repeated in the batch the
+                last document is stored
+
+        Returns:
+            Timing for the batch with its size, the number of skipped
+            documents and the embed and write seconds
+        """
+        start = time.perf_counter()
+        size = len(documents)
+        if skip_existing:
+            # Only saves embedding work; the check that decides is repeated
+            # under the write lock below
+            documents = list({document.id: document for document in documents}.values())
+            with self.vector_store.reading():
+                documents = self._unstored(documents)
+
+        if not documents:
+            return {
+                "size": 0,
+                "skipped": size,
+                "embed_seconds": 0.0,
+                "write_seconds": time.perf_counter() - start
+            }
+
+        texts = [document.text for document in documents]
+        with TRACER.start_as_current_span("embed", attributes={"documents": len(texts)}):
+            embeddings = self.embedding_function(texts)
+        embedded = time.perf_counter()
+
+        with TRACER.start_as_current_span("write", attributes={"documents": len(texts)}):
+            with self.vector_store.writing("documents"):
+                if skip_existing:
+                    # Stored by a concurrent upload since the check above
+                    unstored = {document.id for document in self._unstored(documents)}
+                    keep = [position for position, document in enumerate(documents) if document.id in unstored]
+                    documents = [documents[position] for position in keep]
+                    texts = [texts[position] for position in keep]
+                    embeddings = [embeddings[position] for position in keep]
+                if documents:
+                    self.collection.add(
+                        ids=[document.id for document in documents],
+                        documents=texts,
+                        metadatas=[document.metadata for document in documents],
+                        embeddings=embeddings
+                    )
+                    if self.keyword_index:
+                        self.keyword_index.add([document.id for document in documents], texts)
+        written = time.perf_counter()
+
+        return {
+            "size": len(documents),
+            "skipped": size - len(documents),
+            "embed_seconds": embedded - start,
+            "write_seconds": written - embedded
+        }
     
+    def _unstored(self, documents: list[Document]) -> list[Document]:
+        # Caller holds the store for a read or a write
+        stored = set(self.collection.get(ids=[document.id for document in documents], include=[])["ids"])
+        return [document for document in documents if document.id not in stored]
+
     def get_document(
             self, 
             doc_id: str
@@ -46,7 +164,8 @@ class DocumentService(BaseService):
         """
         Get a document from ChromaDB by ID.
         """
-        result = self.collection.get(ids=[doc_id])
+        with self.vector_store.reading():
+            result = self.collection.get(ids=[doc_id])
         if not result["ids"]:
             return None
             
@@ -65,10 +184,12 @@ class DocumentService(BaseService):
         """
         Search for documents based on a query string.
         """
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=limit
-        )
+        embeddings = self.embedding_function([query])
+        with self.vector_store.reading():
+            results = self.collection.query(
+                query_embeddings=embeddings,
+                n_results=limit
+            )
         
         documents = []
         if results["ids"]:
@@ -90,7 +211,8 @@ class DocumentService(BaseService):
         """
         List all documents in the collection.
         """
-        results = self.collection.get(limit=limit)
+        with self.vector_store.reading():
+            results = self.collection.get(limit=limit)
         
         documents = []
         if results["ids"]:
@@ -104,6 +226,17 @@ class DocumentService(BaseService):
                 
         return documents
         
+    def has_file(
+            self,
+            file_hash: str
+        ) -> bool:
+        """
+        Whether any chunk of the file with this hash is still stored.
+        """
+        with self.vector_store.reading():
+            result = self.collection.get(where={"file_hash": file_hash}, limit=1, include=[])
+        return bool(result["ids"])
+
     def delete_document(
             self, 
             doc_id: str
@@ -112,22 +245,198 @@ class DocumentService(BaseService):
         Delete a document from ChromaDB by ID.
         """
         try:
-            self.collection.delete(ids=[doc_id])
+            with self.vector_store.writing("documents"):
+                self.collection.delete(ids=[doc_id])
+                if self.keyword_index:
+                    self.keyword_index.remove([doc_id])
+            if self.keyword_index:
+                self.keyword_index.save_later()
+            if self.answer_cache:
+                self.answer_cache.invalidate_documents([doc_id])
             return True
         except Exception:
             return False
         
     def upload_document(
         self,
-        file: FileStorage
+        file: FileStorage,
+        progress: Callable[[dict], None] = None
+    ) -> dict:
+        """
+        Parse a PDF, chunk it and store the chunks in batches.
+
+        Pages and chunks are consumed lazily, so at most one batch of chunks
+        is held in memory regardless of the size of the PDF. A batch that
+        fails to embed or write is logged and counted, and ingestion carries
+        on with the next one.
+
+        With deduplication on, chunk IDs are derived from the chunk content
+        and its source, so chunks that are already stored are skipped
+        instead of being embedded again.
+
+        Args:
+            file: The uploaded PDF
+            progress: Called with the running report after every batch
+
+        Returns:
+            Ingestion report with page, chunk, skipped and failure counts
+            and per-batch timings
+        """
+        with TRACER.start_as_current_span("upload_document", attributes={"upload.name": file.filename}) as span:
+            report = self._upload_document(file, progress)
+            span.set_attributes({
+                "upload.pages": report["pages"],
+                "upload.chunks": report["chunks"],
+                "upload.skipped": report["skipped"],
+                "upload.failures": report["failures"]
+            })
+            return report
+
+    def _upload_document(
+        self,
+        file: FileStorage,
+        progress: Callable[[dict], None] = None
+    ) -> dict:
+        report = {
+            "name": file.filename,
+            "pages": 0,
+            "chunks": 0,
+            "skipped": 0,
+            "failures": 0,
+            "batches": []
+        }
+        start = time.perf_counter()
+        file_hash = self.file_hash(file) if self.deduplicate else None
+        batch = []
+        # Seconds spent in batches, the rest of the loop is parsing and chunking
+        ingesting = 0.0
+        for metadata, text in self.parser.iter_pages(file):
+            for chunk_no, chunk in enumerate(self.parser.iter_chunks(text)):
+                chunk_metadata = {
+                    **metadata,
+                    "page_no": metadata["page_no"] + 1,
+                    "chunk_no": chunk_no + 1
+                }
+                if file_hash:
+                    chunk_metadata["file_hash"] = file_hash
+                    id = self.content_id(chunk, file.filename)
+                else:
+                    id = str(uuid.uuid4())
+                batch.append(Document(chunk, chunk_metadata, id))
+                if len(batch) >= self.batch_size:
+                    batch_start = time.perf_counter()
+                    self._write_batch(report, batch, progress)
+                    ingesting += time.perf_counter() - batch_start
+                    batch = []
+            report["pages"] += 1
+        parse_seconds = time.perf_counter() - start - ingesting
+        UPLOAD_STAGE_SECONDS.observe(parse_seconds, stage="parse")
+        # Parsing is interleaved with the batches, so it is recorded as a total
+        trace.get_current_span().set_attribute("upload.parse_seconds", parse_seconds)
+
+        if batch:
+            self._write_batch(report, batch, progress)
+        elif progress:
+            progress(report)
+
+        if self.keyword_index:
+            # Outside the store's write lock, so vector searches keep
+            # running while the segment is written
+            self.keyword_index.save()
+        # Batches bump the generation as they land; bump it once more so
+        # that results cached while the upload was in flight are dropped too
+        self.vector_store.generation("documents").bump()
+        if self.answer_cache and report["chunks"]:
+            # New content under this name changes what answers citing it would say
+            self.answer_cache.invalidate_sources([file.filename])
+        return report
+
+    def sync_keyword_index(
+        self,
+        page_size: int = 1000
+    ) -> dict[str, int]:
+        """
+        Bring the keyword index in line with the collection: index the
+        documents it is missing, such as those added before the index
+        existed or lost with an unsaved delta, and drop the ones the
+        collection no longer has.
+
+        Returns:
+            Number of documents added to and removed from the index
+        """
+        stored = set()
+        offset = 0
+        while True:
+            with self.vector_store.reading():
+                page = self.collection.get(limit=page_size, offset=offset, include=[])["ids"]
+            if not page:
+                break
+            stored.update(page)
+            offset += len(page)
+
+        indexed = self.keyword_index.ids()
+        missing = list(stored - indexed)
+        extra = list(indexed - stored)
+        added = 0
+        for start in range(0, len(missing), page_size):
+            with self.vector_store.reading():
+                results = self.collection.get(ids=missing[start:start + page_size], include=["documents"])
+            added += self.keyword_index.add(results["ids"], results["documents"])
+        self.keyword_index.remove(extra)
+        if added or extra:
+            self.keyword_index.save()
+        return {"added": added, "removed": len(extra)}
+
+    def _write_batch(
+        self,
+        report: dict,
+        batch: list[Document],
+        progress: Callable[[dict], None] = None
     ):
-        extracted_text = self.parser.parse(file)
-        for metadata, extracted_chunks in extracted_text:
-            for chunk_no, chunk in enumerate(extracted_chunks):
-                metadata["page_no"] += 1
-                metadata["chunk_no"] = chunk_no + 1
-                id = str(uuid.uuid4())
-                document = Document(chunk, metadata, id)
-                self.add_document(document)
-        
-        
\ No newline at end of file
+        batch_no = len(report["batches"]) + 1
+        try:
+            with TRACER.start_as_current_span("ingest_batch", attributes={"batch.number": batch_no, "batch.size": len(batch)}):
+                timing = self.add_documents(batch, skip_existing=self.deduplicate)
+        except Exception:
+            logger.error("Failed to ingest batch %d of %s", batch_no, report["name"], exc_info=True)
+            report["failures"] += len(batch)
+            timing = {"size": len(batch), "failed": True}
+        else:
+            report["chunks"] += timing["size"]
+            report["skipped"] += timing["skipped"]
+            UPLOAD_STAGE_SECONDS.observe(timing["embed_seconds"], stage="embed")
+            UPLOAD_STAGE_SECONDS.observe(timing["write_seconds"], stage="write")
+            logger.info(
+                "Ingested batch %d of %s: %d chunks, %d skipped, embed %.3fs, write %.3fs",
+                batch_no, report["name"], timing["size"], timing["skipped"],
+                timing["embed_seconds"], timing["write_seconds"]
+            )
+        report["batches"].append(timing)
+        if progress:
+            progress(report)
+
+    @staticmethod
+    def content_id(
+        text: str,
+        source: str
+    ) -> str:
+        """
+        Derive a stable chunk ID from its normalized text and source.
+
+        Unicode compatibility forms and whitespace differences do not change
+        the ID, so re-extracting the same PDF produces the same IDs.
+        """
+        normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+        return hashlib.sha256(f"{source}\0{normalized}".encode()).hexdigest()
+
+    @staticmethod
+    def file_hash(file: FileStorage) -> str:
+        """
+        SHA-256 of the uploaded file's bytes. The stream is rewound afterwards.
+        """
+        digest = hashlib.sha256()
+        file.stream.seek(0)
+        for block in iter(lambda: file.stream.read(1 << 20), b""):
+            digest.update(block)
+        file.stream.seek(0)
+        return digest.hexdigest()
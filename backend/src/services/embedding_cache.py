@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+import numpy as np
+from config import Config
+
+if TYPE_CHECKING:
+    from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, where the app runs in a single process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = hashlib.sha256().digest_size
+# Rows the in-memory fallback starts with; it doubles up to the capacity
+MEMORY_ROWS = 1024
+
+
+class EmbeddingCache:
+    """
+    Fixed-size on-disk store of embedding vectors keyed by text hash.
+
+    Vectors, keys and last-use ticks live in memory-mapped NumPy files
+    under one directory, so the cache survives restarts and only the pages
+    that are touched are read from disk. When the store is full the least
+    recently used vector is overwritten. Dirty pages are forced to disk at
+    most once every `flush_interval` seconds and on close() or exit; in
+    between the operating system writes them back on its own.
+
+    The first process to open a directory takes an exclusive lock on it
+    until close() or exit. Other processes, such as further server workers,
+    keep their cache in memory instead of sharing files they would corrupt,
+    in arrays that grow with the number of entries.
+    """
+    def __init__(
+            self,
+            directory: str,
+            capacity: int,
+            flush_interval: float = None
+        ):
+        """
+        Args:
+            directory: Directory of the cache files
+            capacity: Vectors kept before the least recently used is overwritten
+            flush_interval: Seconds between forced writes to disk
+        """
+        self.directory = directory
+        self.capacity = capacity
+        self.flush_interval = Config.EMBEDDING_CACHE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.flushed_at = time.monotonic()
+        self.dim = None
+        self.vectors = None
+        self.keys = None
+        self.ticks = None
+        self.tick = 0
+        self.slots = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.lock_file = None
+        self.persistent = self._lock_directory()
+        if self.persistent:
+            self._load()
+            atexit.register(self.close)
+        else:
+            logger.warning("Embedding cache %s is in use by another process, caching in memory", directory)
+
+    def get_many(self, keys: list[bytes]) -> list:
+        """
+        Look up vectors by key, marking the ones found as recently used.
+
+        Returns:
+            One vector or None per key
+        """
+        with self.lock:
+            found = []
+            for key in keys:
+                slot = self.slots.get(key)
+                if slot is None:
+                    self.misses += 1
+                    found.append(None)
+                    continue
+                self.hits += 1
+                self._touch(key, slot)
+                found.append(np.array(self.vectors[slot]))
+            return found
+
+    def put_many(
+            self,
+            keys: list[bytes],
+            vectors: list
+        ):
+        """
+        Store vectors under their keys, evicting the least recently used
+        entries when the store is full.
+        """
+        if not keys:
+            return
+        dim = len(vectors[0])
+        with self.lock:
+            if self.vectors is None:
+                self._create(dim)
+            elif dim != self.dim:
+                # The wrapped model changed; vectors of the old size are useless
+                logger.warning("Embedding size changed from %d to %d, clearing cache", self.dim, dim)
+                self._create(dim)
+            for key, vector in zip(keys, vectors):
+                slot = self.slots.get(key)
+                if slot is None:
+                    slot = self._free_slot()
+                    self._grow(slot + 1)
+                    self.keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                self.vectors[slot] = vector
+                self._touch(key, slot)
+            if time.monotonic() - self.flushed_at >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        """
+        Write dirty pages of the memory-mapped files to disk.
+        """
+        for array in (self.vectors, self.keys, self.ticks):
+            if isinstance(array, np.memmap):
+                array.flush()
+        self.flushed_at = time.monotonic()
+
+    def close(self):
+        """
+        Flush the store and release the directory for other processes.
+        """
+        with self.lock:
+            self.flush()
+            if self.lock_file:
+                self.lock_file.close()
+                self.lock_file = None
+
+    def stats(self) -> dict[str, int]:
+        """
+        Current size, capacity and hit/miss counters of the cache.
+        """
+        return {
+            "entries": len(self.slots),
+            "capacity": self.capacity,
+            "persistent": self.persistent,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def _touch(self, key: bytes, slot: int):
+        self.tick += 1
+        self.ticks[slot] = self.tick
+        self.slots[key] = slot
+        self.slots.move_to_end(key)
+
+    def _free_slot(self) -> int:
+        if len(self.slots) < self.capacity:
+            return len(self.slots)
+        _, slot = self.slots.popitem(last=False)
+        return slot
+
+    def _grow(self, rows: int):
+        # The in-memory arrays start small; memory maps have every row already
+        if rows <= len(self.vectors):
+            return
+        size = min(self.capacity, max(rows, 2 * len(self.vectors)))
+        for name in ("vectors", "keys", "ticks"):
+            array = getattr(self, name)
+            grown = np.zeros((size,) + array.shape[1:], dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _lock_directory(self) -> bool:
+        # Whether this process has the directory to itself
+        if fcntl is None:
+            return True
+        self.lock_file = open(self._path("lock"), "w")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.lock_file.close()
+            self.lock_file = None
+            return False
+        return True
+
+    def _open(
+            self,
+            name: str,
+            dtype,
+            shape: tuple,
+            mode: str
+        ) -> np.ndarray:
+        if not self.persistent:
+            return np.zeros((min(shape[0], MEMORY_ROWS),) + shape[1:], dtype=dtype)
+        return np.memmap(self._path(name), dtype=dtype, mode=mode, shape=shape)
+
+    def _create(self, dim: int):
+        self.dim = dim
+        self.slots.clear()
+        self.tick = 0
+        self.vectors = self._open("vectors.f32", np.float32, (self.capacity, dim), "w+")
+        self.keys = self._open("keys.u8", np.uint8, (self.capacity, KEY_SIZE), "w+")
+        self.ticks = self._open("ticks.i64", np.int64, (self.capacity,), "w+")
+        if self.persistent:
+            with open(self._path("meta.json"), "w") as meta_file:
+                json.dump({"dim": dim, "capacity": self.capacity}, meta_file)
+
+    def _load(self):
+        try:
+            with open(self._path("meta.json")) as meta_file:
+                meta = json.load(meta_file)
+            dim, capacity = meta["dim"], meta["capacity"]
+            vectors = self._open("vectors.f32", np.float32, (capacity, dim), "r")
+            keys = self._open("keys.u8", np.uint8, (capacity, KEY_SIZE), "r")
+            ticks = self._open("ticks.i64", np.int64, (capacity,), "r")
+        except (OSError, ValueError, KeyError):
+            # Nothing stored yet, or a store we cannot read; the arrays are
+            # created on the first put once the embedding size is known
+            return
+
+        # Rebuild the LRU order from the persisted ticks, most recent last,
+        # keeping only what fits in the configured capacity
+        occupied = np.flatnonzero(ticks)
+        order = occupied[np.argsort(ticks[occupied])][-self.capacity:]
+
+        if capacity == self.capacity:
+            self.dim = dim
+            self.vectors = self._open("vectors.f32", np.float32, (capacity, dim), "r+")
+            self.keys = self._open("keys.u8", np.uint8, (capacity, KEY_SIZE), "r+")
+            self.ticks = self._open("ticks.i64", np.int64, (capacity,), "r+")
+            for slot in order:
+                self.slots[self.keys[slot].tobytes()] = int(slot)
+            self.tick = int(ticks.max()) if len(occupied) else 0
+            return
+
+        # The size cap changed; copy the most recently used entries into a
+        # store of the new size
+        kept_vectors = np.array(vectors[order])
+        kept_keys = np.array(keys[order])
+        del vectors, keys, ticks
+        self._create(dim)
+        for slot, (key, vector) in enumerate(zip(kept_keys, kept_vectors)):
+            self.vectors[slot] = vector
+            self.keys[slot] = key
+            self.ticks[slot] = slot + 1
+            self.slots[key.tobytes()] = slot
+        self.tick = len(order)
+        self.flush()
+
+
+class DefaultEmbeddingFunction:
+    """
+    Chroma's default ONNX model, created on first call so chromadb is not
+    imported while the app starts.
+    """
+    def __init__(self):
+        self.embedding_function = None
+        self.lock = threading.Lock()
+
+    def load(self) -> "EmbeddingFunction[Documents]":
+        with self.lock:
+            if self.embedding_function is None:
+                from chromadb.utils import embedding_functions
+
+                self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
+            return self.embedding_function
+
+    def __call__(self, input: "Documents") -> "Embeddings":
+        return self.load()(input)
+
+
+class CachedEmbeddingFunction:
+    """
+    Embedding function that serves vectors for previously seen texts from
+    an EmbeddingCache and only sends the rest to the wrapped function.
+    """
+    def __init__(
+            self,
+            embedding_function: "EmbeddingFunction[Documents]",
+            cache: EmbeddingCache
+        ):
+        self.embedding_function = embedding_function
+        self.cache = cache
+
+    def __call__(self, input: "Documents") -> "Embeddings":
+        keys = [hashlib.sha256(text.encode()).digest() for text in input]
+        embeddings = self.cache.get_many(keys)
+
+        missing = [index for index, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            computed = self.embedding_function([input[index] for index in missing])
+            for index, embedding in zip(missing, computed):
+                embeddings[index] = np.asarray(embedding, dtype=np.float32)
+            self.cache.put_many([keys[index] for index in missing], computed)
+
+        return embeddings
+
+
+def create_embedding_function() -> "EmbeddingFunction[Documents]":
+    """
+    Build the embedding function shared by the document and search services:
+    Chroma's default ONNX model, wrapped in the persistent cache when enabled.
+    """
+    embedding_function = DefaultEmbeddingFunction()
+    if not Config.EMBEDDING_CACHE_ENABLED:
+        return embedding_function
+
+    cache = EmbeddingCache(Config.EMBEDDING_CACHE_DIRECTORY, Config.EMBEDDING_CACHE_SIZE)
+    return CachedEmbeddingFunction(embedding_function, cache)
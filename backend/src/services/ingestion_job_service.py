@@ -0,0 +1,233 @@
+import os
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select, update
+from werkzeug.datastructures import FileStorage
+from config import Config
+from models.ingestion_job import IngestionJob
+from .base_service import BaseService
+from .document_service import DocumentService
+from .tracing import in_current_context
+
+logger = logging.getLogger(__name__)
+
+class IngestionJobService(BaseService):
+    """Service that queues uploaded PDFs and ingests them on background workers."""
+
+    def __init__(
+            self,
+            session_factory,
+            document_service: DocumentService,
+            max_workers: int = None,
+            upload_directory: str = None
+        ):
+        """
+        Initialize the job service.
+
+        Args:
+            session_factory: SQLAlchemy sessionmaker for the application database
+            document_service: Service used to parse, embed and store the PDFs
+            max_workers: Number of jobs processed at the same time
+            upload_directory: Where uploaded files wait until they are ingested
+        """
+        super().__init__()
+        self.session_factory = session_factory
+        self.document_service = document_service
+        self.upload_directory = upload_directory or Config.UPLOAD_DIRECTORY
+        os.makedirs(self.upload_directory, exist_ok=True)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or Config.INGEST_WORKERS,
+            thread_name_prefix="ingest"
+        )
+        # Held from the duplicate check until the job is stored, so two
+        # uploads of the same file cannot both be queued
+        self.enqueue_lock = threading.Lock()
+
+    def enqueue(self, file: FileStorage) -> tuple[IngestionJob, bool]:
+        """
+        Store an uploaded file and queue it for ingestion.
+
+        With deduplication on, a file whose contents were already ingested,
+        or are being ingested, is not queued again.
+
+        Args:
+            file: The uploaded PDF
+
+        Returns:
+            Tuple of (job, queued) where job is the existing job when the
+            file is a duplicate and queued is False
+        """
+        file_hash = None
+        if self.document_service.deduplicate:
+            file_hash = self.document_service.file_hash(file)
+
+        with self.enqueue_lock:
+            if file_hash is not None:
+                existing = self.find_job_by_file_hash(file_hash)
+                if existing:
+                    return existing, False
+
+            job_id = str(uuid.uuid4())
+            file_path = os.path.join(self.upload_directory, f"{job_id}.pdf")
+            file.save(file_path)
+
+            with self.session_factory(expire_on_commit=False) as session:
+                job = IngestionJob(
+                    id=job_id,
+                    name=file.filename,
+                    file_path=file_path,
+                    file_hash=file_hash,
+                    status="queued"
+                )
+                session.add(job)
+                session.commit()
+
+        # The job's spans join the trace of the upload request
+        self.executor.submit(in_current_context(self._run), job_id)
+        return job, True
+
+    def find_job_by_file_hash(self, file_hash: str) -> IngestionJob:
+        """
+        Find a queued or running job for a file with the given hash, or a
+        completed one whose chunks are still stored.
+
+        Args:
+            file_hash: SHA-256 of the file contents
+
+        Returns:
+            The IngestionJob if found, None otherwise
+        """
+        stmt = select(IngestionJob).where(
+            IngestionJob.file_hash == file_hash,
+            IngestionJob.status.in_(("queued", "running", "completed"))
+        ).order_by(IngestionJob.created_at)
+
+        with self.session_factory(expire_on_commit=False) as session:
+            jobs = session.execute(stmt).scalars().all()
+
+        stored = None
+        for job in jobs:
+            if job.status == "completed":
+                if stored is None:
+                    stored = self.document_service.has_file(file_hash)
+                if not stored:
+                    # The file's chunks have been deleted since
+                    continue
+            return job
+        return None
+
+    def get_job(self, job_id: str) -> IngestionJob:
+        """
+        Find a job by ID.
+
+        Args:
+            job_id: The job ID to look up
+
+        Returns:
+            The IngestionJob if found, None otherwise
+        """
+        with self.session_factory(expire_on_commit=False) as session:
+            return session.get(IngestionJob, job_id)
+
+    def resume_pending(self) -> int:
+        """
+        Queue again every job that was waiting or running when the process stopped.
+
+        Returns:
+            Number of jobs resumed
+        """
+        with self.session_factory() as session:
+            session.execute(
+                update(IngestionJob)
+                .where(IngestionJob.status == "running")
+                .values(status="queued")
+            )
+            session.commit()
+            job_ids = session.execute(
+                select(IngestionJob.id)
+                .where(IngestionJob.status == "queued")
+                .order_by(IngestionJob.created_at)
+            ).scalars().all()
+
+        for job_id in job_ids:
+            self.executor.submit(self._run, job_id)
+        if job_ids:
+            logger.info("Resumed %d pending ingestion jobs", len(job_ids))
+        return len(job_ids)
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop accepting jobs. Jobs that have not started stay queued in the
+        database and are picked up by resume_pending on the next start.
+        """
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _claim(self, job_id: str) -> bool:
+        # Only one worker may move a job out of "queued"
+        with self.session_factory() as session:
+            result = session.execute(
+                update(IngestionJob)
+                .where(IngestionJob.id == job_id, IngestionJob.status == "queued")
+                .values(status="running", pages_parsed=0, chunks_embedded=0, failures=0, error=None)
+            )
+            session.commit()
+            return result.rowcount == 1
+
+    def _update(self, job_id: str, **values):
+        with self.session_factory() as session:
+            session.execute(
+                update(IngestionJob)
+                .where(IngestionJob.id == job_id)
+                .values(**values)
+            )
+            session.commit()
+
+    def _run(self, job_id: str):
+        if not self._claim(job_id):
+            return
+
+        job = self.get_job(job_id)
+
+        def progress(report: dict):
+            self._update(
+                job_id,
+                pages_parsed=report["pages"],
+                chunks_embedded=report["chunks"],
+                failures=report["failures"]
+            )
+
+        try:
+            self._ingest(job, progress)
+        finally:
+            # Failed jobs are not retried, so their upload is not needed either
+            try:
+                os.remove(job.file_path)
+            except OSError:
+                logger.warning("Could not remove uploaded file %s", job.file_path)
+
+    def _ingest(self, job: IngestionJob, progress):
+        try:
+            with open(job.file_path, "rb") as stream:
+                report = self.document_service.upload_document(
+                    FileStorage(stream=stream, filename=job.name),
+                    progress=progress
+                )
+        except Exception as e:
+            logger.error("Ingestion job %s for %s failed", job.id, job.name, exc_info=True)
+            self._update(job.id, status="failed", error=str(e))
+            return
+
+        # A partly stored file is failed too, so uploading it again is not
+        # taken for a duplicate; chunks that were stored are skipped then
+        error = None
+        if report["failures"] and not report["chunks"]:
+            error = "No chunks could be stored"
+        elif report["failures"]:
+            error = f"{report['failures']} chunks could not be stored"
+        self._update(
+            job.id,
+            status="failed" if error else "completed",
+            error=error
+        )
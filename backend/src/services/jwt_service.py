@@ -5,19 +5,44 @@ from cryptography.hazmat.primitives.serialization import load_pem_private_key, l
 from cryptography.exceptions import InvalidSignature
 import json
 import base64
+import hashlib
 import os
 import secrets
+import threading
+from config import Config
 from .base_service import BaseService
+from .query_cache import LRUCache
+
+_PADDING = padding.PSS(
+    mgf=padding.MGF1(hashes.SHA256()),
+    salt_length=padding.PSS.MAX_LENGTH
+)
 
 class JWTService(BaseService):
-    """Service for handling JWT token operations like signing and verification."""
+    """
+    Service for handling JWT token operations like signing and verification.
+
+    The keys are parsed once. Tokens that pass verification are remembered
+    by their SHA-256 digest until their expiry, so a client sending the
+    same access token on every request pays for the RSA verification once.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
     
-    def __init__(self):
-        """Initialize JWT service with private and public keys."""
+    def __init__(self, cache_size: int = None, key_directory: str = None):
+        """
+        Initialize JWT service with private and public keys.
+
+        Args:
+            cache_size: Verified tokens remembered, 0 disables the cache,
+                Config.TOKEN_CACHE_SIZE by default
+            key_directory: Directory with private_key.pem and public_key.pem,
+                the backend directory by default
+        """
         super().__init__()
         
         # Find base path for the keys
-        base_path = os.path.dirname(
+        base_path = key_directory or os.path.dirname(
                     os.path.dirname(
                         os.path.dirname(
                             os.path.abspath(__file__)
@@ -31,6 +56,22 @@ class JWTService(BaseService):
 
         with open(os.path.join(os.path.abspath(base_path), "public_key.pem"), "rb") as public_key_file:
             self.public_key = public_key_file.read()
+
+        self.signing_key = load_pem_private_key(self.private_key, password=None)
+        self.verification_key = load_pem_public_key(self.public_key)
+        # Token digest to (user ID, expiry)
+        self.verified_tokens = LRUCache(Config.TOKEN_CACHE_SIZE if cache_size is None else cache_size)
+    
+    @classmethod
+    def shared(cls) -> "JWTService":
+        """
+        The instance shared by the process, so the parsed keys and verified
+        tokens outlive the AuthService created for each request.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
     
     def create_access_token(self, user_id: str, expires_at: datetime) -> str:
         """
@@ -50,16 +91,8 @@ class JWTService(BaseService):
         }
         payload_json = json.dumps(payload)
         
-        private_key = load_pem_private_key(self.private_key, password=None)
         # Sign the payload
-        signature = private_key.sign(
-            payload_json.encode(),
-            padding.PSS(
-                mgf=padding.MGF1(hashes.SHA256()),
-                salt_length=padding.PSS.MAX_LENGTH
-            ),
-            hashes.SHA256()
-        )
+        signature = self.signing_key.sign(payload_json.encode(), _PADDING, hashes.SHA256())
         
         # Create token with both payload and signature
         token_parts = {
@@ -81,6 +114,14 @@ class JWTService(BaseService):
         Returns:
             The user ID if valid, empty string otherwise
         """
+        digest = hashlib.sha256(token.encode()).digest()
+        cached = self.verified_tokens.get(digest)
+        if cached is not None:
+            user_id, expiry_time = cached
+            if expiry_time and expiry_time < datetime.now():
+                return ""  # Token expired
+            return user_id
+
         try:
             # Decode the token to get the parts
             token_data = json.loads(base64.b64decode(token).decode())
@@ -97,6 +138,7 @@ class JWTService(BaseService):
             signature = base64.b64decode(signature_b64)
             
             # Check expiration
+            expiry_time = None
             try:
                 expiry_str = payload.get("exp")
                 if expiry_str:
@@ -107,19 +149,12 @@ class JWTService(BaseService):
                 return ""  # Invalid date format
             
             # Verify signature
-            public_key = load_pem_public_key(self.public_key)
-            public_key.verify(
-                signature,
-                payload_str.encode(),
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()),
-                    salt_length=padding.PSS.MAX_LENGTH
-                ),
-                hashes.SHA256()
-            )
+            self.verification_key.verify(signature, payload_str.encode(), _PADDING, hashes.SHA256())
             
             # If we get here, signature is valid - return the user ID
-            return payload.get("name", "")
+            user_id = payload.get("name", "")
+            self.verified_tokens.put(digest, (user_id, expiry_time))
+            return user_id
             
         except (InvalidSignature, ValueError, KeyError, base64.binascii.Error, json.JSONDecodeError) as e:
             print(f"Token validation error: {e}")
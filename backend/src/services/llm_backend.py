@@ -0,0 +1,223 @@
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import TYPE_CHECKING, AsyncIterator, Iterator
+from config import Config
+
+if TYPE_CHECKING:
+    from google.genai import Client, types
+
+
+class LLMBackend(ABC):
+    """
+    The model provider LLMService streams from.
+    """
+    @abstractmethod
+    def generate_stream(
+            self,
+            model: str,
+            contents: "list[types.Content]",
+            config: "types.GenerateContentConfig"
+        ) -> Iterator[str]:
+        """
+        Stream the text of a response.
+        """
+
+    @abstractmethod
+    def agenerate_stream(
+            self,
+            model: str,
+            contents: "list[types.Content]",
+            config: "types.GenerateContentConfig"
+        ) -> AsyncIterator[str]:
+        """
+        Stream the text of a response on the event loop.
+        """
+
+    def create_context_cache(
+            self,
+            model: str,
+            config: "types.CreateCachedContentConfig"
+        ) -> str:
+        """
+        Store a prompt prefix provider-side.
+
+        Returns:
+            Name to pass as cached_content in GenerateContentConfig
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support context caching")
+
+    def delete_context_cache(self, name: str):
+        """
+        Remove a prefix stored with create_context_cache.
+        """
+
+
+class GeminiBackend(LLMBackend):
+    """
+    Google Gemini through the genai client.
+    """
+    def __init__(self, client: "Client" = None):
+        """
+        Args:
+            client: genai client, created with GOOGLE_API_KEY on first use
+                when not given
+        """
+        self._client = client
+        self.lock = threading.Lock()
+
+    @property
+    def client(self) -> "Client":
+        # google.genai is only imported once the model is first called
+        with self.lock:
+            if self._client is None:
+                from google.genai import Client
+
+                self._client = Client(api_key=Config.GOOGLE_API_KEY)
+            return self._client
+
+    def generate_stream(self, model, contents, config):
+        for chunk in self.client.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config,
+        ):
+            # The closing chunk of a stream can carry no text
+            if chunk.text is not None:
+                yield chunk.text
+
+    async def agenerate_stream(self, model, contents, config):
+        stream = await self.client.aio.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config,
+        )
+        async for chunk in stream:
+            if chunk.text is not None:
+                yield chunk.text
+
+    def create_context_cache(self, model, config):
+        return self.client.caches.create(model=model, config=config).name
+
+    def delete_context_cache(self, name):
+        self.client.caches.delete(name=name)
+
+
+class SimulatedBackend(LLMBackend):
+    """
+    Local stand-in for Gemini for load tests and benchmarks.
+
+    Responses are words picked by a generator seeded from the prompt, so the
+    same prompt always streams the same text. The first token arrives after
+    `ttft` seconds and each further token `token_delay` seconds later.
+    Requests fail with a 503 ServerError at `error_rate`, drawn from a
+    generator seeded with `seed` so a run fails the same requests every
+    time, and beyond `rate_limit` requests per minute with a 429
+    ClientError; these are the exceptions the genai client raises.
+    """
+    WORDS = (
+        "the", "document", "describes", "a", "process", "for", "retrieval", "of",
+        "relevant", "passages", "which", "are", "then", "summarised", "in", "context",
+        "and", "cited", "by", "page", "with", "additional", "detail", "on", "each", "step"
+    )
+
+    def __init__(
+            self,
+            ttft: float = None,
+            token_delay: float = None,
+            tokens: int = None,
+            error_rate: float = None,
+            rate_limit: int = None,
+            seed: int = 0
+        ):
+        """
+        Args:
+            ttft: Seconds before the first token
+            token_delay: Seconds between tokens
+            tokens: Tokens per response
+            error_rate: Fraction of requests that fail
+            rate_limit: Requests allowed per minute, 0 for no limit
+            seed: Mixed into every response's seed
+        """
+        self.ttft = Config.SIMULATED_LLM_TTFT if ttft is None else ttft
+        self.token_delay = Config.SIMULATED_LLM_TOKEN_DELAY if token_delay is None else token_delay
+        self.tokens = Config.SIMULATED_LLM_TOKENS if tokens is None else tokens
+        self.error_rate = Config.SIMULATED_LLM_ERROR_RATE if error_rate is None else error_rate
+        self.rate_limit = Config.SIMULATED_LLM_RATE_LIMIT if rate_limit is None else rate_limit
+        self.seed = seed
+        self.failures = random.Random(seed)
+        self.requests = deque()
+        self.lock = threading.Lock()
+        self.caches = {}
+
+    def generate_stream(self, model, contents, config):
+        rng = self._start(model, contents, config)
+        time.sleep(self.ttft)
+        for i in range(self.tokens):
+            if i:
+                time.sleep(self.token_delay)
+            yield self._token(rng)
+
+    async def agenerate_stream(self, model, contents, config):
+        rng = self._start(model, contents, config)
+        await asyncio.sleep(self.ttft)
+        for i in range(self.tokens):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield self._token(rng)
+
+    def create_context_cache(self, model, config):
+        name = f"cachedContents/simulated-{len(self.caches)}"
+        self.caches[name] = config
+        return name
+
+    def delete_context_cache(self, name):
+        self.caches.pop(name, None)
+
+    def _start(self, model, contents, config) -> random.Random:
+        # Admit the request and seed its response from the prompt
+        from google.genai import errors
+
+        with self.lock:
+            if self.rate_limit > 0:
+                now = time.monotonic()
+                while self.requests and now - self.requests[0] >= 60:
+                    self.requests.popleft()
+                if len(self.requests) >= self.rate_limit:
+                    raise errors.ClientError(429, {"error": {
+                        "code": 429, "status": "RESOURCE_EXHAUSTED", "message": "Simulated rate limit exceeded"
+                    }})
+                self.requests.append(now)
+            if self.failures.random() < self.error_rate:
+                raise errors.ServerError(503, {"error": {
+                    "code": 503, "status": "UNAVAILABLE", "message": "Simulated model overload"
+                }})
+
+        prompt = hashlib.sha256(f"{self.seed}\0{model}".encode())
+        if config is not None and config.cached_content:
+            prompt.update(config.cached_content.encode())
+        for content in contents:
+            for part in content.parts or []:
+                prompt.update((part.text or "").encode())
+        return random.Random(prompt.digest())
+
+    def _token(self, rng: random.Random) -> str:
+        return rng.choice(self.WORDS) + " "
+
+
+def create_llm_backend(client: "Client" = None) -> LLMBackend:
+    """
+    The backend selected by LLM_BACKEND: "gemini" (default) or "simulated".
+
+    Args:
+        client: genai client used by the Gemini backend, created on first use when not given
+    """
+    if Config.LLM_BACKEND == "simulated":
+        return SimulatedBackend()
+    if Config.LLM_BACKEND != "gemini":
+        raise ValueError(f"Unknown LLM_BACKEND {Config.LLM_BACKEND!r}, expected 'gemini' or 'simulated'")
+    return GeminiBackend(client)
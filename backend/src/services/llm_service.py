@@ -1,68 +1,340 @@
+import json
+import time
+import hashlib
+import asyncio
+import logging
+import functools
+import threading
 from .base_service import BaseService
-from google.genai import Client
-from google.genai import types
 from models.document import Document
-from typing import Generator
+from config import Config
+from .prompt_builder import PromptBuilder
+from .llm_backend import LLMBackend
+from .tracing import TRACER
+from opentelemetry import trace
+from .metrics import PROMPT_ASSEMBLY_SECONDS, TIME_TO_FIRST_TOKEN_SECONDS, GENERATION_SECONDS, GENERATION_CHUNKS
+from typing import TYPE_CHECKING, AsyncGenerator, Generator
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+
+SUMMARY_INSTRUCTION = (
+    "You maintain a running summary of a conversation between a user and an assistant "
+    "that answers questions from retrieved documents. Update the summary with the new "
+    "messages. Keep the facts, names, numbers and open questions the assistant may need "
+    "later, drop pleasantries, and answer with the summary only."
+)
+
+
+# google.genai is imported by the first request, or the warm-up, instead of
+# at startup; these are built then and shared by every request after it
+@functools.cache
+def document_markers() -> tuple["types.Content", "types.Content"]:
+    """
+    The markers around the retrieved documents. They never change, so one
+    Content each is enough.
+
+    Returns:
+        Tuple of (started, terminated)
+    """
+    from google.genai import types
+
+    return (
+        types.Content(role="user", parts=[types.Part.from_text(text="\nRetrieved documents started")]),
+        types.Content(role="user", parts=[types.Part.from_text(text="\nRetrieved documents terminated")])
+    )
+
+
+@functools.cache
+def summary_config() -> "types.GenerateContentConfig":
+    from google.genai import types
+
+    return types.GenerateContentConfig(
+        response_mime_type="text/plain",
+        system_instruction=SUMMARY_INSTRUCTION
+    )
+
+
+class StaticPrefix:
+    """
+    The part of every request that only depends on the system prompt and the
+    few-shot examples, compiled once.
+    """
+    def __init__(
+        self,
+        contents: "list[types.Content]",
+        config: "types.GenerateContentConfig",
+        fixed_texts: list[str],
+        fingerprint: str,
+        cache_name: str = None,
+        expires_at: float = None
+    ):
+        # Contents to put in front of each request; empty when they live in
+        # the provider-side cache
+        self.contents = contents
+        self.config = config
+        # Texts the prompt builder always has to budget for
+        self.fixed_texts = fixed_texts
+        # Hash of the system prompt and few-shot examples
+        self.fingerprint = fingerprint
+        self.cache_name = cache_name
+        self.expires_at = expires_at
+        # Requests streaming with this prefix; a replaced prefix keeps its
+        # context cache until the last of them has finished
+        self.users = 0
+        self.retired = False
+        self.lock = threading.Lock()
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def acquire(self) -> bool:
+        """
+        Count a request as using the prefix.
+
+        Returns:
+            False if the prefix has been replaced and must not be used
+        """
+        with self.lock:
+            if self.retired:
+                return False
+            self.users += 1
+            return True
+
+    def release(self) -> bool:
+        """
+        Stop counting a request as using the prefix.
+
+        Returns:
+            True if the prefix was replaced and this was its last user
+        """
+        with self.lock:
+            self.users -= 1
+            return self.retired and self.users == 0
+
+    def retire(self) -> bool:
+        """
+        Mark the prefix as replaced, so no new request uses it.
+
+        Returns:
+            True if no request is using the prefix
+        """
+        with self.lock:
+            self.retired = True
+            return self.users == 0
+
 
 class LLMService(BaseService):
     def __init__(
-        self, 
-        google_client: Client,
+        self,
+        backend: LLMBackend,
         model: str,
         system_prompt="",
-        few_shot_examples: list[dict[str, str]]=None
+        few_shot_examples: list[dict[str, str]]=None,
+        prompt_builder: PromptBuilder = None,
+        context_cache_ttl: int = None
     ):
         super().__init__()
-        self.google_client = google_client
+        self.backend = backend
         self.model = model
         self.system_prompt = system_prompt
         self.few_shot_examples = few_shot_examples or []
-    
+        if prompt_builder is None and Config.PROMPT_TOKEN_BUDGET > 0:
+            prompt_builder = PromptBuilder(Config.PROMPT_TOKEN_BUDGET)
+        self.prompt_builder = prompt_builder
+        # Seconds to keep the static prefix in the provider's context cache; 0 sends it inline
+        self.context_cache_ttl = Config.LLM_CONTEXT_CACHE_TTL if context_cache_ttl is None else context_cache_ttl
+        self._prefix = None
+        self._prefix_lock = threading.Lock()
+
     def set_system_prompt(
-        self, 
+        self,
         prompt: str
     ):
         self.system_prompt = prompt
-    
+        self._invalidate_prefix()
+
     def add_few_shot_example(
-            self, 
-            user_input: str, 
+            self,
+            user_input: str,
             assistant_response: str
         ):
         self.few_shot_examples.append({
             "user": user_input,
             "model": assistant_response
         })
-    
+        self._invalidate_prefix()
+
+    def get_prefix(self) -> StaticPrefix:
+        """
+        The compiled static prefix, compiling it if the system prompt or
+        few-shot examples changed or its context cache expired.
+        """
+        prefix = self._prefix
+        if prefix is not None and not prefix.expired():
+            return prefix
+
+        with self._prefix_lock:
+            if self._prefix is None or self._prefix.expired():
+                stale = self._prefix
+                self._prefix = self._compile_prefix()
+                if stale is not None:
+                    self._retire_prefix(stale)
+            return self._prefix
+
     def query(
-            self, 
-            query_text: str, 
-            documents: list[Document] = [], 
+            self,
+            query_text: str,
+            documents: list[Document] = [],
             history: list[dict[str, str]] = None
         ) -> Generator[str, None, str]:
-        contents = []            
-        
-        for example in self.few_shot_examples:
-            contents.append(
-                types.Content(
-                    role="user",
-                    parts=[types.Part.from_text(text=example["user"])]
-                )
-            )
-            contents.append(
-                types.Content(
-                    role="model",
-                    parts=[types.Part.from_text(text=example["model"])]
-                )
+        prefix = self._acquire_prefix()
+        try:
+            with PROMPT_ASSEMBLY_SECONDS.time():
+                contents, config = self._build_request(prefix, query_text, documents, history)
+        except Exception:
+            self._release_prefix(prefix)
+            raise
+
+        span = self._start_span(prefix)
+        start = time.perf_counter()
+        chunks = 0
+        outcome = "error"
+        try:
+            for chunk in self.backend.generate_stream(self.model, contents, config):
+                if not chunks:
+                    self._first_chunk(span, start)
+                chunks += 1
+                yield chunk
+            outcome = "ok"
+        except GeneratorExit:
+            outcome = "abandoned"
+            raise
+        except Exception as e:
+            span.record_exception(e)
+            raise
+        finally:
+            self._record_generation(span, start, chunks, outcome)
+            self._release_prefix(prefix)
+
+    async def aquery(
+            self,
+            query_text: str,
+            documents: list[Document] = [],
+            history: list[dict[str, str]] = None
+        ) -> AsyncGenerator[str, None]:
+        """
+        Stream a response through the backend's async API, so a waiting
+        stream holds a coroutine instead of a thread.
+        """
+        prefix = self._prefix
+        if prefix is None or prefix.expired() or not prefix.acquire():
+            # Compiling may create a context cache over the network
+            prefix = await asyncio.to_thread(self._acquire_prefix)
+        try:
+            with PROMPT_ASSEMBLY_SECONDS.time():
+                contents, config = self._build_request(prefix, query_text, documents, history)
+        except Exception:
+            self._release_prefix(prefix)
+            raise
+
+        span = self._start_span(prefix)
+        start = time.perf_counter()
+        chunks = 0
+        outcome = "error"
+        try:
+            async for chunk in self.backend.agenerate_stream(self.model, contents, config):
+                if not chunks:
+                    self._first_chunk(span, start)
+                chunks += 1
+                yield chunk
+            outcome = "ok"
+        except (GeneratorExit, asyncio.CancelledError):
+            outcome = "abandoned"
+            raise
+        except Exception as e:
+            span.record_exception(e)
+            raise
+        finally:
+            self._record_generation(span, start, chunks, outcome)
+            self._release_prefix(prefix)
+
+    def summarize(
+            self,
+            summary: str,
+            messages: list[dict[str, str]]
+        ) -> str:
+        """
+        Fold messages into a running conversation summary.
+
+        Args:
+            summary: The summary so far, empty for the first compaction
+            messages: Messages to add, oldest first
+
+        Returns:
+            The updated summary
+        """
+        from google.genai import types
+
+        transcript = "\n".join(f"{message['role']}: {message['text']}" for message in messages)
+        contents = [
+            types.Content(
+                role="user",
+                parts=[types.Part.from_text(text=f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}")]
             )
+        ]
+        return "".join(self.backend.generate_stream(self.model, contents, summary_config())).strip()
+
+    def _start_span(self, prefix: StaticPrefix) -> trace.Span:
+        # One span per upstream call, a child of whatever is current
+        return TRACER.start_span(
+            "llm.generate",
+            kind=trace.SpanKind.CLIENT,
+            attributes={
+                "llm.model": self.model,
+                "llm.backend": type(self.backend).__name__,
+                "llm.context_cache": bool(prefix.cache_name)
+            }
+        )
+
+    @staticmethod
+    def _first_chunk(span: trace.Span, start: float):
+        TIME_TO_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start)
+        span.add_event("first_chunk")
+
+    @staticmethod
+    def _record_generation(span: trace.Span, start: float, chunks: int, outcome: str):
+        GENERATION_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
+        if outcome == "ok":
+            GENERATION_CHUNKS.observe(chunks)
+        span.set_attribute("llm.chunks", chunks)
+        span.set_attribute("llm.outcome", outcome)
+        if outcome == "error":
+            span.set_status(trace.StatusCode.ERROR)
+        span.end()
+
+    def _build_request(
+            self,
+            prefix: StaticPrefix,
+            query_text: str,
+            documents: list[Document],
+            history: list[dict[str, str]]
+        ) -> "tuple[list[types.Content], types.GenerateContentConfig]":
+        # The compiled prefix followed by the parts that change per query
+        from google.genai import types
+
+        if self.prompt_builder:
+            # Fit documents and history around the parts that are always sent
+            documents, history = self.prompt_builder.fit(prefix.fixed_texts + [query_text], documents, history)
+
+        contents = list(prefix.contents)
 
         if documents:
-            contents.append(
-                types.Content(
-                    role="user",
-                    parts = [types.Part.from_text(text="\nRetrieved documents started")]
-                )
-            )
+            documents_started, documents_terminated = document_markers()
+            contents.append(documents_started)
             for document in documents:
                 contents.append(
                     types.Content(
@@ -70,14 +342,7 @@ class LLMService(BaseService):
                         parts=[types.Part.from_text(text=document.text)]
                     )
                 )
-            contents.append(
-                types.Content(
-                    role="user",
-                    parts = [types.Part.from_text(text="\nRetrieved documents terminated")]
-                )
-            )
-        
-    
+            contents.append(documents_terminated)
 
         if history:
             for message in history:
@@ -94,15 +359,94 @@ class LLMService(BaseService):
                 parts=[types.Part.from_text(text=query_text)]
             )
         )
-        
-        generate_content_config = types.GenerateContentConfig(
-            response_mime_type="text/plain",
-            system_instruction= self.system_prompt
-        )
+        return contents, prefix.config
 
-        for chunk in self.google_client.models.generate_content_stream(
-            model=self.model,
+    def _compile_prefix(self) -> StaticPrefix:
+        from google.genai import types
+
+        contents = []
+        fixed_texts = [self.system_prompt or ""]
+        for example in self.few_shot_examples:
+            contents.append(
+                types.Content(
+                    role="user",
+                    parts=[types.Part.from_text(text=example["user"])]
+                )
+            )
+            contents.append(
+                types.Content(
+                    role="model",
+                    parts=[types.Part.from_text(text=example["model"])]
+                )
+            )
+            fixed_texts.extend((example["user"], example["model"]))
+        fingerprint = hashlib.sha256(json.dumps([self.system_prompt, self.few_shot_examples]).encode()).hexdigest()
+
+        if self.context_cache_ttl > 0:
+            try:
+                cache_name = self.backend.create_context_cache(
+                    self.model,
+                    types.CreateCachedContentConfig(
+                        contents=contents or None,
+                        system_instruction=self.system_prompt or None,
+                        ttl=f"{self.context_cache_ttl}s"
+                    )
+                )
+            except Exception as e:
+                # e.g. the prefix is below the model's minimum cacheable size
+                logger.warning("Could not cache the static prompt prefix, sending it inline: %s", e)
+            else:
+                return StaticPrefix(
+                    contents=[],
+                    config=types.GenerateContentConfig(
+                        response_mime_type="text/plain",
+                        cached_content=cache_name
+                    ),
+                    fixed_texts=fixed_texts,
+                    fingerprint=fingerprint,
+                    cache_name=cache_name,
+                    # Recompile a little before the provider drops the cache
+                    expires_at=time.monotonic() + self.context_cache_ttl * 0.9
+                )
+
+        return StaticPrefix(
             contents=contents,
-            config=generate_content_config,
-        ):
-            yield chunk.text
+            config=types.GenerateContentConfig(
+                response_mime_type="text/plain",
+                system_instruction= self.system_prompt
+            ),
+            fixed_texts=fixed_texts,
+            fingerprint=fingerprint
+        )
+
+    def _invalidate_prefix(self):
+        with self._prefix_lock:
+            stale = self._prefix
+            self._prefix = None
+        if stale is not None:
+            self._retire_prefix(stale)
+
+    def _acquire_prefix(self) -> StaticPrefix:
+        # The current prefix, counted as in use until _release_prefix
+        while True:
+            prefix = self.get_prefix()
+            if prefix.acquire():
+                return prefix
+
+    def _release_prefix(self, prefix: StaticPrefix):
+        if prefix.release():
+            self._delete_cache(prefix)
+
+    def _retire_prefix(self, prefix: StaticPrefix):
+        # Requests still streaming with a replaced prefix keep its context
+        # cache; the last of them deletes it
+        if prefix.retire():
+            self._delete_cache(prefix)
+
+    def _delete_cache(self, prefix: StaticPrefix):
+        if not prefix.cache_name:
+            return
+        try:
+            self.backend.delete_context_cache(prefix.cache_name)
+        except Exception as e:
+            logger.warning("Could not delete context cache %s: %s", prefix.cache_name, e)
@@ -0,0 +1,361 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import logging
+import threading
+from config import Config
+from .base_service import BaseService
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class _Timer:
+    # Observes the seconds spent in a with block
+    def __init__(self, histogram: "Histogram", labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Counter:
+    """
+    Monotonic count, optionally split by labels.
+    """
+    kind = "counter"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str, labelnames: tuple = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {json.dumps(key): value for key, value in self.values.items()}
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def render(self, samples: dict) -> list[str]:
+        return [
+            f"{self.name}{_labels(self.labelnames, json.loads(key))} {_number(value)}"
+            for key, value in sorted(samples.items())
+        ]
+
+
+class Gauge(Counter):
+    """
+    Current value that can go up and down, optionally split by labels. The
+    values of several workers are added up, like their counters.
+    """
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets, optionally split by labels.
+    """
+    kind = "histogram"
+
+    def __init__(
+            self,
+            registry: "MetricsRegistry",
+            name: str,
+            documentation: str,
+            buckets: tuple = LATENCY_BUCKETS,
+            labelnames: tuple = ()
+        ):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        # Per label values: a count for each bucket and +Inf, then the sum
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def time(self, **labels) -> _Timer:
+        """
+        Context manager observing the seconds spent in its block.
+        """
+        return _Timer(self, labels)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {json.dumps(key): list(counts) for key, counts in self.values.items()}
+
+    @staticmethod
+    def merge(total, counts):
+        if total is None:
+            return list(counts)
+        return [a + b for a, b in zip(total, counts)]
+
+    def render(self, samples: dict) -> list[str]:
+        lines = []
+        for key, counts in sorted(samples.items()):
+            values = json.loads(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), values + [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry(BaseService):
+    """
+    In-process counters, gauges and histograms rendered in the Prometheus text format.
+
+    Recording takes one short lock per metric and does nothing when metrics
+    are disabled. When several worker processes serve the app, give them
+    the same `directory`: each one writes its samples there every
+    `flush_interval` seconds and on exit, and /metrics adds up the files of
+    the workers that are still running, deleting the files of workers that
+    have exited. Their samples leave the totals with them, which Prometheus
+    treats as a counter reset.
+    """
+    def __init__(
+            self,
+            enabled: bool = None,
+            directory: str = None,
+            flush_interval: float = None
+        ):
+        """
+        Args:
+            enabled: Record and serve metrics
+            directory: Directory shared by worker processes, None for a single process
+            flush_interval: Seconds between writes to the directory
+        """
+        super().__init__()
+        self.enabled = Config.METRICS_ENABLED if enabled is None else enabled
+        self.directory = Config.METRICS_DIRECTORY if directory is None else directory
+        self.flush_interval = flush_interval or Config.METRICS_FLUSH_INTERVAL
+        self.metrics = {}
+        self.flusher = None
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            buckets: tuple = LATENCY_BUCKETS,
+            labelnames: tuple = ()
+        ) -> Histogram:
+        return self._register(Histogram(self, name, documentation, buckets, labelnames))
+
+    def start(self):
+        """
+        Start writing this process's samples to the shared directory.
+        """
+        if not self.enabled or not self.directory or self.flusher:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.flusher = threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True)
+        self.flusher.start()
+        atexit.register(self.flush)
+
+    def flush(self):
+        """
+        Write this process's samples to the shared directory.
+        """
+        path = self._path(os.getpid())
+        try:
+            with open(path + ".tmp", "w") as file:
+                json.dump(self.snapshot(), file)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            logger.warning("Could not write metrics to %s", path, exc_info=True)
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def collect(self) -> dict:
+        """
+        Samples of every worker sharing the directory, or of this process alone.
+        """
+        totals = self.snapshot()
+        if not self.directory or not os.path.isdir(self.directory):
+            return totals
+        own = os.path.basename(self._path(os.getpid()))
+        for entry in os.scandir(self.directory):
+            if entry.name == own or not entry.name.endswith(".json"):
+                continue
+            pid = _file_pid(entry.name)
+            if pid is not None and not _running(pid):
+                # Left behind by a worker that has exited or been replaced
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(entry.path) as file:
+                    other = json.load(file)
+            except (OSError, ValueError):
+                # Being replaced by its worker, counted on the next scrape
+                continue
+            for name, samples in other.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                merged = totals.setdefault(name, {})
+                for key, value in samples.items():
+                    merged[key] = metric.merge(merged.get(key), value)
+        return totals
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        samples = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render(samples.get(name, {})))
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"metrics-{pid}.json")
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+def _file_pid(name: str) -> int:
+    # Worker pid of a metrics-<pid>.json file, None for other files
+    stem = name[:-len(".json")]
+    prefix, _, pid = stem.partition("-")
+    return int(pid) if prefix == "metrics" and pid.isdigit() else None
+
+
+def _running(pid: int) -> bool:
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+
+def _labels(names: tuple, values: list) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = MetricsRegistry()
+
+RETRIEVAL_SECONDS = REGISTRY.histogram(
+    "rag_retrieval_seconds", "Time to retrieve documents for a query", labelnames=("mode",)
+)
+PROMPT_ASSEMBLY_SECONDS = REGISTRY.histogram(
+    "rag_prompt_assembly_seconds", "Time to build the model request from the query, documents and history"
+)
+TIME_TO_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "rag_llm_time_to_first_token_seconds", "Time from sending a model request to its first chunk"
+)
+GENERATION_SECONDS = REGISTRY.histogram(
+    "rag_llm_generation_seconds", "Time from sending a model request to its last chunk", labelnames=("outcome",)
+)
+GENERATION_CHUNKS = REGISTRY.histogram(
+    "rag_llm_chunks", "Chunks received from the model per response", buckets=COUNT_BUCKETS
+)
+STREAM_EVENTS = REGISTRY.histogram(
+    "rag_stream_events", "Events sent to the client per chat stream", buckets=COUNT_BUCKETS
+)
+STREAM_BYTES = REGISTRY.histogram(
+    "rag_stream_bytes", "Bytes sent to the client per chat stream", buckets=BYTE_BUCKETS
+)
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    "rag_admission_rejections_total", "Chat requests turned away by admission control", labelnames=("reason",)
+)
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "rag_admission_queue_depth", "Chat requests waiting for a free slot"
+)
+ADMISSION_IN_FLIGHT = REGISTRY.gauge(
+    "rag_admission_in_flight", "Chat streams holding a slot"
+)
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "rag_admission_wait_seconds", "Time chat requests spent waiting for a slot, including expired waits"
+)
+QUERY_CACHE_REQUESTS = REGISTRY.counter(
+    "rag_query_cache_requests_total", "Search cache lookups by layer and outcome", labelnames=("layer", "result")
+)
+QUERY_CACHE_EVICTIONS = REGISTRY.counter(
+    "rag_query_cache_evictions_total", "Search cache entries evicted to stay within the size limit", labelnames=("layer",)
+)
+UPLOAD_STAGE_SECONDS = REGISTRY.histogram(
+    "rag_upload_stage_seconds", "Time spent parsing, embedding and writing uploaded documents", labelnames=("stage",)
+)
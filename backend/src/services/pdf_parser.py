@@ -1,38 +1,271 @@
+import os
+import shutil
+import signal
+import logging
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator
 from werkzeug.datastructures import FileStorage
-from PyPDF2 import PdfReader
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class PageTimeoutError(Exception):
+    """Raised inside a worker when a single page takes too long to extract."""
+
+
+@contextmanager
+def _page_deadline(seconds: float):
+    # SIGALRM only exists on Unix and only fires in the main thread, which is
+    # where pool workers run their tasks. Elsewhere the parent-side range
+    # deadline in PDFParser is the only guard.
+    if not seconds or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+
+    def on_timeout(signum, frame):
+        raise PageTimeoutError()
+
+    previous = signal.signal(signal.SIGALRM, on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _extract_page_range(
+        path: str,
+        start: int,
+        stop: int,
+        page_timeout: float
+    ) -> list[tuple[str, bool]]:
+    """
+    Extract the text of pages [start, stop) in a worker process.
+
+    Returns:
+        One (text, timed_out) pair per page, in page order
+    """
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    results = []
+    for page_number in range(start, stop):
+        try:
+            with _page_deadline(page_timeout):
+                results.append((reader.pages[page_number].extract_text() or "", False))
+        except PageTimeoutError:
+            results.append(("", True))
+    return results
+
+
+def _succeeded(future: Future) -> bool:
+    return future.done() and not future.cancelled() and future.exception() is None
+
 
 class PDFParser:
+    # Times a range is moved to a new pool after another upload broke its pool
+    MAX_RESUBMISSIONS = 3
+
+    def __init__(
+        self,
+        max_workers: int = None,
+        page_timeout: float = None,
+        min_parallel_pages: int = None
+    ):
+        self.max_workers = Config.PDF_PARSE_WORKERS if max_workers is None else max_workers
+        self.page_timeout = Config.PDF_PAGE_TIMEOUT if page_timeout is None else page_timeout
+        self.min_parallel_pages = Config.PDF_PARALLEL_MIN_PAGES if min_parallel_pages is None else min_parallel_pages
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
     def parse(
         self,
-        file: FileStorage
+        file: FileStorage,
+        parallel: bool = None
     ) -> list[tuple[dict[str, str], list[str]]]:
+        return [
+            (metadata, self.chunk_text(text))
+            for metadata, text in self.iter_pages(file, parallel)
+        ]
+
+    def iter_pages(
+        self,
+        file: FileStorage,
+        parallel: bool = None
+    ) -> Iterator[tuple[dict[str, str], str]]:
+        """
+        Lazily yield (metadata, text) for each page of the PDF, in page order.
+        """
+        # Only uploads need PyPDF2, so it is not loaded at startup
+        from PyPDF2 import PdfReader
+
         pdf_reader = PdfReader(file)
-        extracted_chunks = []
-        for page_number, page in enumerate(pdf_reader.pages):
+        page_count = len(pdf_reader.pages)
+        if parallel is None:
+            parallel = self.max_workers > 1 and page_count >= self.min_parallel_pages
+
+        if parallel:
+            texts = self._extract_parallel(file, page_count)
+        else:
+            texts = (page.extract_text() for page in pdf_reader.pages)
+
+        for page_number, text in enumerate(texts):
             metadata = {
                 "name" : file.filename,
                 "page_no" : page_number
             }
+            yield metadata, text
+
+    def _extract_parallel(
+        self,
+        file: FileStorage,
+        page_count: int
+    ) -> Iterator[str]:
+        """
+        Extract page text across the process pool, yielding it in page order.
+
+        At most two ranges per worker are in flight, so extracted text that
+        the consumer has not reached yet stays bounded. Pages that exceed
+        the per-page timeout come back as empty text.
+        """
+        # Workers open the PDF from a temporary copy instead of receiving
+        # the bytes with every task
+        file.stream.seek(0)
+        fd, path = tempfile.mkstemp(suffix=".pdf")
+        in_flight = deque()
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                shutil.copyfileobj(file.stream, tmp)
+
+            # A few ranges per worker keeps the pool busy when page costs vary
+            range_size = max(1, -(-page_count // (self.max_workers * 4)))
+            ranges = iter([
+                (start, min(start + range_size, page_count))
+                for start in range(0, page_count, range_size)
+            ])
+
+            def submit(start: int, stop: int, attempts: int = 0) -> tuple:
+                for retry in range(self.MAX_RESUBMISSIONS + 1):
+                    pool = self._get_pool()
+                    try:
+                        future = pool.submit(_extract_page_range, path, start, stop, self.page_timeout)
+                        return start, stop, future, pool, attempts
+                    except (BrokenProcessPool, RuntimeError):
+                        # Shut down or broken by another thread since we got it
+                        if retry == self.MAX_RESUBMISSIONS:
+                            raise
+                        self._discard_pool(pool)
 
-            text = page.extract_text()
-            page_chunks = self.chunk_text(text)
-            extracted_chunks.append((metadata, page_chunks))
-        
-        return extracted_chunks
+            def submit_next():
+                for start, stop in ranges:
+                    in_flight.append(submit(start, stop))
+                    return
+
+            for _ in range(self.max_workers * 2):
+                submit_next()
+
+            while in_flight:
+                start, stop, future, pool, attempts = in_flight[0]
+                try:
+                    results = future.result(timeout=self._range_timeout(stop - start))
+                except FutureTimeoutError:
+                    results = [("", True)] * (stop - start)
+                    # A stuck worker cannot be interrupted from here, so kill
+                    # its pool and move every range without a result to a
+                    # fresh one
+                    self._discard_pool(pool)
+                    for index, (pending_start, pending_stop, pending, pending_pool, tries) in enumerate(in_flight):
+                        if index and pending_pool is pool and not _succeeded(pending):
+                            in_flight[index] = submit(pending_start, pending_stop, tries)
+                except (BrokenProcessPool, CancelledError):
+                    # The shared pool was discarded by another upload whose
+                    # range timed out; this range did nothing wrong
+                    if attempts < self.MAX_RESUBMISSIONS:
+                        in_flight[0] = submit(start, stop, attempts + 1)
+                        continue
+                    logger.warning("Giving up on pages %d-%d of %s after its pool failed", start + 1, stop, file.filename)
+                    results = [("", False)] * (stop - start)
+                in_flight.popleft()
+                submit_next()
+
+                for offset, (text, timed_out) in enumerate(results):
+                    if timed_out:
+                        logger.warning("Timed out extracting page %d of %s", start + offset + 1, file.filename)
+                    yield text
+        finally:
+            # Abandoned part-way: leave nothing queued against the temp file
+            for _, _, pending, _, _ in in_flight:
+                pending.cancel()
+            os.remove(path)
+
+    def _range_timeout(
+        self,
+        pages: int
+    ) -> float:
+        if not self.page_timeout:
+            return None
+        # Leave headroom for queueing behind other ranges and for the worker
+        # re-opening the PDF
+        return self.page_timeout * (pages + 1)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Ingest workers share the parser, so the pool is created and
+        # swapped under a lock
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn avoids forking a multi-threaded web worker
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor = None):
+        # Only the pool the caller saw is discarded: when another thread
+        # already replaced it, its successor is left alone
+        with self._pool_lock:
+            pool = pool or self._pool
+            if pool is None:
+                return
+            if self._pool is pool:
+                self._pool = None
+        # shutdown alone would leave a hung worker running for good
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        """
+        Stop the extraction worker pool, if one was started.
+        """
+        self._discard_pool()
 
-    
     def chunk_text(
             self,
-            text: str, 
+            text: str,
             chunk_size: int = 200,
             overlap: int = 80
         ) -> list[str]:
 
+        return list(self.iter_chunks(text, chunk_size, overlap))
+
+    def iter_chunks(
+            self,
+            text: str,
+            chunk_size: int = 200,
+            overlap: int = 80
+        ) -> Iterator[str]:
+
         words = text.split()
-        chunks = []
         for i in range(0, len(words), chunk_size - overlap):
-            chunk = " ".join(words[i:i + chunk_size])
-            chunks.append(chunk)
-        return chunks
-        
-        
\ No newline at end of file
+            yield " ".join(words[i:i + chunk_size])
+
+
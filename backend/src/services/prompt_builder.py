@@ -0,0 +1,107 @@
+import logging
+from typing import Callable
+from models.document import Document
+
+logger = logging.getLogger(__name__)
+
+# Starts the message that stands in for the compacted part of a conversation
+SUMMARY_PREFIX = "Summary of the conversation so far:\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local token estimate. Gemini averages about four characters per
+    token on English prose; long runs of short words or numbers come out
+    closer to one token per word, so the larger of the two is used.
+    """
+    if not text:
+        return 0
+    return max(len(text) // 4, len(text.split()))
+
+
+class PromptBuilder:
+    """
+    Fits retrieved documents and conversation history into a token budget.
+
+    The fixed part of the prompt (system prompt, few-shot examples and the
+    query) is always kept, and so is a leading conversation summary. When
+    the rest does not fit, the oldest history turns after the summary are
+    trimmed or dropped first, then the lowest-ranked documents.
+    """
+    def __init__(
+            self,
+            token_budget: int,
+            estimator: Callable[[str], int] = estimate_tokens
+        ):
+        self.token_budget = token_budget
+        self.estimator = estimator
+
+    def fit(
+            self,
+            fixed: list[str],
+            documents: list[Document],
+            history: list[dict[str, str]]
+        ) -> tuple[list[Document], list[dict[str, str]]]:
+        """
+        Choose the documents and history turns that fit in the budget.
+
+        Args:
+            fixed: Texts that are sent regardless of the budget
+            documents: Retrieved documents, best first
+            history: Conversation turns, oldest first, optionally after a
+                summary message starting with SUMMARY_PREFIX
+
+        Returns:
+            Tuple of (documents, history) to send
+        """
+        documents = list(documents or [])
+        history = list(history or [])
+        document_tokens = [self.estimator(document.text) for document in documents]
+        history_tokens = [self.estimator(message["text"]) for message in history]
+        total = sum(self.estimator(text) for text in fixed) + sum(document_tokens) + sum(history_tokens)
+        overflow = total - self.token_budget
+        if overflow <= 0:
+            return documents, history
+
+        summary = []
+        if history and history[0]["text"].startswith(SUMMARY_PREFIX):
+            # Stands for every compacted turn, so the turns after it go first
+            summary = [history.pop(0)]
+            history_tokens.pop(0)
+
+        dropped_turns = 0
+        trimmed_turn = False
+        while overflow > 0 and history:
+            if history_tokens[0] > overflow:
+                # Cutting the start of the oldest turn is enough; keep its end
+                history[0] = {**history[0], "text": self._keep_tail(history[0]["text"], history_tokens[0] - overflow)}
+                overflow = 0
+                trimmed_turn = True
+                break
+            overflow -= history_tokens.pop(0)
+            history.pop(0)
+            dropped_turns += 1
+
+        dropped_documents = 0
+        while overflow > 0 and documents:
+            overflow -= document_tokens.pop()
+            documents.pop()
+            dropped_documents += 1
+
+        logger.info(
+            "Prompt of ~%d tokens exceeds budget of %d: dropped %d history turns%s and %d documents",
+            total, self.token_budget, dropped_turns,
+            ", trimmed 1" if trimmed_turn else "", dropped_documents
+        )
+        if overflow > 0:
+            logger.warning("Fixed prompt parts alone exceed the token budget by ~%d tokens", overflow)
+        return documents, summary + history
+
+    def _keep_tail(
+            self,
+            text: str,
+            tokens: int
+        ) -> str:
+        # Keep roughly the last `tokens` tokens of the text
+        ratio = tokens / max(self.estimator(text), 1)
+        return text[len(text) - int(len(text) * ratio):]
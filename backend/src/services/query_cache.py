@@ -0,0 +1,165 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+from .metrics import QUERY_CACHE_EVICTIONS, QUERY_CACHE_REQUESTS
+
+
+class CollectionGeneration:
+    """
+    Counter that is bumped on every write to a collection.
+
+    Readers include the current value in their cache keys, so anything cached
+    before a write is never served after it.
+    """
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def bump(self) -> int:
+        """
+        Record a write to the collection.
+
+        Returns:
+            The new generation
+        """
+        with self.lock:
+            self.value += 1
+            return self.value
+
+    @property
+    def current(self) -> int:
+        return self.value
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU mapping with hit and miss counters.
+
+    A named cache also counts its hits, misses and evictions in the
+    query cache metrics, labelled with the name.
+    """
+    def __init__(self, max_size: int, name: str = None):
+        """
+        Args:
+            max_size: Entries kept before the least recently used is evicted
+            name: Layer label for the query cache metrics, None to leave them out
+        """
+        self.max_size = max_size
+        self.name = name
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Get a cached value, or None if the key is not cached.
+        """
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                self._count("miss")
+                return None
+            self.hits += 1
+            self._count("hit")
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Cache a value, evicting the least recently used entry when full.
+        """
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                if self.name is not None:
+                    QUERY_CACHE_EVICTIONS.inc(layer=self.name)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Current size and hit/miss counters of the cache.
+        """
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def _count(self, result: str):
+        if self.name is not None:
+            QUERY_CACHE_REQUESTS.inc(layer=self.name, result=result)
+
+
+class QueryCache:
+    """
+    Two-layer cache for search requests: query text to query embedding, and
+    (retrieval mode, query, top_k, filters) to the IDs of the matching
+    documents.
+
+    Result entries are keyed on the collection generation, so a write to the
+    collection makes every earlier result unreachable; they then age out of
+    the LRU. Embeddings do not depend on the collection and are kept.
+    """
+    def __init__(
+            self,
+            generation: CollectionGeneration,
+            max_size: int
+        ):
+        self.generation = generation
+        self.embeddings = LRUCache(max_size, "embeddings")
+        self.results = LRUCache(max_size, "results")
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        # The default embedding model is uncased, so case and spacing
+        # differences do not change the embedding
+        return " ".join(query.casefold().split())
+
+    def get_embedding(self, query: str) -> Any:
+        return self.embeddings.get(self.normalize(query))
+
+    def put_embedding(self, query: str, embedding: Any):
+        self.embeddings.put(self.normalize(query), embedding)
+
+    def result_key(
+            self,
+            query: str,
+            top_k: int,
+            filters: dict = None,
+            mode: str = "vector"
+        ) -> tuple:
+        """
+        Key for a result entry, bound to the collection generation current
+        when the search started.
+        """
+        return (
+            self.generation.current,
+            mode,
+            self.normalize(query),
+            top_k,
+            json.dumps(filters, sort_keys=True) if filters else None
+        )
+
+    def get_results(self, key: tuple) -> list[str]:
+        return self.results.get(key)
+
+    def put_results(self, key: tuple, ids: list[str]):
+        self.results.put(key, ids)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """
+        Hit/miss counters of both layers.
+        """
+        return {
+            "embeddings": self.embeddings.stats(),
+            "results": self.results.stats()
+        }
@@ -0,0 +1,212 @@
+import time
+import logging
+import importlib
+import threading
+from typing import Callable
+from sqlalchemy import text
+from config import Config
+from .base_service import BaseService
+from .search_service import SearchService
+from .llm_service import LLMService
+from .tracing import TRACER
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between two attempts of a failing warm-up
+MAX_RETRY_SECONDS = 300.0
+
+# Kept out of create_app, which only imports what serving a request needs;
+# the preload step loads them before the first query does
+DEFERRED_IMPORTS = ("chromadb", "google.genai", "PyPDF2")
+
+
+def preload_imports() -> float:
+    """
+    Import the modules that are not loaded at startup.
+
+    Returns:
+        Seconds spent importing them
+    """
+    start = time.perf_counter()
+    for name in DEFERRED_IMPORTS:
+        importlib.import_module(name)
+    return time.perf_counter() - start
+
+
+class ReadinessService(BaseService):
+    """
+    Decides whether this worker should receive traffic.
+
+    start() first runs the preload step on a background thread: the heavy
+    imports kept out of create_app and the startup work that needs them.
+    With warm-up on, it then loads the embedding model, queries the HNSW
+    index once and compiles the prompt prefix, and the worker is only ready
+    once that has finished. A failed warm-up is
+    started again by a readiness check once its retry delay has passed, and
+    the delay doubles with every failure in a row. Every check also verifies
+    that the database and the vector store answer.
+    """
+    def __init__(
+            self,
+            session_factory,
+            search_service: SearchService,
+            llm_service: LLMService,
+            warm_up: bool = None,
+            retry_seconds: float = None,
+            preload: Callable[[], dict[str, float]] = None
+        ):
+        """
+        Args:
+            session_factory: SQLAlchemy sessionmaker for the application database
+            search_service: Service whose embedding model and index are loaded
+            llm_service: Service whose prompt prefix is compiled
+            warm_up: Warm up before reporting ready, Config.WARMUP_ENABLED by default
+            retry_seconds: Wait before the first retry of a failed warm-up,
+                Config.WARMUP_RETRY_SECONDS by default
+            preload: Startup work run once after the deferred imports,
+                returning seconds per step
+        """
+        super().__init__()
+        self.session_factory = session_factory
+        self.search_service = search_service
+        self.llm_service = llm_service
+        self.warm_up_enabled = Config.WARMUP_ENABLED if warm_up is None else warm_up
+        # pending, running, done or failed
+        self.state = "pending" if self.warm_up_enabled else "done"
+        self.steps = {}
+        self.error = None
+        self.seconds = None
+        self.retry_seconds = Config.WARMUP_RETRY_SECONDS if retry_seconds is None else retry_seconds
+        # Failed attempts in a row, and when the next one may start
+        self.failures = 0
+        self.retry_at = 0.0
+        self.preload = preload
+        self.preloaded = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Warm up on a background thread, unless it is already running. With
+        warm-up off only the preload step runs.
+        """
+        if not self.warm_up_enabled:
+            threading.Thread(target=self._preload_only, name="preload", daemon=True).start()
+            return
+        with self.lock:
+            if self.state not in ("pending", "failed"):
+                return
+            self.state = "running"
+        threading.Thread(target=self.warm_up, name="warmup", daemon=True).start()
+
+    def run_preload(self) -> dict[str, float]:
+        """
+        Import the deferred modules and run the preload step, once.
+
+        Returns:
+            Seconds spent on each step, empty when it already ran
+        """
+        if self.preloaded:
+            return {}
+        steps = {"imports": preload_imports()}
+        if self.preload:
+            steps.update(self.preload())
+        # Not repeated by a retry: the step may requeue interrupted uploads
+        self.preloaded = True
+        return steps
+
+    def warm_up(self):
+        """
+        Load everything the first query would otherwise wait for.
+        """
+        start = time.perf_counter()
+        steps = {}
+        try:
+            with TRACER.start_as_current_span("warm_up"):
+                steps.update(self.run_preload())
+                steps.update(self.search_service.warm_up())
+                compile_start = time.perf_counter()
+                self.llm_service.get_prefix()
+                steps["prompt_prefix"] = time.perf_counter() - compile_start
+        except Exception as e:
+            state, error = "failed", e
+        else:
+            state, error = "done", None
+        seconds = time.perf_counter() - start
+        with self.lock:
+            self.state, self.error, self.steps, self.seconds = state, error and str(error), steps, seconds
+            if error:
+                self.failures += 1
+                delay = min(self.retry_seconds * 2 ** (self.failures - 1), MAX_RETRY_SECONDS)
+                self.retry_at = time.monotonic() + delay
+            else:
+                self.failures = 0
+            failures = self.failures
+
+        if not error:
+            logger.info("Warm-up finished in %.2fs: %s", seconds, steps)
+        elif failures == 1:
+            logger.error("Warm-up failed, retrying in %.0fs", delay, exc_info=error)
+        else:
+            # The traceback was logged with the first failure
+            logger.warning("Warm-up failed %d times, retrying in %.0fs: %s", failures, delay, error)
+
+    def check(self) -> tuple[bool, dict]:
+        """
+        Check readiness and the dependencies of this worker.
+
+        Returns:
+            Whether the worker is ready, and a report with the warm-up state
+            and step timings and each dependency check with its timing
+        """
+        with self.lock:
+            retry = self.state == "failed" and time.monotonic() >= self.retry_at
+        if retry:
+            # Try again, the cause may have been transient
+            self.start()
+        checks = {
+            "database": self._check(self._check_database),
+            "vector_store": self._check(self._check_vector_store)
+        }
+        with self.lock:
+            state = self.state
+            warm_up = {"state": state, "seconds": self.seconds, "steps": dict(self.steps)}
+            if self.error:
+                warm_up["error"] = self.error
+            if state == "failed":
+                warm_up["retry_in"] = max(self.retry_at - time.monotonic(), 0.0)
+        ready = state == "done" and all(check["status"] == "ok" for check in checks.values())
+        return ready, {"ready": ready, "warm_up": warm_up, "checks": checks}
+
+    def healthcheck(self):
+        """
+        Check if the service is healthy, with the warm-up state.
+        """
+        status = super().healthcheck()
+        with self.lock:
+            status["warm_up"] = self.state
+        return status
+
+    def _preload_only(self):
+        try:
+            steps = self.run_preload()
+        except Exception:
+            logger.exception("Preload failed")
+        else:
+            logger.info("Preload finished: %s", steps)
+
+    def _check_database(self):
+        with self.session_factory() as session:
+            session.execute(text("SELECT 1"))
+
+    def _check_vector_store(self):
+        self.search_service.collection.count()
+
+    @staticmethod
+    def _check(check) -> dict:
+        start = time.perf_counter()
+        try:
+            check()
+        except Exception as e:
+            logger.warning("Readiness check failed: %s", e)
+            return {"status": "error", "error": str(e), "seconds": time.perf_counter() - start}
+        return {"status": "ok", "seconds": time.perf_counter() - start}
@@ -1,31 +1,229 @@
+import time
 from models.document import Document
 from .base_service import BaseService
-import chromadb
 from config import Config
+from .embedding_cache import create_embedding_function, CachedEmbeddingFunction
+from .query_cache import QueryCache
+from .vector_store import VectorStore
+from .bm25_index import BM25Index
+from .tracing import TRACER
+from opentelemetry import trace
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from chromadb.api.models.Collection import Collection
+    from chromadb.api.types import Documents, EmbeddingFunction
+
+
+def reciprocal_rank_fusion(
+        rankings: list[list[str]],
+        k: int = 60
+    ) -> list[str]:
+    """
+    Fuse ranked ID lists by summing 1 / (k + rank) over the lists each ID
+    appears in.
+
+    Returns:
+        IDs ordered by fused score, best first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking, 1):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
 
 
 
 class SearchService(BaseService):
-    def __init__(self):
+    def __init__(
+            self,
+            embedding_function: "EmbeddingFunction[Documents]" = None,
+            keyword_index: BM25Index = None,
+            vector_store: VectorStore = None
+        ):
         super().__init__()
-        self.client = chromadb.PersistentClient(Config.CHROMA_PERSIST_DIRECTORY)
-        try:
-            self.collection = self.client.get_or_create_collection("documents")
-        except chromadb.errors.NotFoundError:
-            self.collection = self.client.create_collection("documents")
+        self.keyword_index = keyword_index
+        self.vector_store = vector_store or VectorStore.get()
+        self.embedding_function = embedding_function or create_embedding_function()
+        self.query_cache = None
+        if Config.QUERY_CACHE_ENABLED:
+            # Results are keyed on the generation the store bumps on writes
+            self.query_cache = QueryCache(self.vector_store.generation("documents"), Config.QUERY_CACHE_SIZE)
+
+    @property
+    def collection(self) -> "Collection":
+        # Shared handle from the store, opened by the first search or the warm-up
+        return self.vector_store.collection("documents")
 
     def search_documents(
             self, 
             query: str, 
-            limit: int=5
+            limit: int=5,
+            filters: dict = None
         ) -> list[Document]:
         """
         Search for documents based on a query string.
+
+        Repeated searches are answered from the query cache until the
+        collection is written to.
+        """
+        with TRACER.start_as_current_span("search_documents", attributes={"search.top_k": limit}) as span:
+            documents = self._search_documents(query, limit, filters, span)
+            span.set_attribute("search.results", len(documents))
+            return documents
+
+    def _search_documents(
+            self,
+            query: str,
+            limit: int,
+            filters: dict,
+            span: trace.Span
+        ) -> list[Document]:
+        if not self.query_cache:
+            return self._query(self.embedding_function([query]), limit, filters)
+
+        key = self.query_cache.result_key(query, limit, filters)
+        ids = self.query_cache.get_results(key)
+        span.set_attribute("search.cache_hit", ids is not None)
+        if ids is not None:
+            return self.get_documents(ids)
+
+        embedding = self.query_cache.get_embedding(query)
+        if embedding is None:
+            embedding = self.embedding_function([query])
+            self.query_cache.put_embedding(query, embedding)
+
+        documents = self._query(embedding, limit, filters)
+        self.query_cache.put_results(key, [document.id for document in documents])
+        return documents
+
+    def keyword_search(
+            self,
+            query: str,
+            limit: int = 5
+        ) -> list[Document]:
+        """
+        Search for documents with BM25 over the keyword index.
+        """
+        if not self.keyword_index:
+            return []
+        with TRACER.start_as_current_span("keyword_search", attributes={"search.top_k": limit}) as span:
+            documents = self._cached("keyword", query, limit, lambda: [
+                id for id, _ in self.keyword_index.search(query, limit)
+            ])
+            span.set_attribute("search.results", len(documents))
+            return documents
+
+    def hybrid_search(
+            self,
+            query: str,
+            limit: int = 5
+        ) -> list[Document]:
+        """
+        Search with both the vector index and BM25 and fuse the two rankings
+        by reciprocal rank.
         """
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=limit
-        )
+        if not self.keyword_index:
+            return self.search_documents(query, limit)
+
+        def search():
+            candidates = max(limit, Config.HYBRID_CANDIDATES)
+            vector_ids = [document.id for document in self.search_documents(query, candidates)]
+            keyword_ids = [id for id, _ in self.keyword_index.search(query, candidates)]
+            return reciprocal_rank_fusion([vector_ids, keyword_ids])[:limit]
+
+        with TRACER.start_as_current_span("hybrid_search", attributes={"search.top_k": limit}) as span:
+            documents = self._cached("hybrid", query, limit, search)
+            span.set_attribute("search.results", len(documents))
+            return documents
+
+    def get_documents(
+            self,
+            ids: list[str]
+        ) -> list[Document]:
+        """
+        Fetch documents by ID, in the order the IDs are given.
+        """
+        if not ids:
+            return []
+
+        with self.vector_store.reading():
+            results = self.collection.get(ids=ids)
+        found = {
+            results["ids"][i]: Document.from_dict({
+                "id": results["ids"][i],
+                "text": results["documents"][i],
+                "metadata": results["metadatas"][i]
+            })
+            for i in range(len(results["ids"]))
+        }
+        return [found[id] for id in ids if id in found]
+
+    def _cached(
+            self,
+            mode: str,
+            query: str,
+            limit: int,
+            search
+        ) -> list[Document]:
+        # Result-layer caching for searches that produce an ID ranking
+        if not self.query_cache:
+            return self.get_documents(search())
+
+        key = self.query_cache.result_key(query, limit, mode=mode)
+        ids = self.query_cache.get_results(key)
+        if ids is None:
+            ids = search()
+            self.query_cache.put_results(key, ids)
+        return self.get_documents(ids)
+
+    def warm_up(self) -> dict[str, float]:
+        """
+        Load the embedding model and the HNSW index, bypassing the embedding
+        and query caches so the first real query doesn't pay for either.
+
+        Returns:
+            Seconds spent on each step
+        """
+        embedding_function = self.embedding_function
+        if isinstance(embedding_function, CachedEmbeddingFunction):
+            # A cached vector would skip loading the model
+            embedding_function = embedding_function.embedding_function
+
+        start = time.perf_counter()
+        embedding = embedding_function(["warm up"])
+        embedded = time.perf_counter()
+        if self.collection.count():
+            self._query(embedding, 1)
+        queried = time.perf_counter()
+        return {
+            "embedding_model": embedded - start,
+            "vector_index": queried - embedded
+        }
+
+    def healthcheck(self):
+        """
+        Check if the service is healthy, with vector store statistics and
+        query cache counters.
+        """
+        status = super().healthcheck()
+        status["vector_store"] = self.vector_store.stats()
+        if self.query_cache:
+            status["query_cache"] = self.query_cache.stats()
+        return status
+
+    def _query(
+            self,
+            embedding,
+            limit: int,
+            filters: dict = None
+        ) -> list[Document]:
+        with self.vector_store.reading():
+            results = self.collection.query(
+                query_embeddings=embedding,
+                n_results=limit,
+                where=filters or None
+            )
         
         documents = []
         if results["ids"]:
@@ -0,0 +1,271 @@
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, Callable, Hashable, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """
+    Chunks produced so far by one in-flight stream, for every subscriber to
+    read from the start.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent streams in threaded servers.
+
+    The first subscriber for a key runs the stream and records each chunk;
+    subscribers that arrive while it runs replay the recorded chunks and
+    then receive new ones as they come. If the first subscriber disconnects,
+    its thread keeps the stream going for the others.
+    """
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.leaders = 0
+        self.followers = 0
+
+    def stream(
+            self,
+            key: Hashable,
+            produce: Callable[[], Iterator]
+        ) -> Iterator:
+        """
+        Stream the chunks of produce(), shared with identical requests.
+
+        Args:
+            key: Identity of the request
+            produce: Starts the stream when no identical request is running
+        """
+        return self.join(key, produce)[0]
+
+    def join(
+            self,
+            key: Hashable,
+            produce: Callable[[], Iterator]
+        ) -> tuple[Iterator, bool]:
+        """
+        Like stream, also telling whether an identical stream was already
+        running, in which case its chunks are replayed from the start.
+
+        Returns:
+            The stream, and whether it follows one that was already running
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+                self.leaders += 1
+            else:
+                self.followers += 1
+            flight.subscribers += 1
+
+        if leader:
+            return self._lead(key, flight, produce), False
+        return self._follow(flight), True
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "in_flight": len(self.flights),
+            "leaders": self.leaders,
+            "followers": self.followers
+        }
+
+    def _lead(
+            self,
+            key: Hashable,
+            flight: Flight,
+            produce: Callable[[], Iterator]
+        ) -> Iterator:
+        upstream = produce()
+        try:
+            for chunk in upstream:
+                self._append(flight, chunk)
+                yield chunk
+        except GeneratorExit:
+            with self.lock:
+                flight.subscribers -= 1
+                if not flight.subscribers:
+                    # Nobody else is listening, drop the stream
+                    self._finish(key, flight, ConnectionAbortedError("Stream abandoned"))
+                    raise
+            # Finish the stream for the other subscribers on this thread
+            try:
+                for chunk in upstream:
+                    self._append(flight, chunk)
+            except Exception as e:
+                self._complete(key, flight, e)
+            else:
+                self._complete(key, flight)
+            raise
+        except Exception as e:
+            self._complete(key, flight, e)
+            raise
+        else:
+            self._complete(key, flight)
+        finally:
+            close = getattr(upstream, "close", None)
+            if close:
+                close()
+
+    def _follow(self, flight: Flight) -> Iterator:
+        position = 0
+        try:
+            while True:
+                with self.lock:
+                    while position == len(flight.chunks) and not flight.done:
+                        self.condition.wait()
+                    chunks = flight.chunks[position:]
+                    done = flight.done
+                    error = flight.error
+                position += len(chunks)
+                yield from chunks
+                if done and position == len(flight.chunks):
+                    if error:
+                        raise error
+                    return
+        finally:
+            with self.lock:
+                flight.subscribers -= 1
+
+    def _append(self, flight: Flight, chunk):
+        with self.lock:
+            flight.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def _complete(self, key: Hashable, flight: Flight, error: Exception = None):
+        with self.lock:
+            self._finish(key, flight, error)
+
+    def _finish(self, key: Hashable, flight: Flight, error: Exception):
+        # Caller holds the lock; error is None when the stream ended normally
+        if flight.done:
+            return
+        flight.done = True
+        flight.error = error
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        self.condition.notify_all()
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces identical concurrent streams on an event loop.
+
+    Each stream runs in its own task and records its chunks; subscribers
+    replay them from the start. The task is cancelled once the last
+    subscriber has gone.
+    """
+    def __init__(self):
+        self.flights = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def stream(
+            self,
+            key: Hashable,
+            produce: Callable[[], AsyncIterator]
+        ) -> AsyncIterator:
+        """
+        Stream the chunks of produce(), shared with identical requests.
+        Call it on the event loop.
+
+        Args:
+            key: Identity of the request
+            produce: Starts the stream when no identical request is running
+        """
+        return self.join(key, produce)[0]
+
+    def join(
+            self,
+            key: Hashable,
+            produce: Callable[[], AsyncIterator]
+        ) -> tuple[AsyncIterator, bool]:
+        """
+        Like stream, also telling whether an identical stream was already
+        running, in which case its chunks are replayed from the start.
+
+        Returns:
+            The stream, and whether it follows one that was already running
+        """
+        entry = self.flights.get(key)
+        shared = entry is not None
+        if not shared:
+            flight = Flight()
+            changed = asyncio.Condition()
+            task = asyncio.create_task(self._run(key, flight, changed, produce))
+            entry = self.flights[key] = (flight, changed, task)
+            self.leaders += 1
+        else:
+            self.followers += 1
+        entry[0].subscribers += 1
+        return self._subscribe(key, entry), shared
+
+    async def _subscribe(self, key: Hashable, entry: tuple) -> AsyncIterator:
+        flight, changed, task = entry
+        position = 0
+        try:
+            while True:
+                async with changed:
+                    await changed.wait_for(lambda: position < len(flight.chunks) or flight.done)
+                chunks = flight.chunks[position:]
+                position += len(chunks)
+                for chunk in chunks:
+                    yield chunk
+                if flight.done and position == len(flight.chunks):
+                    if flight.error:
+                        raise flight.error
+                    return
+        finally:
+            flight.subscribers -= 1
+            if not flight.subscribers and not flight.done:
+                if self.flights.get(key) is entry:
+                    del self.flights[key]
+                task.cancel()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "in_flight": len(self.flights),
+            "leaders": self.leaders,
+            "followers": self.followers
+        }
+
+    async def _run(
+            self,
+            key: Hashable,
+            flight: Flight,
+            changed: asyncio.Condition,
+            produce: Callable[[], AsyncIterator]
+        ):
+        upstream = produce()
+        try:
+            async for chunk in upstream:
+                async with changed:
+                    flight.chunks.append(chunk)
+                    changed.notify_all()
+        except asyncio.CancelledError:
+            flight.error = ConnectionAbortedError("Stream abandoned")
+            raise
+        except Exception as e:
+            logger.debug("Shared stream failed: %s", e)
+            flight.error = e
+        finally:
+            close = getattr(upstream, "aclose", None)
+            if close:
+                await close()
+            entry = self.flights.get(key)
+            if entry is not None and entry[0] is flight:
+                del self.flights[key]
+            flight.done = True
+            async with changed:
+                changed.notify_all()
@@ -0,0 +1,240 @@
+import time
+import asyncio
+from contextlib import suppress
+from typing import AsyncIterator, Iterator
+import orjson
+from config import Config
+from .metrics import STREAM_EVENTS, STREAM_BYTES
+
+# Comment line; keeps proxies from closing an idle connection and is ignored by clients
+HEARTBEAT = b": keep-alive\n\n"
+
+class _Batch:
+    # Coalescing state of one response
+    def __init__(self, encoder: "SSEEncoder", offset: int):
+        self.encoder = encoder
+        self.parts = []
+        self.size = 0
+        # Characters of the answer up to the end of the buffer, used as event id
+        self.offset = 0
+        self.skip = offset
+        self.sent_any = False
+        self.buffered_at = None
+        self.written_at = time.monotonic()
+        self.events = 0
+        self.bytes = 0
+
+    def add(self, text: str) -> bytes:
+        # Buffer a chunk and return an event if one is due
+        if self.skip:
+            dropped = min(self.skip, len(text))
+            self.skip -= dropped
+            self.offset += dropped
+            text = text[dropped:]
+        if not text:
+            return None
+        if not self.parts:
+            self.buffered_at = time.monotonic()
+        self.parts.append(text)
+        self.size += len(text.encode())
+        self.offset += len(text)
+
+        encoder = self.encoder
+        if not self.sent_any:
+            # The first text goes out at once
+            return self.flush()
+        if encoder.coalesce_bytes and self.size >= encoder.coalesce_bytes:
+            return self.flush()
+        if encoder.coalesce_ms:
+            if time.monotonic() - self.buffered_at >= encoder.coalesce_ms / 1000:
+                return self.flush()
+            return None
+        # Without a time window only the size limit holds chunks back
+        return None if encoder.coalesce_bytes else self.flush()
+
+    def timeout(self) -> float:
+        # Seconds until tick has something to send, None when nothing will be
+        now = time.monotonic()
+        deadlines = []
+        if self.parts and self.encoder.coalesce_ms:
+            deadlines.append(self.buffered_at + self.encoder.coalesce_ms / 1000)
+        if self.encoder.heartbeat:
+            deadlines.append(self.written_at + self.encoder.heartbeat)
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - now)
+
+    def tick(self) -> bytes:
+        # Called when no chunk arrived in time
+        now = time.monotonic()
+        if self.parts and self.encoder.coalesce_ms and now - self.buffered_at >= self.encoder.coalesce_ms / 1000:
+            return self.flush()
+        if self.encoder.heartbeat and now - self.written_at >= self.encoder.heartbeat:
+            self.written_at = now
+            self.bytes += len(HEARTBEAT)
+            return HEARTBEAT
+        return None
+
+    def flush(self) -> bytes:
+        if not self.parts:
+            return None
+        frame = self.encoder.event({"text": "".join(self.parts)}, self.offset)
+        self.parts = []
+        self.size = 0
+        self.sent_any = True
+        self.written_at = time.monotonic()
+        self.events += 1
+        self.bytes += len(frame)
+        return frame
+
+    def record(self):
+        STREAM_EVENTS.observe(self.events)
+        STREAM_BYTES.observe(self.bytes)
+
+
+class SSEEncoder:
+    """
+    Turns a stream of text chunks into Server-Sent Events.
+
+    Every event carries `data: {"text": ...}` encoded with orjson and an id
+    equal to the number of answer characters sent so far, so a client that
+    reconnects with Last-Event-ID only receives the rest of a replayed
+    answer.
+
+    The first text is sent at once. After that, chunks are buffered until
+    `coalesce_bytes` bytes are waiting or the oldest has waited
+    `coalesce_ms`, whichever comes first, which cuts the number of writes
+    for models that stream a few characters at a time. A heartbeat comment
+    is sent when nothing was written for `heartbeat` seconds.
+
+    The async encoder does both on timers while the model is quiet. The
+    sync encoder checks them when the next chunk arrives, so a WSGI stream
+    needs no thread besides its own.
+    """
+    def __init__(
+            self,
+            coalesce_bytes: int = None,
+            coalesce_ms: float = None,
+            heartbeat: float = None
+        ):
+        """
+        Args:
+            coalesce_bytes: Buffered bytes of text that force an event, 0 for no limit
+            coalesce_ms: Longest a chunk waits in the buffer, 0 for no limit
+            heartbeat: Idle seconds before a heartbeat, 0 disables heartbeats
+        """
+        self.coalesce_bytes = Config.SSE_COALESCE_BYTES if coalesce_bytes is None else coalesce_bytes
+        self.coalesce_ms = Config.SSE_COALESCE_MS if coalesce_ms is None else coalesce_ms
+        self.heartbeat = Config.SSE_HEARTBEAT if heartbeat is None else heartbeat
+
+    @staticmethod
+    def event(data: dict, event_id: int = None) -> bytes:
+        """
+        Encode one event.
+        """
+        frame = b"data: " + orjson.dumps(data) + b"\n\n"
+        if event_id is not None:
+            frame = b"id: %d\n" % event_id + frame
+        return frame
+
+    @staticmethod
+    def parse_event_id(value: str) -> int:
+        """
+        Offset to resume from for a Last-Event-ID header, 0 when missing or invalid.
+        """
+        try:
+            return max(0, int(value))
+        except (TypeError, ValueError):
+            return 0
+
+    def encode(self, chunks: Iterator[str], offset: int = 0) -> Iterator[bytes]:
+        """
+        Encode a stream of text chunks. The stream is closed when encoding ends.
+
+        Args:
+            chunks: Text chunks of the answer
+            offset: Characters the client already has, from Last-Event-ID
+        """
+        batch = _Batch(self, offset)
+        try:
+            yield from self._encode(batch, chunks)
+        finally:
+            batch.record()
+
+    async def aencode(self, chunks: AsyncIterator[str], offset: int = 0) -> AsyncIterator[bytes]:
+        """
+        Async counterpart of encode.
+        """
+        batch = _Batch(self, offset)
+        frames = self._aencode(batch, chunks)
+        try:
+            async for frame in frames:
+                yield frame
+        finally:
+            await frames.aclose()
+            batch.record()
+
+    def _encode(self, batch: _Batch, chunks: Iterator[str]) -> Iterator[bytes]:
+        # Each stream already holds a WSGI thread; waiting for the model with
+        # a timeout would take a second one. Time-based flushes and
+        # heartbeats are instead checked as each chunk arrives
+        try:
+            for chunk in chunks:
+                frame = batch.add(chunk) or batch.tick()
+                if frame:
+                    yield frame
+        finally:
+            _close(chunks)
+        frame = batch.flush()
+        if frame:
+            yield frame
+
+    async def _aencode(self, batch: _Batch, chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+        if not self.coalesce_ms and not self.heartbeat:
+            try:
+                async for chunk in chunks:
+                    frame = batch.add(chunk)
+                    if frame:
+                        yield frame
+            finally:
+                await chunks.aclose()
+            frame = batch.flush()
+            if frame:
+                yield frame
+            return
+
+        pending = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(anext(chunks))
+                # asyncio.wait leaves the pending read alone on timeout
+                done, _ = await asyncio.wait({pending}, timeout=batch.timeout())
+                if not done:
+                    frame = batch.tick()
+                    if frame:
+                        yield frame
+                    continue
+                read, pending = pending, None
+                try:
+                    chunk = read.result()
+                except StopAsyncIteration:
+                    break
+                frame = batch.add(chunk)
+                if frame:
+                    yield frame
+        finally:
+            if pending is not None:
+                pending.cancel()
+                with suppress(asyncio.CancelledError, StopAsyncIteration):
+                    await pending
+            await chunks.aclose()
+        frame = batch.flush()
+        if frame:
+            yield frame
+
+
+def _close(chunks: Iterator[str]):
+    close = getattr(chunks, "close", None)
+    if close:
+        close()
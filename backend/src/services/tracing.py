@@ -0,0 +1,148 @@
+import logging
+import inspect
+import functools
+from typing import TYPE_CHECKING, Callable
+from flask import Flask, g, request
+from opentelemetry import trace, context, propagate
+from config import Config
+
+if TYPE_CHECKING:
+    from opentelemetry.sdk.trace.export import SpanExporter
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTERS = ("none", "console", "memory", "otlp")
+
+# Spans go nowhere until configure_tracing installs a provider
+TRACER = trace.get_tracer("wsp_rag_app")
+
+_exporter = None
+
+
+def configure_tracing(exporter: str = None) -> "SpanExporter":
+    """
+    Install the tracer provider for this process. Only the first call has
+    an effect.
+
+    Args:
+        exporter: One of TRACING_EXPORTERS, Config.TRACING_EXPORTER when not
+            given. "otlp" sends spans to OTEL_EXPORTER_OTLP_ENDPOINT, "console"
+            prints them and "memory" keeps them for inspection, both offline
+
+    Returns:
+        The span exporter, None when tracing is off
+    """
+    global _exporter
+    if _exporter is not None:
+        return _exporter
+    exporter = exporter or Config.TRACING_EXPORTER
+    if exporter == "none":
+        return None
+    if exporter not in TRACING_EXPORTERS:
+        raise ValueError(f"TRACING_EXPORTER must be one of {', '.join(TRACING_EXPORTERS)}")
+
+    # The SDK is only loaded when tracing is on; the API alone is a no-op
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    provider = TracerProvider(resource=Resource.create({"service.name": Config.TRACING_SERVICE_NAME}))
+    if exporter == "otlp":
+        # gRPC is only loaded when spans are sent somewhere
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        _exporter = OTLPSpanExporter()
+        provider.add_span_processor(BatchSpanProcessor(_exporter))
+    else:
+        _exporter = ConsoleSpanExporter() if exporter == "console" else InMemorySpanExporter()
+        provider.add_span_processor(SimpleSpanProcessor(_exporter))
+    trace.set_tracer_provider(provider)
+    logger.info("Tracing with the %s exporter", exporter)
+    return _exporter
+
+
+def in_current_context(func: Callable) -> Callable:
+    """
+    Bind func to the caller's trace context, so spans it starts on another
+    thread belong to the caller's trace. For a generator function the
+    context is attached around every step, so a generator consumed after
+    the request context is gone still belongs to the request's trace.
+    """
+    ctx = context.get_current()
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            iterator = func(*args, **kwargs)
+            try:
+                while True:
+                    token = context.attach(ctx)
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        context.detach(token)
+                    yield item
+            finally:
+                token = context.attach(ctx)
+                try:
+                    iterator.close()
+                finally:
+                    context.detach(token)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = context.attach(ctx)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            context.detach(token)
+    return wrapper
+
+
+def instrument_flask(app: Flask):
+    """
+    Open a server span for every Flask request, continuing a trace passed
+    in the traceparent header. The span ends when the request context is
+    torn down, or for a streamed response when the server closes it after
+    the last chunk. Bind the generator of a streamed response with
+    in_current_context so its spans stay children of the request span.
+    """
+    @app.before_request
+    def start_request_span():
+        rule = request.url_rule.rule if request.url_rule else request.path
+        span = TRACER.start_span(
+            f"{request.method} {rule}",
+            context=propagate.extract(request.headers),
+            kind=trace.SpanKind.SERVER,
+            attributes={"http.request.method": request.method, "http.route": rule}
+        )
+        g.request_span = span
+        g.request_span_token = context.attach(trace.set_span_in_context(span))
+
+    @app.after_request
+    def record_status(response):
+        span = g.get("request_span")
+        if span is not None:
+            span.set_attribute("http.response.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.set_status(trace.StatusCode.ERROR)
+            if response.is_streamed:
+                # The body is sent after the request context is torn down
+                g.request_span_ends_on_close = True
+                response.call_on_close(span.end)
+        return response
+
+    @app.teardown_request
+    def end_request_span(error):
+        span = g.pop("request_span", None)
+        if span is None:
+            return
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(trace.StatusCode.ERROR)
+        if not g.pop("request_span_ends_on_close", False):
+            span.end()
+        context.detach(g.pop("request_span_token"))
@@ -0,0 +1,233 @@
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+from config import Config
+from .query_cache import CollectionGeneration
+
+if TYPE_CHECKING:
+    import chromadb
+    from chromadb.api.models.Collection import Collection
+
+
+class ReadWriteLock:
+    """
+    Lock that admits many readers or one writer. Waiting writers block new
+    readers, so a steady stream of queries cannot starve ingestion.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+
+    @contextmanager
+    def reading(self):
+        with self.condition:
+            while self.writer or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer = False
+                self.condition.notify_all()
+
+
+class VectorStore:
+    """
+    Process-wide owner of the Chroma client for one persist directory.
+
+    Services get collection handles from here instead of opening their own
+    client, so a worker holds one copy of the client state and HNSW index
+    caches. Reads and writes go through a read-write lock, and every write
+    to a collection bumps that collection's generation so caches keyed on
+    it are invalidated.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, path: str = None) -> "VectorStore":
+        """
+        The shared store for a persist directory, opened on first use.
+
+        Args:
+            path: Chroma persist directory, CHROMA_PERSIST_DIRECTORY by default
+        """
+        path = os.path.abspath(path or Config.CHROMA_PERSIST_DIRECTORY)
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def __init__(
+            self,
+            path: str,
+            stats_ttl: float = None
+        ):
+        self.path = path
+        self.stats_ttl = Config.VECTOR_STORE_STATS_TTL if stats_ttl is None else stats_ttl
+        # Document counts and disk size from the last stats() that measured them
+        self.measured = None
+        self.measured_at = 0.0
+        self.stats_lock = threading.Lock()
+        self._client = None
+        self.client_open_seconds = None
+        self.collections = {}
+        self.generations = {}
+        self.open_seconds = {}
+        self.lock = ReadWriteLock()
+        self.handles_lock = threading.Lock()
+
+    @property
+    def client(self) -> "chromadb.ClientAPI":
+        """
+        The Chroma client, opened on first use so chromadb is only imported
+        once the store is needed.
+        """
+        with self.handles_lock:
+            return self._open_client()
+
+    def _open_client(self) -> "chromadb.ClientAPI":
+        # Caller holds handles_lock
+        if self._client is None:
+            import chromadb
+
+            start = time.perf_counter()
+            self._client = chromadb.PersistentClient(path=self.path)
+            self.client_open_seconds = time.perf_counter() - start
+        return self._client
+
+    def collection(self, name: str = "documents") -> "Collection":
+        """
+        Handle to a collection, created if it doesn't exist.
+        """
+        with self.handles_lock:
+            if name not in self.collections:
+                import chromadb.errors
+
+                client = self._open_client()
+                start = time.perf_counter()
+                try:
+                    self.collections[name] = client.get_or_create_collection(name)
+                except chromadb.errors.NotFoundError:
+                    self.collections[name] = client.create_collection(name)
+                self.open_seconds[name] = time.perf_counter() - start
+                self.generations.setdefault(name, CollectionGeneration())
+            return self.collections[name]
+
+    def generation(self, name: str = "documents") -> CollectionGeneration:
+        """
+        Write counter of a collection.
+        """
+        with self.handles_lock:
+            return self.generations.setdefault(name, CollectionGeneration())
+
+    @contextmanager
+    def reading(self):
+        """
+        Hold the store for a read. Any number of reads run together.
+        """
+        with self.lock.reading():
+            yield
+
+    @contextmanager
+    def writing(self, name: str = "documents"):
+        """
+        Hold the store exclusively for a write to a collection, bumping the
+        collection's generation once the write is done.
+        """
+        with self.lock.writing():
+            try:
+                yield
+            finally:
+                self.generation(name).bump()
+
+    def stats(self) -> dict:
+        """
+        Load times, sizes and memory use of the store.
+
+        Document counts and the size on disk take a query per collection
+        and a walk of the persist directory, so they are measured at most
+        once every stats_ttl seconds and reported with their age.
+        """
+        measured, measured_at = self._measure()
+        with self.handles_lock:
+            collections = {
+                name: {
+                    "count": measured["counts"].get(name),
+                    "generation": self.generations[name].current,
+                    "open_seconds": self.open_seconds[name]
+                }
+                for name in self.collections
+            }
+        return {
+            "path": self.path,
+            "client_open_seconds": self.client_open_seconds,
+            "disk_bytes": measured["disk_bytes"],
+            "measured_seconds_ago": time.monotonic() - measured_at,
+            "resident_memory_bytes": _resident_memory(),
+            "collections": collections
+        }
+
+    def _measure(self) -> tuple[dict, float]:
+        with self.stats_lock:
+            now = time.monotonic()
+            if self.measured is None or now - self.measured_at >= self.stats_ttl:
+                with self.handles_lock:
+                    collections = dict(self.collections)
+                # Counting reads the collections, so it must not overlap a write
+                with self.lock.reading():
+                    counts = {name: collection.count() for name, collection in collections.items()}
+                self.measured = {
+                    "counts": counts,
+                    "disk_bytes": _directory_size(self.path)
+                }
+                self.measured_at = now
+            return self.measured, self.measured_at
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _resident_memory() -> int:
+    # Current RSS where /proc is available, otherwise the peak RSS
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
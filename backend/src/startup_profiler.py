@@ -0,0 +1,158 @@
+import sys
+import time
+import logging
+import threading
+import importlib.abc
+from collections import defaultdict
+
+logger = logging.getLogger("startup")
+
+
+class _TimedLoader:
+    # Delegates to the real loader, timing module execution
+    def __init__(self, loader, profiler: "StartupProfiler", name: str):
+        self._loader = loader
+        self._profiler = profiler
+        self._name = name
+
+    def __getattr__(self, attribute):
+        return getattr(self._loader, attribute)
+
+    def exec_module(self, module):
+        self._profiler._enter()
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(self._name, time.perf_counter() - start)
+
+
+class StartupProfiler(importlib.abc.MetaPathFinder):
+    """
+    Measures where a cold start goes: the time each module takes to import,
+    how long create_app runs and the time until the first request.
+
+    Installed at the top of app.py when STARTUP_PROFILE is on, so every
+    import after it is timed like `python -X importtime` does. The report is
+    logged once the first request arrives.
+    """
+    def __init__(self, top: int = 20):
+        """
+        Args:
+            top: Modules and packages listed in the report
+        """
+        self.top = top
+        self.started = time.perf_counter()
+        self.app_ready = None
+        self.first_request = None
+        # Cumulative and self seconds per module
+        self.cumulative = {}
+        self.self_seconds = {}
+        # Imports in progress on each thread
+        self.local = threading.local()
+        self.lock = threading.RLock()
+
+    @classmethod
+    def install(cls, top: int = 20) -> "StartupProfiler":
+        profiler = cls(top)
+        sys.meta_path.insert(0, profiler)
+        return profiler
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self, name)
+        return spec
+
+    def app_created(self):
+        """
+        Mark the end of create_app and stop timing imports.
+        """
+        self.app_ready = time.perf_counter()
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def request_started(self):
+        """
+        Mark the first request and log the report. Later calls do nothing.
+        """
+        with self.lock:
+            if self.first_request is not None:
+                return
+            self.first_request = time.perf_counter()
+        logger.warning("%s", self.format_report())
+
+    def report(self) -> dict:
+        """
+        Startup timings, the slowest modules by cumulative import time and
+        the top-level packages by the import time spent in their own code.
+        """
+        packages = defaultdict(float)
+        for name, seconds in self.self_seconds.items():
+            packages[name.split(".")[0]] += seconds
+        slowest = sorted(self.cumulative.items(), key=lambda item: item[1], reverse=True)[:self.top]
+        heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:self.top]
+        return {
+            "import_seconds": sum(self.self_seconds.values()),
+            "create_app_seconds": self._since_start(self.app_ready),
+            "first_request_seconds": self._since_start(self.first_request),
+            "modules": slowest,
+            "packages": heaviest
+        }
+
+    def format_report(self) -> str:
+        report = self.report()
+        lines = [
+            "Startup profile",
+            f"  imports        {report['import_seconds']:.3f}s",
+            f"  create_app     {self._seconds(report['create_app_seconds'])}",
+            f"  first request  {self._seconds(report['first_request_seconds'])}",
+            "  packages by own import time:"
+        ]
+        lines += [f"    {seconds:8.3f}s  {name}" for name, seconds in report["packages"]]
+        lines.append("  modules by cumulative import time:")
+        lines += [f"    {seconds:8.3f}s  {name}" for name, seconds in report["modules"]]
+        return "\n".join(lines)
+
+    def _enter(self):
+        # Time spent importing children, subtracted from the parent's own time
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        self.local.stack.append(0.0)
+
+    def _exit(self, name: str, seconds: float):
+        stack = self.local.stack
+        children = stack.pop()
+        self.cumulative[name] = seconds
+        self.self_seconds[name] = seconds - children
+        if stack:
+            stack[-1] += seconds
+
+    def _since_start(self, moment: float) -> float:
+        return None if moment is None else moment - self.started
+
+    @staticmethod
+    def _seconds(value: float) -> str:
+        return "-" if value is None else f"{value:.3f}s"
+
+
+class FirstRequestMiddleware:
+    """
+    ASGI middleware telling the profiler about the first request, for
+    routes served outside Flask.
+    """
+    def __init__(self, app, profiler: StartupProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            self.profiler.request_started()
+        await self.app(scope, receive, send)
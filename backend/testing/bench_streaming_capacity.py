@@ -0,0 +1,155 @@
+"""
+Compare how many chat streams the Flask (WSGI) and ASGI paths can serve at
+once.
+
+Both servers stream ChatApproach responses from the simulated LLM backend,
+which waits --ttft seconds before the first chunk and --delay seconds
+between chunks, so the numbers reflect the serving model, not the model
+provider.
+The Flask app runs on a fixed pool of --threads threads, like a threaded
+gunicorn worker; the ASGI app runs on a single uvicorn event loop.
+
+    python bench_streaming_capacity.py --concurrency 8 32 128
+"""
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import httpx
+import uvicorn
+from flask import Flask, Response, request
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+
+from approaches.chatapproach import ChatApproach
+from services.llm_service import LLMService
+from services.llm_backend import SimulatedBackend
+from models.document import Document
+
+
+class StaticSearchService:
+    def search_documents(self, query, limit):
+        return [Document("Retrieved text", {"name": "bench.pdf"}, "1")]
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    Werkzeug server that handles requests on a fixed-size thread pool.
+    """
+    def __init__(self, host: str, port: int, app, threads: int):
+        super().__init__(host, port, app, handler=QuietRequestHandler)
+        self.pool = ThreadPoolExecutor(threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def flask_server(approach: ChatApproach, port: int, threads: int) -> PooledWSGIServer:
+    app = Flask(__name__)
+
+    @app.route("/rag/query", methods=["POST"])
+    def generate_llm_response():
+        query = request.json.get("query")
+        return Response(approach.run_with_streaming(query, history=[]), content_type="text/event-stream")
+
+    server = PooledWSGIServer("127.0.0.1", port, app, threads)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def asgi_server(approach: ChatApproach, port: int) -> uvicorn.Server:
+    async def generate_llm_response(request: Request):
+        query = (await request.json()).get("query")
+        stream = approach.arun_with_streaming(query, history=[])
+        return StreamingResponse(stream, media_type="text/event-stream")
+
+    app = Starlette(routes=[Route("/rag/query", generate_llm_response, methods=["POST"])])
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+async def run_clients(url: str, concurrency: int) -> dict:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=0)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+
+        async def one(i: int):
+            start = time.perf_counter()
+            first = None
+            chunks = 0
+            async with client.stream("POST", url, json={"query": f"question {i}"}) as response:
+                async for text in response.aiter_text():
+                    if first is None:
+                        first = time.perf_counter() - start
+                    chunks += text.count("\n\n")
+            return first, time.perf_counter() - start, chunks
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    ttfts = sorted(result[0] for result in results)
+    return {
+        "streams": concurrency,
+        "wall_seconds": round(wall, 3),
+        "streams_per_second": round(concurrency / wall, 1),
+        "ttft_p50": round(statistics.median(ttfts), 3),
+        "ttft_p95": round(ttfts[min(len(ttfts) - 1, int(len(ttfts) * 0.95))], 3),
+        "chunks": sum(result[2] for result in results)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--threads", type=int, default=8, help="Flask worker threads")
+    parser.add_argument("--chunks", type=int, default=20, help="Chunks per response")
+    parser.add_argument("--ttft", type=float, default=0.5, help="Seconds to first chunk")
+    parser.add_argument("--delay", type=float, default=0.05, help="Seconds between chunks")
+    parser.add_argument("--port", type=int, default=5101)
+    args = parser.parse_args()
+
+    backend = SimulatedBackend(ttft=args.ttft, token_delay=args.delay, tokens=args.chunks, error_rate=0, rate_limit=0)
+    approach = ChatApproach(StaticSearchService(), LLMService(backend, "simulated", "", context_cache_ttl=0))
+    approach.context_assembler = None
+
+    flask = flask_server(approach, args.port, args.threads)
+    asgi = asgi_server(approach, args.port + 1)
+    try:
+        for concurrency in args.concurrency:
+            for name, port in (("flask", args.port), ("asgi", args.port + 1)):
+                result = asyncio.run(run_clients(f"http://127.0.0.1:{port}/rag/query", concurrency))
+                print(json.dumps({"server": name, **result}))
+    finally:
+        flask.shutdown()
+        asgi.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
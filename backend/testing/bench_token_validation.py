@@ -0,0 +1,76 @@
+"""
+Measure access token validations per second, the check every chat and
+upload request runs.
+
+Three setups are compared on freshly generated keys:
+  reparsed_key  the public key is parsed and the signature verified on
+                every call, which is what validation used to cost
+  parsed_key    the key is parsed once, every call still verifies
+  cached        verified tokens are remembered until they expire
+
+--tokens distinct tokens are validated round robin, like that many signed
+in users.
+
+    python bench_token_validation.py --seconds 2 --tokens 100
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
+
+from services.jwt_service import JWTService
+from test_jwt_service import write_keys
+
+
+def reparsed_key(service: JWTService, token: str) -> str:
+    service.verification_key = load_pem_public_key(service.public_key)
+    return service.validate_token(token)
+
+
+def measure(validate, service: JWTService, tokens: list[str], seconds: float) -> dict:
+    calls = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for token in tokens:
+            if not validate(service, token):
+                raise RuntimeError("Token did not validate")
+        calls += len(tokens)
+    elapsed = time.perf_counter() - start
+    return {
+        "validations_per_second": round(calls / elapsed),
+        "microseconds_per_validation": round(elapsed / calls * 1e6, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2, help="Time spent on each setup")
+    parser.add_argument("--tokens", type=int, default=100, help="Distinct tokens validated")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_keys(directory)
+        uncached = JWTService(cache_size=0, key_directory=directory)
+        cached = JWTService(cache_size=args.tokens, key_directory=directory)
+
+    expires_at = datetime.now() + timedelta(hours=1)
+    tokens = [uncached.create_access_token(f"user{i}@example.com", expires_at) for i in range(args.tokens)]
+    setups = (
+        ("reparsed_key", reparsed_key, uncached),
+        ("parsed_key", JWTService.validate_token, uncached),
+        ("cached", JWTService.validate_token, cached)
+    )
+    for name, validate, service in setups:
+        print(json.dumps({"setup": name, **measure(validate, service, tokens, args.seconds)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import os
+import sys
+import asyncio
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import pytest
+from google.genai import errors
+from starlette.requests import ClientDisconnect
+
+from asgi import ClosingStreamingResponse
+from services.admission_controller import AdmissionController, AdmissionRejected
+from services.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT_SECONDS
+from test_chat_route import make_client
+
+
+def failing_stream(code: int):
+    yield b"partial"
+    raise errors.APIError(code, {"error": {"message": "slow down"}})
+
+
+def test_request_waits_for_a_released_slot():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+    first = controller.acquire()
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(controller.acquire()))
+    waiter.start()
+
+    while not controller.healthcheck()["queue_depth"]:
+        pass
+    first.release()
+    waiter.join(5)
+
+    assert admitted
+    health = controller.healthcheck()
+    assert (health["active"], health["admitted"], health["queue_depth"]) == (1, 2, 0)
+
+
+def test_queue_depth_in_flight_and_wait_are_exported():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+    waits_before = ADMISSION_WAIT_SECONDS.snapshot().get("[]", [0])[-1]
+    first = controller.acquire()
+    waiter = threading.Thread(target=controller.acquire)
+    waiter.start()
+
+    while not controller.healthcheck()["queue_depth"]:
+        pass
+    assert ADMISSION_QUEUE_DEPTH.snapshot() == {"[]": 1}
+    assert ADMISSION_IN_FLIGHT.snapshot() == {"[]": 1}
+
+    first.release()
+    waiter.join(5)
+
+    assert ADMISSION_QUEUE_DEPTH.snapshot() == {"[]": 0}
+    assert ADMISSION_IN_FLIGHT.snapshot() == {"[]": 1}
+    # The queued request's wait is observed on top of the immediate admission
+    assert ADMISSION_WAIT_SECONDS.snapshot()["[]"][-1] > waits_before
+
+
+def test_full_queue_is_rejected_with_429():
+    controller = AdmissionController(max_concurrency=1, max_queue=0, queue_timeout=5)
+    controller.acquire()
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire()
+
+    assert rejected.value.status_code == 429
+    assert rejected.value.retry_after == 5
+    assert controller.healthcheck()["rejected"]["queue_full"] == 1
+
+
+def test_expired_wait_is_rejected_with_503():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+    controller.acquire()
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire()
+
+    assert rejected.value.status_code == 503
+    health = controller.healthcheck()
+    assert health["rejected"]["timeout"] == 1
+    assert health["queue_depth"] == 0
+
+
+def test_upstream_throttling_halves_the_limit_and_success_raises_it():
+    controller = AdmissionController(max_concurrency=8, max_queue=0, queue_timeout=1, max_backoff=60)
+
+    with pytest.raises(errors.APIError):
+        list(controller.track(failing_stream(429), controller.acquire()))
+
+    health = controller.healthcheck()
+    assert (health["limit"], health["active"], health["upstream_throttled"]) == (4, 0, 1)
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire()
+    assert rejected.value.status_code == 503
+    assert controller.healthcheck()["rejected"]["backoff"] == 1
+
+    controller.paused_until = 0.0
+    list(controller.track(iter([b"answer"]), controller.acquire()))
+    assert controller.healthcheck()["limit"] == 5
+
+
+def test_other_upstream_errors_leave_the_limit_alone():
+    controller = AdmissionController(max_concurrency=8, max_queue=0, queue_timeout=1)
+
+    with pytest.raises(errors.APIError):
+        list(controller.track(failing_stream(500), controller.acquire()))
+
+    assert controller.healthcheck()["limit"] == 8
+
+
+def test_flask_stream_that_never_ran_releases_its_slot_on_close():
+    client = make_client()
+    controller = AdmissionController(max_concurrency=1, max_queue=0, queue_timeout=1)
+    client.application.config["ADMISSION_CONTROLLER"] = controller
+
+    response = client.post("/rag/query", json={"query": "question", "history": []})
+    assert controller.healthcheck()["active"] == 1
+    # The client went away before the body was read
+    response.close()
+
+    assert controller.healthcheck()["active"] == 0
+
+
+def test_asgi_stream_releases_its_slot_when_the_client_disconnects():
+    controller = AdmissionController(max_concurrency=1, max_queue=0, queue_timeout=1)
+    slot = controller.acquire()
+
+    async def chunks():
+        yield b"never sent"
+
+    async def send(message):
+        raise OSError("connection reset")
+
+    response = ClosingStreamingResponse(controller.atrack(chunks(), slot), media_type="text/event-stream")
+    response.call_on_close(slot.release)
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(response(scope, None, send))
+
+    assert controller.healthcheck()["active"] == 0
@@ -0,0 +1,98 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models.base_model import Base
+from models.cached_answer import CachedAnswer
+from models.document import Document
+from services.answer_cache import AnswerCache
+
+
+def make_cache(max_entries: int = 10) -> AnswerCache:
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return AnswerCache(sessionmaker(bind=engine), ttl=3600, max_entries=max_entries)
+
+
+def documents(*ids: str) -> list[Document]:
+    return [Document("text", {"name": f"{id}.pdf"}, id) for id in ids]
+
+
+def test_stored_answer_is_a_hit():
+    cache = make_cache()
+    key = AnswerCache.key("What is a pump?", ["1"], [], "gemini", "prompt")
+    assert cache.get(key) is None
+
+    cache.put(key, ["A pump ", "moves fluid."], documents("1"))
+
+    assert cache.get(key) == ["A pump ", "moves fluid."]
+    health = cache.healthcheck()
+    assert health["status"] == "ok"
+    assert (health["entries"], health["hits"], health["misses"]) == (1, 1, 1)
+
+
+def test_keys_follow_the_normalized_query_and_the_retrieved_chunks():
+    key = AnswerCache.key("What is a pump?", ["1"], [], "gemini", "prompt")
+
+    assert AnswerCache.key("  what is a PUMP? ", ["1"], [], "gemini", "prompt") == key
+    assert AnswerCache.key("What is a pump?", ["2"], [], "gemini", "prompt") != key
+
+
+def test_expired_answer_is_a_miss_and_removed():
+    cache = make_cache()
+    cache.put("key", ["answer"], documents("1"))
+    with cache.session_factory() as session:
+        session.execute(update(CachedAnswer).values(expires_at=datetime.now() - timedelta(seconds=1)))
+        session.commit()
+
+    assert cache.get("key") is None
+    with cache.session_factory() as session:
+        assert session.get(CachedAnswer, "key") is None
+
+
+def test_least_recently_used_answer_is_evicted():
+    cache = make_cache(max_entries=2)
+    cache.put("first", ["1"], documents("1"))
+    cache.put("second", ["2"], documents("2"))
+    cache.get("first")
+
+    cache.put("third", ["3"], documents("3"))
+
+    assert cache.get("second") is None
+    assert cache.get("first") == ["1"]
+    assert cache.get("third") == ["3"]
+
+
+def test_writes_to_a_source_drop_the_answers_citing_it():
+    cache = make_cache()
+    cache.put("a", ["from a"], documents("a1"))
+    cache.put("ab", ["from a and b"], [Document("text", {"name": "a.pdf"}, "a2"), *documents("b1")])
+    cache.put("b", ["from b"], documents("b1"))
+
+    assert cache.invalidate_sources(["a.pdf", "a1.pdf"]) == 2
+    assert cache.invalidate_documents(["b1"]) == 1
+    assert [cache.get(key) for key in ("a", "ab", "b")] == [None, None, None]
+
+
+def test_database_errors_are_reported_by_the_health_check():
+    cache = make_cache()
+    Base.metadata.drop_all(bind=cache.session_factory.kw["bind"])
+
+    health = cache.healthcheck()
+
+    assert health["status"] == "error"
+    assert "cached_answer" in health["error"]
+
+
+def test_invalidation_survives_database_errors():
+    cache = make_cache()
+    Base.metadata.drop_all(bind=cache.session_factory.kw["bind"])
+
+    assert cache.invalidate_documents(["1"]) == 0
+    assert cache.invalidate_sources(["a.pdf"]) == 0
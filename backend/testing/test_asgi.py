@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from starlette.testclient import TestClient
+
+from asgi import create_asgi_app
+from test_chat_route import make_client
+
+
+def make_asgi_client() -> TestClient:
+    flask_client = make_client()
+    client = TestClient(create_asgi_app(flask_client.application))
+    client.cookies.set("access_token", flask_client.get_cookie("access_token").value)
+    return client
+
+
+def events(body: str) -> list[dict]:
+    # Data of each event in a Server-Sent Events stream
+    return [
+        json.loads(line[len("data: "):])
+        for frame in body.split("\n\n") if frame
+        for line in frame.split("\n") if line.startswith("data: ")
+    ]
+
+
+def test_query_without_a_valid_token_is_rejected():
+    client = make_asgi_client()
+
+    client.cookies.set("access_token", "not-a-token")
+    invalid = client.post("/rag/query", json={"query": "question", "history": []})
+    client.cookies.clear()
+    missing = client.post("/rag/query", json={"query": "question", "history": []})
+
+    assert [invalid.status_code, missing.status_code] == [401, 401]
+    assert missing.json() == {"error": "Authentication token is missing"}
+
+
+def test_query_streams_server_sent_events():
+    client = make_asgi_client()
+
+    response = client.post("/rag/query", json={"query": "question", "history": []})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = [frame for frame in response.text.split("\n\n") if frame]
+    assert frames
+    assert all(frame.startswith("id: ") and "\ndata: " in frame for frame in frames)
+    assert "".join(event["text"] for event in events(response.text) if "text" in event)
+
+
+def test_conversations_of_other_users_are_not_found():
+    client = make_asgi_client()
+    conversation_service = client.app.state.flask_app.config["CONVERSATION_SERVICE"]
+    other = conversation_service.create("someone@example.com")
+
+    response = client.post("/rag/query", json={"query": "question", "conversation_id": other.id})
+
+    assert response.status_code == 404
+    assert conversation_service.get_history(other.id, "someone@example.com") == []
+
+
+def test_new_conversation_id_is_returned_in_a_header():
+    client = make_asgi_client()
+    conversation_service = client.app.state.flask_app.config["CONVERSATION_SERVICE"]
+
+    response = client.post("/rag/query", json={"query": "question", "conversation_id": ""})
+
+    conversation_id = response.headers["X-Conversation-Id"]
+    assert conversation_service.get(conversation_id, "user@example.com") is not None
+
+
+def test_other_routes_are_served_by_flask():
+    client = make_asgi_client()
+
+    created = client.post("/conversations")
+    read = client.get(f"/conversations/{created.json()['conversation_id']}")
+
+    assert [created.status_code, read.status_code] == [201, 200]
+    assert client.get("/no-such-route").status_code == 404
@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from services.llm_service import LLMService
+from services.llm_backend import GeminiBackend
+from approaches.chatapproach import ChatApproach
+from models.document import Document
+
+
+class FakeAsyncModels:
+    def __init__(self, chunks, delay):
+        self.chunks = chunks
+        self.delay = delay
+        self.calls = []
+
+    async def generate_content_stream(self, model, contents, config):
+        self.calls.append({"model": model, "contents": contents, "config": config})
+
+        async def stream():
+            for text in self.chunks:
+                await asyncio.sleep(self.delay)
+                yield SimpleNamespace(text=text)
+
+        return stream()
+
+
+class FakeAsyncClient:
+    def __init__(self, chunks=("Hello", " world"), delay=0.0):
+        self.aio = SimpleNamespace(models=FakeAsyncModels(chunks, delay))
+
+
+class FakeSearchService:
+    def __init__(self):
+        self.threads = []
+
+    def search_documents(self, query, limit):
+        self.threads.append(threading.current_thread())
+        return [Document("Retrieved text", {"name": "a.pdf"}, "1")]
+
+
+def make_approach(client):
+    search_service = FakeSearchService()
+    llm_service = LLMService(GeminiBackend(client), "gemini-test", "Be brief.", context_cache_ttl=0)
+    return ChatApproach(search_service, llm_service), search_service
+
+
+async def collect(generator):
+    return [chunk async for chunk in generator]
+
+
+def events(frames):
+    # Data of each event in a Server-Sent Events stream
+    return [
+        json.loads(line[len("data: "):])
+        for event in b"".join(frames).decode().split("\n\n")
+        for line in event.splitlines()
+        if line.startswith("data: ")
+    ]
+
+
+def texts(frames):
+    # Text of each data event in a Server-Sent Events stream
+    return [event["text"] for event in events(frames) if "text" in event]
+
+
+class FakeAnswerCache:
+    key = staticmethod(lambda *parts: "key")
+
+    def __init__(self, answer=None):
+        self.answer = answer
+
+    def get(self, key):
+        return self.answer
+
+    def put(self, key, chunks, documents):
+        pass
+
+
+class FakeConversationService:
+    def __init__(self):
+        self.turns = []
+
+    def get_history(self, conversation_id, user_id):
+        return []
+
+    def add_turn(self, conversation_id, user_id, query, answer):
+        self.turns.append((query, answer))
+
+
+def test_aquery_streams_from_async_client():
+    client = FakeAsyncClient()
+    service = LLMService(GeminiBackend(client), "gemini-test", "Be brief.", context_cache_ttl=0)
+
+    chunks = asyncio.run(collect(service.aquery("question", [Document("doc", {}, "1")])))
+
+    assert chunks == ["Hello", " world"]
+    call = client.aio.models.calls[0]
+    assert call["model"] == "gemini-test"
+    assert call["contents"][-1].parts[0].text == "question"
+
+
+def test_arun_with_streaming_searches_off_the_event_loop():
+    client = FakeAsyncClient()
+    approach, search_service = make_approach(client)
+
+    chunks = asyncio.run(collect(approach.arun_with_streaming("question", retrieval_mode="vector")))
+
+    assert texts(chunks) == ["Hello", " world"]
+    assert chunks[0] == b'id: 5\ndata: {"text":"Hello"}\n\n'
+    assert search_service.threads[0] is not threading.main_thread()
+    assert client.aio.models.calls[0]["contents"][1].parts[0].text == "Retrieved text"
+
+
+def test_slow_streams_share_one_thread():
+    # 50 streams of 5 chunks at 20ms each finish in about 100ms, not 5s
+    client = FakeAsyncClient(chunks=("a", "b", "c", "d", "e"), delay=0.02)
+    approach, _ = make_approach(client)
+
+    async def run_all():
+        return await asyncio.gather(*(
+            collect(approach.arun_with_streaming(f"question {i}", retrieval_mode="vector"))
+            for i in range(50)
+        ))
+
+    start = time.perf_counter()
+    results = asyncio.run(run_all())
+    elapsed = time.perf_counter() - start
+
+    assert all("".join(texts(chunks)) == "abcde" for chunks in results)
+    assert elapsed < 1.0
+
+
+def test_resume_of_a_new_answer_resets_the_client():
+    client = FakeAsyncClient()
+    approach, _ = make_approach(client)
+    approach.conversation_service = FakeConversationService()
+
+    chunks = asyncio.run(collect(approach.arun_with_streaming(
+        "question", retrieval_mode="vector", conversation_id="c", user_id="u", resume_from=5
+    )))
+
+    assert chunks[0] == b'id: 0\ndata: {"reset":true}\n\n'
+    assert texts(chunks) == ["Hello", " world"]
+    # The request being resumed records the turn, not the reconnect
+    assert approach.conversation_service.turns == []
+
+
+def test_resume_of_a_cached_answer_skips_what_the_client_has():
+    client = FakeAsyncClient()
+    approach, _ = make_approach(client)
+    approach.answer_cache = FakeAnswerCache(["Hello", " world"])
+
+    chunks = asyncio.run(collect(approach.arun_with_streaming("question", retrieval_mode="vector", resume_from=5)))
+
+    assert texts(chunks) == [" world"]
+    assert client.aio.models.calls == []
+
+
+def test_resume_follows_a_running_shared_stream():
+    client = FakeAsyncClient(chunks=("a", "b", "c"), delay=0.02)
+    approach, _ = make_approach(client)
+
+    async def run_both():
+        first = asyncio.ensure_future(collect(approach.arun_with_streaming("question", retrieval_mode="vector")))
+        await asyncio.sleep(0.03)
+        resumed = await collect(approach.arun_with_streaming("question", retrieval_mode="vector", resume_from=1))
+        return await first, resumed
+
+    first, resumed = asyncio.run(run_both())
+
+    assert "".join(texts(first)) == "abc"
+    assert {"reset": True} not in events(resumed)
+    assert "".join(texts(resumed)) == "bc"
+    assert len(client.aio.models.calls) == 1
+
+
+def test_sync_resume_of_a_new_answer_resets_the_client():
+    client = SimpleNamespace(models=SimpleNamespace(
+        generate_content_stream=lambda model, contents, config: iter([SimpleNamespace(text="Hello")])
+    ))
+    approach, _ = make_approach(client)
+
+    chunks = list(approach.run_with_streaming("question", retrieval_mode="vector", resume_from=3))
+
+    assert events(chunks) == [{"reset": True}, {"text": "Hello"}]
@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models.document import Document
+from services import bm25_index
+from services.bm25_index import BM25Index, tokenize
+from services.vector_store import VectorStore
+from services.document_service import DocumentService
+
+
+def segments(directory: str) -> list[str]:
+    return [name for name in os.listdir(directory) if name.startswith("segment-")]
+
+
+def test_tokenize_keeps_compounds_and_their_parts():
+    assert tokenize("Replace the XJ-900 pump") == ["replace", "the", "xj-900", "xj", "900", "pump"]
+
+
+def test_rare_terms_rank_higher():
+    with tempfile.TemporaryDirectory() as directory:
+        index = BM25Index(directory)
+        index.add(
+            ["common", "rare", "none"],
+            ["the pump and the valve", "the hydraulic pump", "the valve"]
+        )
+
+        results = index.search("hydraulic pump")
+
+        assert [id for id, _ in results] == ["rare", "common"]
+        assert results[0][1] > results[1][1]
+
+
+def test_saved_index_loads_with_the_same_scores():
+    with tempfile.TemporaryDirectory() as directory:
+        index = BM25Index(directory)
+        index.add(["1", "2"], ["hydraulic pump", "fuel pump"])
+        before = index.search("pump")
+        index.save()
+        index.add(["3"], ["pump pump pump"])
+
+        reloaded = BM25Index(directory)
+
+        assert reloaded.ids() == {"1", "2"}
+        assert reloaded.search("pump") == before
+
+
+def test_removed_documents_are_dropped_on_save():
+    with tempfile.TemporaryDirectory() as directory:
+        index = BM25Index(directory)
+        index.add(["1", "2"], ["hydraulic pump", "fuel pump"])
+        index.save()
+        index.remove(["1"])
+
+        assert [id for id, _ in index.search("pump")] == ["2"]
+        index.save()
+        assert BM25Index(directory).ids() == {"2"}
+
+
+def test_index_stays_usable_while_a_segment_is_written(monkeypatch):
+    with tempfile.TemporaryDirectory() as directory:
+        index = BM25Index(directory)
+        index.add(["1", "2"], ["hydraulic pump", "fuel pump"])
+        writing, resume = threading.Event(), threading.Event()
+        save = bm25_index.np.save
+
+        def slow_save(*args):
+            writing.set()
+            resume.wait(5)
+            save(*args)
+
+        monkeypatch.setattr(bm25_index.np, "save", slow_save)
+        saver = threading.Thread(target=index.save)
+        saver.start()
+        assert writing.wait(5)
+
+        # Neither blocks on the save in progress
+        index.add(["3"], ["pump pump pump"])
+        index.remove(["2"])
+        assert index.ids() == {"1", "3"}
+        during = index.search("pump")
+        assert saver.is_alive()
+        resume.set()
+        saver.join(5)
+
+        assert index.segment == "segment-1"
+        assert index.search("pump") == during
+        monkeypatch.setattr(bm25_index.np, "save", save)
+        index.save()
+        assert BM25Index(directory).ids() == {"1", "3"}
+        assert segments(directory) == ["segment-2"]
+
+
+def test_removed_document_can_be_added_again_before_a_save():
+    with tempfile.TemporaryDirectory() as directory:
+        index = BM25Index(directory)
+        index.add(["1"], ["hydraulic pump"])
+        index.remove(["1"])
+
+        assert index.add(["1"], ["hydraulic pump"]) == 1
+        index.save()
+        assert [id for id, _ in BM25Index(directory).search("pump")] == ["1"]
+
+
+def test_save_later_folds_changes_into_one_segment():
+    with tempfile.TemporaryDirectory() as directory:
+        index = BM25Index(directory, save_delay=0.1)
+        for id in range(5):
+            index.add([str(id)], ["pump"])
+            index.save_later()
+        assert segments(directory) == []
+
+        time.sleep(0.5)
+
+        assert len(segments(directory)) == 1
+        assert BM25Index(directory).ids() == {"0", "1", "2", "3", "4"}
+
+
+def test_sync_restores_what_an_unsaved_delta_lost():
+    with tempfile.TemporaryDirectory() as directory:
+        index = BM25Index(os.path.join(directory, "bm25"))
+        service = DocumentService(
+            embedding_function=lambda texts: [[float(len(text)), 1.0] for text in texts],
+            keyword_index=index,
+            vector_store=VectorStore(os.path.join(directory, "chroma")),
+            deduplicate=False
+        )
+        service.add_documents([Document("hydraulic pump", {"name": "a.pdf"}, "1"), Document("fuel pump", {"name": "a.pdf"}, "2")])
+        # Indexed but never saved, then the process went away
+        restarted = BM25Index(os.path.join(directory, "bm25"))
+        restarted.add(["gone"], ["pump"])
+        restarted.save()
+        service.keyword_index = restarted
+
+        assert service.sync_keyword_index() == {"added": 2, "removed": 1}
+        assert BM25Index(os.path.join(directory, "bm25")).ids() == {"1", "2"}
+        assert service.sync_keyword_index() == {"added": 0, "removed": 0}
@@ -0,0 +1,115 @@
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from blueprints.api.routes import api_bp
+from approaches.chatapproach import ChatApproach
+from models.base_model import Base
+from services.conversation_service import ConversationService
+from services.jwt_service import JWTService
+from services.llm_service import LLMService
+from services.llm_backend import SimulatedBackend
+from services.tracing import configure_tracing, instrument_flask
+from models.document import Document
+from test_jwt_service import write_keys
+
+exporter = configure_tracing("memory")
+
+
+class StaticSearchService:
+    def search_documents(self, query, limit, filters=None):
+        return [Document("Retrieved text", {"name": "test.pdf"}, "1")]
+
+
+def make_client():
+    with tempfile.TemporaryDirectory() as directory:
+        write_keys(directory)
+        JWTService._shared = JWTService(key_directory=directory)
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    conversation_service = ConversationService(session_factory)
+    backend = SimulatedBackend(ttft=0, token_delay=0, tokens=5, error_rate=0, rate_limit=0)
+    approach = ChatApproach(
+        StaticSearchService(),
+        LLMService(backend, "simulated", "", context_cache_ttl=0),
+        conversation_service=conversation_service
+    )
+
+    app = Flask(__name__)
+    instrument_flask(app)
+    app.register_blueprint(api_bp)
+    app.config["SESSION_LOCAL"] = session_factory
+    app.config["CHAT_APPROACH"] = approach
+    app.config["CONVERSATION_SERVICE"] = conversation_service
+    client = app.test_client()
+    token = JWTService.shared().create_access_token("user@example.com", datetime.now() + timedelta(minutes=5))
+    client.set_cookie("access_token", token)
+    return client
+
+
+def test_query_streams_events_with_the_request_span_as_parent():
+    client = make_client()
+    exporter.clear()
+
+    response = client.post("/rag/query", json={"query": "question", "history": []})
+    body = response.get_data()
+    # As the WSGI server does once the body is sent
+    response.close()
+
+    assert response.status_code == 200
+    assert response.content_type == "text/event-stream"
+    assert body.startswith(b"id: ")
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    request_span = spans["POST /rag/query"]
+    assert spans["llm.generate"].parent.span_id == request_span.context.span_id
+    # The request span covers the whole stream
+    assert request_span.end_time >= spans["llm.generate"].end_time
+
+
+def test_conversations_of_other_users_are_not_found():
+    client = make_client()
+    conversation_service = client.application.config["CONVERSATION_SERVICE"]
+    other = conversation_service.create("someone@example.com")
+
+    query = client.post("/rag/query", json={"query": "question", "conversation_id": other.id})
+    read = client.get(f"/conversations/{other.id}")
+    removed = client.delete(f"/conversations/{other.id}")
+
+    assert [query.status_code, read.status_code, removed.status_code] == [404, 404, 404]
+    assert conversation_service.get(other.id, "someone@example.com") is not None
+
+
+def test_sync_routes_accept_the_access_token_and_the_old_cookie_name():
+    client = make_client()
+    token = client.get_cookie("access_token").value
+
+    created = client.post("/conversations")
+    client.delete_cookie("access_token")
+    client.set_cookie("auth_token", token)
+    created_with_old_name = client.post("/conversations")
+    client.delete_cookie("auth_token")
+    missing = client.post("/conversations")
+
+    assert [created.status_code, created_with_old_name.status_code, missing.status_code] == [201, 201, 401]
+
+
+def test_a_new_conversation_keeps_the_turn():
+    client = make_client()
+    conversation_service = client.application.config["CONVERSATION_SERVICE"]
+
+    response = client.post("/rag/query", json={"query": "question", "conversation_id": ""})
+    response.get_data()
+    response.close()
+
+    conversation_id = response.headers["X-Conversation-Id"]
+    history = conversation_service.get_history(conversation_id, "user@example.com")
+    assert [message["role"] for message in history] == ["user", "model"]
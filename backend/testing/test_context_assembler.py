@@ -0,0 +1,61 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models.document import Document
+from services.context_assembler import ContextAssembler
+from services.pdf_parser import PDFParser
+
+
+TEXT = " ".join(f"word{number}" for number in range(600))
+
+
+def chunks(name: str = "a.pdf", page_no: int = 0) -> list[Document]:
+    return [
+        Document(text, {"name": name, "page_no": page_no, "chunk_no": chunk_no}, f"{name}-{page_no}-{chunk_no}")
+        for chunk_no, text in enumerate(PDFParser(max_workers=0).chunk_text(TEXT))
+    ]
+
+
+def test_adjacent_chunks_are_merged_without_the_overlap():
+    page = chunks()
+
+    assembled = ContextAssembler().assemble([page[1], page[0], page[2]])
+
+    assert len(assembled) == 1
+    assert assembled[0].text == " ".join(TEXT.split()[:440])
+    assert assembled[0].id == page[1].id
+    assert assembled[0].metadata["chunk_no"] == 0
+    assert assembled[0].metadata["chunk_end"] == 2
+    assert assembled[0].metadata["merged_ids"] == [page[0].id, page[1].id, page[2].id]
+
+
+def test_merged_span_takes_the_rank_of_its_best_chunk():
+    page = chunks()
+    other = chunks("b.pdf")[0]
+
+    assembled = ContextAssembler().assemble([other, page[3], page[0], page[2]])
+
+    assert [document.id for document in assembled] == [other.id, page[3].id, page[0].id]
+    assert assembled[1].metadata["merged_ids"] == [page[2].id, page[3].id]
+
+
+def test_chunks_from_other_pages_or_without_positions_are_kept():
+    first_page = chunks(page_no=0)
+    second_page = chunks(page_no=1)
+    plain = Document("no position", {"name": "a.pdf"}, "plain")
+
+    documents = [first_page[0], second_page[1], plain]
+    assembled = ContextAssembler().assemble(documents)
+
+    assert assembled == documents
+
+
+def test_overlap_that_differs_from_the_default_is_still_removed():
+    first = Document("a b c d", {"name": "a.pdf", "page_no": 0, "chunk_no": 0}, "1")
+    second = Document("c d e f", {"name": "a.pdf", "page_no": 0, "chunk_no": 1}, "2")
+
+    assembled = ContextAssembler(overlap=80).assemble([first, second])
+
+    assert assembled[0].text == "a b c d e f"
@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from models.base_model import Base
+from models.conversation import ConversationMessage
+from services.conversation_service import ConversationService, SUMMARY_PREFIX
+
+
+def make_session_factory(directory: str):
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'test.db')}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def test_conversations_are_only_visible_to_their_owner():
+    with tempfile.TemporaryDirectory() as directory:
+        service = ConversationService(make_session_factory(directory))
+        conversation = service.create("alice")
+        assert service.add_turn(conversation.id, "alice", "question", "answer")
+
+        assert service.get(conversation.id, "bob") is None
+        assert service.get_history(conversation.id, "bob") == []
+        assert not service.add_turn(conversation.id, "bob", "other question", "other answer")
+        assert not service.delete(conversation.id, "bob")
+
+        assert service.get_history(conversation.id, "alice") == [
+            {"role": "user", "text": "question"},
+            {"role": "model", "text": "answer"}
+        ]
+        assert service.delete(conversation.id, "alice")
+        assert service.get(conversation.id, "alice") is None
+
+
+def test_turns_recorded_at_once_get_distinct_positions():
+    with tempfile.TemporaryDirectory() as directory:
+        session_factory = make_session_factory(directory)
+        service = ConversationService(session_factory)
+        conversation = service.create("alice")
+        start = threading.Barrier(8)
+
+        def add(i):
+            start.wait()
+            service.add_turn(conversation.id, "alice", f"question {i}", f"answer {i}")
+
+        threads = [threading.Thread(target=add, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with session_factory() as session:
+            positions = session.scalars(
+                select(ConversationMessage.position).where(ConversationMessage.conversation_id == conversation.id)
+            ).all()
+        assert sorted(positions) == list(range(16))
+
+
+def test_older_messages_are_folded_into_the_summary():
+    summarized = []
+
+    def summarize(summary, messages):
+        summarized.append(messages)
+        return summary + " " + " ".join(message["text"] for message in messages)
+
+    with tempfile.TemporaryDirectory() as directory:
+        service = ConversationService(
+            make_session_factory(directory), summarize=summarize, compact_tokens=10, keep_messages=2
+        )
+        conversation = service.create("alice")
+        for i in range(3):
+            service.add_turn(conversation.id, "alice", f"question {i} " * 5, f"answer {i} " * 5)
+        # Let the background compactions finish
+        service.executor.submit(lambda: None).result()
+
+        history = service.get_history(conversation.id, "alice")
+        service.shutdown()
+
+    assert summarized
+    assert history[0]["text"].startswith(SUMMARY_PREFIX)
+    assert "question 0" in history[0]["text"]
+    # The last messages are kept as they are
+    assert history[1:] == [
+        {"role": "user", "text": "question 2 " * 5},
+        {"role": "model", "text": "answer 2 " * 5}
+    ]
@@ -0,0 +1,114 @@
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from werkzeug.datastructures import FileStorage
+
+from models.document import Document
+from services.vector_store import VectorStore
+from services.document_service import DocumentService
+from test_pdf_parser import make_pdf
+
+
+class RecordingEmbeddingFunction:
+    def __init__(self, fail_calls=()):
+        self.calls = []
+        self.fail_calls = fail_calls
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        if len(self.calls) in self.fail_calls:
+            raise RuntimeError("embedding service unavailable")
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def make_service(directory: str, embedding_function, batch_size: int = 2) -> DocumentService:
+    return DocumentService(
+        batch_size=batch_size,
+        deduplicate=False,
+        embedding_function=embedding_function,
+        vector_store=VectorStore(directory)
+    )
+
+
+def upload(pages: int) -> FileStorage:
+    content = make_pdf([f"Page {number} text" for number in range(1, pages + 1)])
+    return FileStorage(stream=io.BytesIO(content), filename="manual.pdf")
+
+
+def test_chunks_are_embedded_and_written_in_batches():
+    with tempfile.TemporaryDirectory() as directory:
+        embed = RecordingEmbeddingFunction()
+        service = make_service(directory, embed, batch_size=2)
+        reports = []
+
+        report = service.upload_document(upload(5), progress=lambda report: reports.append(report["chunks"]))
+
+        assert [len(call) for call in embed.calls] == [2, 2, 1]
+        assert (report["pages"], report["chunks"], report["failures"]) == (5, 5, 0)
+        assert [batch["size"] for batch in report["batches"]] == [2, 2, 1]
+        assert reports == [2, 4, 5]
+        assert service.collection.count() == 5
+
+
+def test_failed_batch_is_counted_and_ingestion_carries_on():
+    with tempfile.TemporaryDirectory() as directory:
+        service = make_service(directory, RecordingEmbeddingFunction(fail_calls=(2,)), batch_size=2)
+
+        report = service.upload_document(upload(5))
+
+        assert (report["chunks"], report["failures"]) == (3, 2)
+        assert report["batches"][1] == {"size": 2, "failed": True}
+        assert service.collection.count() == 3
+
+
+def test_batches_are_written_while_the_pdf_is_still_being_parsed():
+    with tempfile.TemporaryDirectory() as directory:
+        parsed = []
+        parsed_at_embedding = []
+
+        def embed(texts):
+            parsed_at_embedding.append(len(parsed))
+            return [[float(len(text)), 1.0] for text in texts]
+
+        service = make_service(directory, embed, batch_size=2)
+        iter_pages = service.parser.iter_pages
+
+        def counting_pages(file):
+            for page in iter_pages(file):
+                parsed.append(page)
+                yield page
+
+        service.parser.iter_pages = counting_pages
+        service.upload_document(upload(6))
+
+        # Each batch is embedded as soon as its pages are in, not after the last page
+        assert parsed_at_embedding == [2, 4, 6]
+
+
+def test_documents_stored_while_a_batch_is_embedded_are_skipped():
+    with tempfile.TemporaryDirectory() as directory:
+        embed = RecordingEmbeddingFunction()
+        service = make_service(directory, embed)
+
+        def embed_while_another_upload_stores(texts):
+            embeddings = embed(texts)
+            if len(embed.calls) == 1:
+                service.add_documents([Document("stored first", {"name": "b.pdf"}, "2")])
+            return embeddings
+
+        service.embedding_function = embed_while_another_upload_stores
+        batch = [
+            Document("one", {"name": "a.pdf"}, "1"),
+            Document("two", {"name": "a.pdf"}, "2"),
+            Document("one again", {"name": "a.pdf"}, "1")
+        ]
+
+        timing = service.add_documents(batch, skip_existing=True)
+
+        assert (timing["size"], timing["skipped"]) == (1, 2)
+        assert service.get_document("1").text == "one again"
+        assert service.get_document("2").metadata == {"name": "b.pdf"}
@@ -0,0 +1,149 @@
+import os
+import sys
+import hashlib
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from services import embedding_cache
+from services.embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+
+
+def key(text: str) -> bytes:
+    return hashlib.sha256(text.encode()).digest()
+
+
+def test_put_then_get():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = EmbeddingCache(directory, capacity=4)
+        cache.put_many([key("a"), key("b")], [[1.0, 2.0], [3.0, 4.0]])
+
+        found = cache.get_many([key("a"), key("missing"), key("b")])
+
+        assert found[0].tolist() == [1.0, 2.0]
+        assert found[1] is None
+        assert found[2].tolist() == [3.0, 4.0]
+        assert cache.stats()["hits"] == 2
+        assert cache.stats()["misses"] == 1
+        cache.close()
+
+
+def test_least_recently_used_is_evicted():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = EmbeddingCache(directory, capacity=2)
+        cache.put_many([key("a"), key("b")], [[1.0], [2.0]])
+        cache.get_many([key("a")])
+        cache.put_many([key("c")], [[3.0]])
+
+        found = cache.get_many([key("a"), key("b"), key("c")])
+
+        assert found[0].tolist() == [1.0]
+        assert found[1] is None
+        assert found[2].tolist() == [3.0]
+        cache.close()
+
+
+def test_reload_from_disk_keeps_entries_and_order():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = EmbeddingCache(directory, capacity=2)
+        cache.put_many([key("a"), key("b")], [[1.0], [2.0]])
+        cache.get_many([key("a")])
+        cache.close()
+
+        reopened = EmbeddingCache(directory, capacity=2)
+        assert reopened.persistent
+        assert reopened.get_many([key("b")])[0].tolist() == [2.0]
+        # "a" was used before "b" was read back, so it goes first
+        reopened.put_many([key("c")], [[3.0]])
+
+        assert reopened.get_many([key("a")]) == [None]
+        assert reopened.get_many([key("b")])[0].tolist() == [2.0]
+        reopened.close()
+
+
+def test_dimension_change_keeps_the_new_batch():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = EmbeddingCache(directory, capacity=4)
+        cache.put_many([key("a")], [[1.0, 2.0]])
+        cache.put_many([key("b"), key("c")], [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+
+        found = cache.get_many([key("a"), key("b"), key("c")])
+
+        assert found[0] is None
+        assert found[1].tolist() == [1.0, 2.0, 3.0]
+        assert found[2].tolist() == [4.0, 5.0, 6.0]
+        cache.close()
+
+
+def test_second_opener_caches_in_memory():
+    with tempfile.TemporaryDirectory() as directory:
+        owner = EmbeddingCache(directory, capacity=4)
+        owner.put_many([key("a")], [[1.0]])
+
+        other = EmbeddingCache(directory, capacity=4)
+        other.put_many([key("b")], [[2.0, 3.0]])
+
+        assert owner.persistent
+        assert not other.persistent
+        assert other.get_many([key("a")]) == [None]
+        # The other cache did not touch the owner's files
+        assert owner.get_many([key("a")])[0].tolist() == [1.0]
+        owner.close()
+        other.close()
+
+
+def test_puts_are_flushed_at_most_once_per_interval(monkeypatch):
+    with tempfile.TemporaryDirectory() as directory:
+        cache = EmbeddingCache(directory, capacity=4, flush_interval=60)
+        flushes = []
+        flush = cache.flush
+        monkeypatch.setattr(cache, "flush", lambda: (flushes.append(True), flush()))
+
+        cache.put_many([key("a")], [[1.0]])
+        cache.put_many([key("b")], [[2.0]])
+        assert flushes == []
+
+        cache.flushed_at -= 60
+        cache.put_many([key("c")], [[3.0]])
+        assert len(flushes) == 1
+        cache.close()
+
+
+def test_in_memory_cache_grows_with_its_entries(monkeypatch):
+    monkeypatch.setattr(embedding_cache, "MEMORY_ROWS", 2)
+    with tempfile.TemporaryDirectory() as directory:
+        owner = EmbeddingCache(directory, capacity=5)
+        other = EmbeddingCache(directory, capacity=5)
+
+        other.put_many([key("a")], [[1.0]])
+        assert len(other.vectors) == 2
+        other.put_many([key(text) for text in "bcde"], [[2.0], [3.0], [4.0], [5.0]])
+        assert len(other.vectors) == 5
+
+        other.put_many([key("f")], [[6.0]])
+        found = other.get_many([key(text) for text in "abcdef"])
+        assert found[0] is None
+        assert [vector.tolist() for vector in found[1:]] == [[2.0], [3.0], [4.0], [5.0], [6.0]]
+        owner.close()
+        other.close()
+
+
+def test_cached_function_only_embeds_new_texts():
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        return [np.array([float(len(text))]) for text in texts]
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = EmbeddingCache(directory, capacity=4)
+        function = CachedEmbeddingFunction(embed, cache)
+
+        function(["one", "three"])
+        embeddings = function(["three", "seven!"])
+
+        assert calls == [["one", "three"], ["seven!"]]
+        assert [embedding.tolist() for embedding in embeddings] == [[5.0], [6.0]]
+        cache.close()
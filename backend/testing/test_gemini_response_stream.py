@@ -12,9 +12,13 @@ response = requests.post(url, json={"query": "Tell me some interesting facts abo
 
 # Process the streamed response
 if response.status_code == 200:
+    # Server-Sent Events: only data lines carry text, id lines and heartbeat comments do not
     for line in response.iter_lines():
-        if line:
-            data: str = json.loads(line.decode('utf-8'))
-            print(data["text"], end="")
+        line = line.decode('utf-8')
+        if line.startswith("data:"):
+            data: dict = json.loads(line[5:])
+            if data.get("reset"):
+                print()
+            print(data.get("text", ""), end="")
 else:
     print("Error:", response.status_code)
\ No newline at end of file
@@ -0,0 +1,220 @@
+import io
+import os
+import sys
+import time
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from werkzeug.datastructures import FileStorage
+
+from models.base_model import Base
+from models.ingestion_job import IngestionJob
+from services.document_service import DocumentService
+from services.ingestion_job_service import IngestionJobService
+from test_chat_route import make_client
+
+
+class FakeDocumentService:
+    deduplicate = True
+    file_hash = staticmethod(DocumentService.file_hash)
+
+    def __init__(self, chunks=3, failures=0):
+        self.chunks = chunks
+        self.failures = failures
+        self.stored = set()
+        self.uploads = []
+
+    def upload_document(self, file, progress=None):
+        self.uploads.append(file.filename)
+        if self.chunks:
+            self.stored.add(self.file_hash(file))
+        report = {"pages": 1, "chunks": self.chunks, "skipped": 0, "failures": self.failures, "batches": []}
+        if progress:
+            progress(report)
+        return report
+
+    def has_file(self, file_hash):
+        return file_hash in self.stored
+
+
+def make_service(directory: str, document_service: FakeDocumentService) -> IngestionJobService:
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'test.db')}")
+    Base.metadata.create_all(bind=engine)
+    return IngestionJobService(
+        sessionmaker(bind=engine),
+        document_service,
+        max_workers=1,
+        upload_directory=os.path.join(directory, "uploads")
+    )
+
+
+def upload(content: bytes = b"%PDF-1.4 contents") -> FileStorage:
+    return FileStorage(stream=io.BytesIO(content), filename="manual.pdf")
+
+
+def wait_for(service: IngestionJobService, job_id: str):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        job = service.get_job(job_id)
+        if job.status not in ("queued", "running"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_duplicate_of_a_completed_upload_is_not_queued():
+    with tempfile.TemporaryDirectory() as directory:
+        documents = FakeDocumentService()
+        service = make_service(directory, documents)
+        job, queued = service.enqueue(upload())
+        assert queued
+        assert wait_for(service, job.id).status == "completed"
+
+        duplicate, queued = service.enqueue(upload())
+
+        assert not queued
+        assert duplicate.id == job.id
+        assert documents.uploads == ["manual.pdf"]
+        service.shutdown()
+
+
+def test_simultaneous_uploads_of_one_file_queue_one_job():
+    with tempfile.TemporaryDirectory() as directory:
+        documents = FakeDocumentService()
+        service = make_service(directory, documents)
+        find = service.find_job_by_file_hash
+
+        def slow_find(file_hash):
+            # Widens the window between the duplicate check and the insert
+            job = find(file_hash)
+            time.sleep(0.05)
+            return job
+
+        service.find_job_by_file_hash = slow_find
+        results = []
+        uploads = [threading.Thread(target=lambda: results.append(service.enqueue(upload()))) for _ in range(2)]
+        for thread in uploads:
+            thread.start()
+        for thread in uploads:
+            thread.join(5)
+        service.shutdown()
+
+        assert sorted(queued for _, queued in results) == [False, True]
+        assert results[0][0].id == results[1][0].id
+        assert documents.uploads == ["manual.pdf"]
+
+
+def test_different_contents_are_queued():
+    with tempfile.TemporaryDirectory() as directory:
+        service = make_service(directory, FakeDocumentService())
+        first, _ = service.enqueue(upload(b"first"))
+        wait_for(service, first.id)
+
+        second, queued = service.enqueue(upload(b"second"))
+
+        assert queued
+        assert second.id != first.id
+        service.shutdown()
+
+
+def test_partly_failed_upload_can_be_uploaded_again():
+    with tempfile.TemporaryDirectory() as directory:
+        documents = FakeDocumentService(chunks=3, failures=2)
+        service = make_service(directory, documents)
+        job, _ = service.enqueue(upload())
+        finished = wait_for(service, job.id)
+        assert finished.status == "failed"
+        assert finished.error == "2 chunks could not be stored"
+
+        retry, queued = service.enqueue(upload())
+
+        assert queued
+        assert retry.id != job.id
+        service.shutdown()
+
+
+def test_upload_whose_chunks_were_deleted_can_be_uploaded_again():
+    with tempfile.TemporaryDirectory() as directory:
+        documents = FakeDocumentService()
+        service = make_service(directory, documents)
+        job, _ = service.enqueue(upload())
+        wait_for(service, job.id)
+        documents.stored.clear()
+
+        retry, queued = service.enqueue(upload())
+
+        assert queued
+        assert wait_for(service, retry.id).status == "completed"
+        assert documents.uploads == ["manual.pdf", "manual.pdf"]
+        service.shutdown()
+
+
+class FailingDocumentService(FakeDocumentService):
+    def upload_document(self, file, progress=None):
+        raise ValueError("not a PDF")
+
+
+def test_job_reports_progress_and_removes_its_upload():
+    with tempfile.TemporaryDirectory() as directory:
+        service = make_service(directory, FakeDocumentService(chunks=3))
+
+        job, _ = service.enqueue(upload())
+        finished = wait_for(service, job.id).to_dict()
+
+        assert finished["status"] == "completed"
+        assert (finished["pages_parsed"], finished["chunks_embedded"], finished["failures"]) == (1, 3, 0)
+        # The upload is removed after the final status is stored
+        service.shutdown()
+        assert not os.path.exists(job.file_path)
+
+
+def test_job_that_raises_is_failed_with_the_error():
+    with tempfile.TemporaryDirectory() as directory:
+        service = make_service(directory, FailingDocumentService())
+
+        job, _ = service.enqueue(upload())
+        finished = wait_for(service, job.id)
+
+        assert finished.status == "failed"
+        assert finished.error == "not a PDF"
+        service.shutdown()
+        assert not os.path.exists(job.file_path)
+
+
+def test_jobs_interrupted_by_a_restart_are_resumed():
+    with tempfile.TemporaryDirectory() as directory:
+        documents = FakeDocumentService()
+        service = make_service(directory, documents)
+        job_id = "interrupted"
+        file_path = os.path.join(service.upload_directory, f"{job_id}.pdf")
+        with open(file_path, "wb") as file:
+            file.write(b"%PDF-1.4 contents")
+        with service.session_factory() as session:
+            session.add(IngestionJob(id=job_id, name="manual.pdf", file_path=file_path, status="running"))
+            session.commit()
+
+        assert service.resume_pending() == 1
+        assert wait_for(service, job_id).status == "completed"
+        assert documents.uploads == ["manual.pdf"]
+        service.shutdown()
+
+
+def test_job_status_route():
+    with tempfile.TemporaryDirectory() as directory:
+        service = make_service(directory, FakeDocumentService())
+        job, _ = service.enqueue(upload())
+        wait_for(service, job.id)
+        client = make_client()
+        client.application.config["INGESTION_JOB_SERVICE"] = service
+
+        response = client.get(f"/document/jobs/{job.id}")
+        missing = client.get("/document/jobs/missing")
+
+        assert response.status_code == 200
+        assert response.get_json()["status"] == "completed"
+        assert missing.status_code == 404
+        service.shutdown()
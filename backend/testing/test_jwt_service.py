@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from services.jwt_service import JWTService
+
+
+def write_keys(directory: str):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with open(os.path.join(directory, "private_key.pem"), "wb") as file:
+        file.write(private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ))
+    with open(os.path.join(directory, "public_key.pem"), "wb") as file:
+        file.write(private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        ))
+
+
+def make_service(cache_size: int = 16) -> JWTService:
+    with tempfile.TemporaryDirectory() as directory:
+        write_keys(directory)
+        return JWTService(cache_size=cache_size, key_directory=directory)
+
+
+def test_verified_token_is_served_from_cache():
+    service = make_service()
+    token = service.create_access_token("user@example.com", datetime.now() + timedelta(minutes=5))
+
+    assert service.validate_token(token) == "user@example.com"
+    assert service.validate_token(token) == "user@example.com"
+    assert service.verified_tokens.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+def test_cached_token_expires_at_exp():
+    service = make_service()
+    token = service.create_access_token("user@example.com", datetime.now() + timedelta(seconds=2))
+    assert service.validate_token(token) == "user@example.com"
+
+    digest, (user_id, _) = next(iter(service.verified_tokens.entries.items()))
+    service.verified_tokens.put(digest, (user_id, datetime.now() - timedelta(seconds=1)))
+
+    assert service.validate_token(token) == ""
+
+
+def test_invalid_tokens_are_not_cached():
+    service = make_service()
+    other = make_service()
+    forged = other.create_access_token("user@example.com", datetime.now() + timedelta(minutes=5))
+
+    assert service.validate_token(forged) == ""
+    assert service.validate_token(forged) == ""
+    assert service.verified_tokens.stats()["entries"] == 0
@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import pytest
+from google.genai import errors, types
+
+from config import Config
+from services.llm_backend import GeminiBackend, SimulatedBackend, create_llm_backend
+
+
+def prompt(text: str) -> list[types.Content]:
+    return [types.Content(role="user", parts=[types.Part.from_text(text=text)])]
+
+
+def make_backend(**settings) -> SimulatedBackend:
+    return SimulatedBackend(**{"ttft": 0, "token_delay": 0, "tokens": 8, "error_rate": 0, "rate_limit": 0, **settings})
+
+
+async def collect(stream) -> list[str]:
+    return [token async for token in stream]
+
+
+def outcomes(backend: SimulatedBackend, requests: int) -> list[bool]:
+    succeeded = []
+    for _ in range(requests):
+        try:
+            list(backend.generate_stream("model", prompt("question"), None))
+            succeeded.append(True)
+        except errors.ServerError:
+            succeeded.append(False)
+    return succeeded
+
+
+def test_same_prompt_streams_the_same_answer():
+    backend = make_backend()
+
+    first = list(backend.generate_stream("model", prompt("What is a pump?"), None))
+    again = list(make_backend().generate_stream("model", prompt("What is a pump?"), None))
+    other = list(backend.generate_stream("model", prompt("What is a valve?"), None))
+
+    assert len(first) == 8
+    assert first == again
+    assert first != other
+    assert asyncio.run(collect(backend.agenerate_stream("model", prompt("What is a pump?"), None))) == first
+
+
+def test_first_token_waits_for_ttft():
+    backend = make_backend(ttft=0.2, tokens=1)
+
+    start = time.perf_counter()
+    list(backend.generate_stream("model", prompt("question"), None))
+
+    assert time.perf_counter() - start >= 0.2
+
+
+def test_errors_are_injected_at_the_error_rate():
+    with pytest.raises(errors.ServerError) as failed:
+        list(make_backend(error_rate=1).generate_stream("model", prompt("question"), None))
+    assert failed.value.code == 503
+
+    run = outcomes(make_backend(error_rate=0.5, seed=7), 20)
+
+    # The same seed fails the same requests
+    assert outcomes(make_backend(error_rate=0.5, seed=7), 20) == run
+    assert True in run and False in run
+
+
+def test_requests_beyond_the_rate_limit_get_429():
+    backend = make_backend(rate_limit=2)
+    list(backend.generate_stream("model", prompt("one"), None))
+    list(backend.generate_stream("model", prompt("two"), None))
+
+    with pytest.raises(errors.ClientError) as limited:
+        list(backend.generate_stream("model", prompt("three"), None))
+
+    assert limited.value.code == 429
+
+
+def test_backend_is_chosen_by_config(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_BACKEND", "simulated")
+    assert isinstance(create_llm_backend(), SimulatedBackend)
+
+    monkeypatch.setattr(Config, "LLM_BACKEND", "gemini")
+    assert isinstance(create_llm_backend(client=object()), GeminiBackend)
+
+    monkeypatch.setattr(Config, "LLM_BACKEND", "other")
+    with pytest.raises(ValueError):
+        create_llm_backend()
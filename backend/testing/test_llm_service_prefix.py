@@ -0,0 +1,140 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from services.llm_service import LLMService, document_markers
+from services.llm_backend import GeminiBackend
+from models.document import Document
+
+
+class StandInModels:
+    def __init__(self):
+        self.calls = []
+
+    def generate_content_stream(self, model, contents, config):
+        self.calls.append({"model": model, "contents": contents, "config": config})
+        for text in ("Hello", " world"):
+            yield SimpleNamespace(text=text)
+
+
+class StandInCaches:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.created = []
+        self.deleted = []
+
+    def create(self, model, config):
+        if self.fail:
+            raise ValueError("Cached content is too small")
+        name = f"cachedContents/{len(self.created)}"
+        self.created.append({"name": name, "model": model, "config": config})
+        return SimpleNamespace(name=name)
+
+    def delete(self, name):
+        self.deleted.append(name)
+
+
+class StandInClient:
+    def __init__(self, fail_caching=False):
+        self.models = StandInModels()
+        self.caches = StandInCaches(fail_caching)
+
+
+def make_service(client, context_cache_ttl=0):
+    service = LLMService(GeminiBackend(client), "gemini-test", "Be brief.", context_cache_ttl=context_cache_ttl)
+    service.add_few_shot_example("What is RAG?", "Retrieval augmented generation.")
+    return service
+
+
+def test_prefix_is_reused_between_queries():
+    client = StandInClient()
+    service = make_service(client)
+
+    assert "".join(service.query("first", [Document("doc text", {}, "1")])) == "Hello world"
+    assert "".join(service.query("second")) == "Hello world"
+
+    first, second = client.models.calls
+    assert first["config"] is second["config"]
+    assert first["contents"][0] is second["contents"][0]
+    assert first["config"].system_instruction == "Be brief."
+    # Few-shot pair, markers around one document, then the query
+    assert len(first["contents"]) == 6
+    assert first["contents"][2] is document_markers()[0]
+    assert first["contents"][-1].parts[0].text == "first"
+    assert len(second["contents"]) == 3
+
+
+def test_prefix_is_recompiled_after_changes():
+    client = StandInClient()
+    service = make_service(client)
+    prefix = service.get_prefix()
+
+    service.set_system_prompt("Be thorough.")
+    recompiled = service.get_prefix()
+    assert recompiled is not prefix
+    assert recompiled.config.system_instruction == "Be thorough."
+
+    service.add_few_shot_example("And BM25?", "A keyword ranking function.")
+    assert len(service.get_prefix().contents) == 4
+
+
+def test_context_cache_replaces_inline_prefix():
+    client = StandInClient()
+    service = make_service(client, context_cache_ttl=600)
+
+    list(service.query("question"))
+    list(service.query("another question"))
+
+    assert len(client.caches.created) == 1
+    created = client.caches.created[0]
+    assert created["config"].system_instruction == "Be brief."
+    assert len(created["config"].contents) == 2
+    assert created["config"].ttl == "600s"
+    for call in client.models.calls:
+        assert call["config"].cached_content == "cachedContents/0"
+        assert call["config"].system_instruction is None
+        assert len(call["contents"]) == 1
+
+    service.set_system_prompt("Be thorough.")
+    assert client.caches.deleted == ["cachedContents/0"]
+    list(service.query("question"))
+    assert client.models.calls[-1]["config"].cached_content == "cachedContents/1"
+
+
+def test_replaced_context_cache_outlives_the_streams_using_it():
+    client = StandInClient()
+    service = make_service(client, context_cache_ttl=600)
+    stream = service.query("question")
+    assert next(stream) == "Hello"
+
+    service.set_system_prompt("Be thorough.")
+    assert client.caches.deleted == []
+    assert "".join(service.query("another question")) == "Hello world"
+    assert client.caches.deleted == []
+
+    assert list(stream) == [" world"]
+    assert client.caches.deleted == ["cachedContents/0"]
+
+
+def test_context_cache_is_recreated_when_it_expires():
+    client = StandInClient()
+    service = make_service(client, context_cache_ttl=600)
+    service.get_prefix().expires_at = 0
+
+    service.get_prefix()
+    assert len(client.caches.created) == 2
+    assert client.caches.deleted == ["cachedContents/0"]
+
+
+def test_falls_back_to_inline_prefix_when_caching_fails():
+    client = StandInClient(fail_caching=True)
+    service = make_service(client, context_cache_ttl=600)
+
+    list(service.query("question"))
+
+    call = client.models.calls[0]
+    assert call["config"].cached_content is None
+    assert call["config"].system_instruction == "Be brief."
+    assert len(call["contents"]) == 3
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from services.metrics import MetricsRegistry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry(enabled=True, directory="")
+    histogram = registry.histogram("stage_seconds", "Stage time", buckets=(0.1, 1.0), labelnames=("stage",))
+
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, stage="parse")
+
+    lines = registry.render().splitlines()
+    assert 'stage_seconds_bucket{stage="parse",le="0.1"} 2' in lines
+    assert 'stage_seconds_bucket{stage="parse",le="1.0"} 3' in lines
+    assert 'stage_seconds_bucket{stage="parse",le="+Inf"} 4' in lines
+    assert 'stage_seconds_count{stage="parse"} 4' in lines
+
+
+def test_gauge_goes_up_and_down():
+    registry = MetricsRegistry(enabled=True, directory="")
+    gauge = registry.gauge("queue_depth", "Waiting requests")
+
+    gauge.set(3)
+    gauge.inc()
+    gauge.dec(2)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE queue_depth gauge" in lines
+    assert "queue_depth 2" in lines
+
+
+def test_samples_of_other_workers_are_added_up():
+    with tempfile.TemporaryDirectory() as directory:
+        registry = MetricsRegistry(enabled=True, directory=directory)
+        counter = registry.counter("queries_total", "Queries", labelnames=("mode",))
+        counter.inc(mode="vector")
+        # Written by another worker that is still running
+        with open(os.path.join(directory, f"metrics-{os.getppid()}.json"), "w") as file:
+            json.dump({"queries_total": {json.dumps(["vector"]): 2, json.dumps(["keyword"]): 1}}, file)
+
+        lines = registry.render().splitlines()
+
+    assert 'queries_total{mode="vector"} 3' in lines
+    assert 'queries_total{mode="keyword"} 1' in lines
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False, directory="")
+    histogram = registry.histogram("stage_seconds", "Stage time")
+
+    histogram.observe(1.0)
+
+    assert histogram.snapshot() == {}
+
+
+
+def test_samples_of_exited_workers_are_dropped():
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    with tempfile.TemporaryDirectory() as directory:
+        registry = MetricsRegistry(enabled=True, directory=directory)
+        counter = registry.counter("queries_total", "Queries", labelnames=("mode",))
+        counter.inc(mode="vector")
+        path = os.path.join(directory, f"metrics-{exited.stdout.strip()}.json")
+        with open(path, "w") as file:
+            json.dump({"queries_total": {json.dumps(["vector"]): 5}}, file)
+
+        lines = registry.render().splitlines()
+
+        assert 'queries_total{mode="vector"} 1' in lines
+        assert not os.path.exists(path)
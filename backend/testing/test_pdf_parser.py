@@ -0,0 +1,117 @@
+import io
+import os
+import sys
+import time
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from werkzeug.datastructures import FileStorage
+
+from services.pdf_parser import PDFParser
+
+
+def make_pdf(pages: list[str]) -> bytes:
+    # Smallest PDF PyPDF2 extracts text from: one Helvetica line per page
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        content = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(output.tell())
+        output.write(f"{number} 0 obj\n{body}\nendobj\n".encode())
+    xref = output.tell()
+    output.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        output.write(f"{offset:010d} 00000 n \n".encode())
+    output.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return output.getvalue()
+
+
+def upload(pages: list[str]) -> FileStorage:
+    return FileStorage(stream=io.BytesIO(make_pdf(pages)), filename="manual.pdf")
+
+
+PAGES = [f"Page {number} text" for number in range(1, 7)]
+
+
+def test_pages_are_read_in_order():
+    texts = [text for _, text in PDFParser(max_workers=0).iter_pages(upload(PAGES))]
+
+    assert [text.strip() for text in texts] == PAGES
+
+
+def test_parallel_extraction_matches_serial():
+    parser = PDFParser(max_workers=2, page_timeout=30)
+    try:
+        parallel = list(parser.iter_pages(upload(PAGES), parallel=True))
+    finally:
+        parser.close()
+    serial = list(PDFParser(max_workers=0).iter_pages(upload(PAGES), parallel=False))
+
+    assert parallel == serial
+    assert [metadata["page_no"] for metadata, _ in parallel] == list(range(len(PAGES)))
+
+
+def test_timed_out_ranges_kill_their_workers():
+    # Far too short for a worker to even start, so every range times out
+    parser = PDFParser(max_workers=2, page_timeout=0.001)
+    texts = [text for _, text in parser.iter_pages(upload(PAGES), parallel=True)]
+    parser.close()
+
+    assert texts == [""] * len(PAGES)
+    deadline = time.monotonic() + 5
+    while multiprocessing.active_children() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert multiprocessing.active_children() == []
+
+
+def test_chunks_overlap_and_cover_the_text():
+    parser = PDFParser(max_workers=0)
+    text = " ".join(f"word{number}" for number in range(2000))
+
+    chunks = list(parser.iter_chunks(text))
+
+    assert len(chunks) > 1
+    assert chunks == parser.chunk_text(text)
+    assert chunks[0].startswith("word0 ")
+    assert chunks[-1].endswith("word1999")
+
+
+def test_pool_discarded_by_another_upload_does_not_fail_this_one():
+    parser = PDFParser(max_workers=2, page_timeout=30)
+    try:
+        pages = parser.iter_pages(upload(PAGES), parallel=True)
+        first = next(pages)
+        # What a timed-out range of a concurrent upload does to the shared pool
+        parser._discard_pool()
+        texts = [first[1]] + [text for _, text in pages]
+    finally:
+        parser.close()
+
+    assert [text.strip() for text in texts] == PAGES
+
+
+def test_threads_sharing_a_parser_share_one_pool():
+    parser = PDFParser(max_workers=2)
+    pools = []
+    threads = [threading.Thread(target=lambda: pools.append(parser._get_pool())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    parser.close()
+
+    assert len({id(pool) for pool in pools}) == 1
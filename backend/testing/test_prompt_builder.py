@@ -0,0 +1,100 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models.document import Document
+from services.llm_service import LLMService
+from services.llm_backend import GeminiBackend
+from services.prompt_builder import SUMMARY_PREFIX, PromptBuilder, estimate_tokens
+from test_llm_service_prefix import StandInClient
+
+
+def words(count: int) -> str:
+    return " ".join(["word"] * count)
+
+
+def documents(*sizes: int) -> list[Document]:
+    return [Document(words(size), {}, str(number)) for number, size in enumerate(sizes)]
+
+
+def history(*sizes: int) -> list[dict[str, str]]:
+    return [{"role": "user", "text": words(size)} for size in sizes]
+
+
+def test_tokens_are_estimated_from_characters_or_words():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("x" * 40) == 10
+    assert estimate_tokens("1 2 3 4 5 6") == 6
+
+
+def test_prompt_within_the_budget_is_unchanged():
+    builder = PromptBuilder(token_budget=100, estimator=lambda text: len(text.split()))
+
+    kept_documents, kept_history = builder.fit(["query"], documents(10, 10), history(10))
+
+    assert [document.id for document in kept_documents] == ["0", "1"]
+    assert kept_history == history(10)
+
+
+def test_oldest_history_is_dropped_before_documents():
+    builder = PromptBuilder(token_budget=40, estimator=lambda text: len(text.split()))
+
+    kept_documents, kept_history = builder.fit([words(10)], documents(10, 10), history(10, 10))
+
+    assert [document.id for document in kept_documents] == ["0", "1"]
+    assert kept_history == history(10)
+
+
+def test_oldest_turn_is_trimmed_when_that_is_enough():
+    builder = PromptBuilder(token_budget=25, estimator=lambda text: len(text.split()))
+    turns = [{"role": "user", "text": " ".join(f"w{number}" for number in range(20))}]
+
+    _, kept_history = builder.fit([words(5)], documents(10), turns)
+
+    assert kept_history[0]["text"].split()[-1] == "w19"
+    assert 5 < len(kept_history[0]["text"].split()) < 20
+
+
+def test_conversation_summary_is_kept_and_the_turns_after_it_dropped():
+    builder = PromptBuilder(token_budget=40, estimator=lambda text: len(text.split()))
+    summary = {"role": "user", "text": SUMMARY_PREFIX + words(10)}
+
+    kept_documents, kept_history = builder.fit([words(5)], documents(10), [summary] + history(10, 10))
+
+    assert [document.id for document in kept_documents] == ["0"]
+    assert kept_history[0] == summary
+    assert len(kept_history) == 2
+    assert len(kept_history[1]["text"].split()) < 10
+
+
+def test_lowest_ranked_documents_are_dropped_last():
+    builder = PromptBuilder(token_budget=15, estimator=lambda text: len(text.split()))
+
+    kept_documents, kept_history = builder.fit([words(5)], documents(10, 10, 10), history(10))
+
+    assert [document.id for document in kept_documents] == ["0"]
+    assert kept_history == []
+
+
+def test_fixed_parts_are_kept_even_over_the_budget():
+    builder = PromptBuilder(token_budget=5, estimator=lambda text: len(text.split()))
+
+    kept_documents, kept_history = builder.fit([words(10)], documents(10), history(10))
+
+    assert (kept_documents, kept_history) == ([], [])
+
+
+def test_llm_service_sends_only_what_fits():
+    client = StandInClient()
+    service = LLMService(
+        GeminiBackend(client), "gemini-test", "Be brief.",
+        prompt_builder=PromptBuilder(token_budget=30, estimator=lambda text: len(text.split()))
+    )
+
+    "".join(service.query("question", documents(10, 10, 10), history(10)))
+
+    contents = client.models.calls[0]["contents"]
+    texts = [content.parts[0].text for content in contents]
+    assert texts.count(words(10)) == 2
+    assert texts[-1] == "question"
@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models.document import Document
+from services.metrics import QUERY_CACHE_EVICTIONS, QUERY_CACHE_REQUESTS
+from services.query_cache import CollectionGeneration, LRUCache, QueryCache
+from services.vector_store import VectorStore
+from services.document_service import DocumentService
+from services.search_service import SearchService
+
+
+class CountingEmbeddingFunction:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, texts):
+        self.calls += 1
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+
+    cache.put("c", 3)
+
+    assert [cache.get(key) for key in ("a", "b", "c")] == [1, None, 3]
+    assert cache.stats() == {"entries": 2, "hits": 3, "misses": 1}
+
+
+def test_named_cache_counts_lookups_and_evictions_in_the_metrics():
+    def count(metric, *labels):
+        return metric.snapshot().get(json.dumps(list(labels)), 0)
+
+    before = [count(QUERY_CACHE_REQUESTS, "test", result) for result in ("hit", "miss")]
+    evicted_before = count(QUERY_CACHE_EVICTIONS, "test")
+    cache = LRUCache(max_size=1, name="test")
+
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.get("b")
+
+    assert count(QUERY_CACHE_REQUESTS, "test", "hit") - before[0] == 1
+    assert count(QUERY_CACHE_REQUESTS, "test", "miss") - before[1] == 1
+    assert count(QUERY_CACHE_EVICTIONS, "test") - evicted_before == 1
+
+
+def test_zero_size_cache_stores_nothing():
+    cache = LRUCache(max_size=0)
+    cache.put("a", 1)
+
+    assert cache.get("a") is None
+
+
+def test_keys_are_normalized_and_bound_to_the_generation():
+    generation = CollectionGeneration()
+    cache = QueryCache(generation, max_size=10)
+    key = cache.result_key("What is a  PUMP?", 5, {"name": "a.pdf"})
+    cache.put_results(key, ["1"])
+    cache.put_embedding("What is a pump?", [1.0])
+
+    assert cache.get_results(cache.result_key("what is a pump?", 5, {"name": "a.pdf"})) == ["1"]
+    assert cache.result_key("what is a pump?", 5, mode="keyword") != key
+
+    generation.bump()
+
+    assert cache.get_results(cache.result_key("what is a pump?", 5, {"name": "a.pdf"})) is None
+    assert cache.get_embedding(" WHAT is a pump? ") == [1.0]
+
+
+def test_repeated_search_is_served_from_the_cache_until_a_write():
+    with tempfile.TemporaryDirectory() as directory:
+        store = VectorStore(directory)
+        embed = CountingEmbeddingFunction()
+        documents = DocumentService(embedding_function=embed, vector_store=store)
+        search = SearchService(embedding_function=embed, vector_store=store)
+        documents.add_document(Document("pump", {"name": "a.pdf"}, "1"))
+        embed.calls = 0
+
+        first = search.search_documents("pump", limit=5)
+        second = search.search_documents("pump", limit=5)
+
+        assert [document.id for document in first] == [document.id for document in second] == ["1"]
+        assert embed.calls == 1
+        assert search.query_cache.stats()["results"]["hits"] == 1
+
+        documents.add_document(Document("pumps", {"name": "b.pdf"}, "2"))
+        after_write = search.search_documents("pump", limit=5)
+
+        assert sorted(document.id for document in after_write) == ["1", "2"]
+        # The query embedding survives the write
+        assert search.query_cache.stats()["embeddings"]["hits"] == 1
@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import logging
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from blueprints.api.routes import api_bp
+from services.readiness_service import ReadinessService
+
+
+class FakeSearchService:
+    def __init__(self, failures=0):
+        # Warm-ups that fail before one succeeds
+        self.failures = failures
+        self.attempts = 0
+        self.release = threading.Event()
+        self.release.set()
+        self.collection = self
+
+    def warm_up(self):
+        self.release.wait(5)
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise RuntimeError("model not downloaded")
+        return {"embedding_model": 0.0, "vector_index": 0.0}
+
+    def count(self):
+        return 0
+
+
+class FakeLLMService:
+    def get_prefix(self):
+        return None
+
+
+def make_service(
+        search_service: FakeSearchService,
+        retry_seconds: float = 60,
+        warm_up: bool = True,
+        preload=None
+    ) -> ReadinessService:
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    return ReadinessService(
+        sessionmaker(bind=engine),
+        search_service,
+        FakeLLMService(),
+        warm_up=warm_up,
+        retry_seconds=retry_seconds,
+        preload=preload
+    )
+
+
+def wait_for_state(service: ReadinessService, *states: str):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with service.lock:
+            if service.state in states:
+                return
+        time.sleep(0.01)
+    raise AssertionError(f"Warm-up did not reach {states}")
+
+
+def test_ready_only_once_warm_up_is_done():
+    search_service = FakeSearchService()
+    search_service.release.clear()
+    service = make_service(search_service)
+
+    assert service.check()[0] is False
+    service.start()
+    ready, report = service.check()
+    assert not ready
+    assert report["warm_up"]["state"] == "running"
+
+    search_service.release.set()
+    wait_for_state(service, "done")
+    ready, report = service.check()
+
+    assert ready
+    assert report["checks"]["database"]["status"] == "ok"
+    assert set(report["warm_up"]["steps"]) == {"imports", "embedding_model", "vector_index", "prompt_prefix"}
+
+
+def test_failed_warm_up_waits_for_its_retry_delay():
+    search_service = FakeSearchService(failures=1)
+    service = make_service(search_service, retry_seconds=60)
+    service.start()
+    wait_for_state(service, "failed")
+
+    for _ in range(3):
+        ready, report = service.check()
+
+    assert not ready
+    assert report["warm_up"]["error"] == "model not downloaded"
+    assert 0 < report["warm_up"]["retry_in"] <= 60
+    assert search_service.attempts == 1
+
+
+def test_retry_delay_doubles_and_the_traceback_is_logged_once(caplog):
+    service = make_service(FakeSearchService(failures=3), retry_seconds=10)
+
+    delays = []
+    with caplog.at_level(logging.WARNING, logger="services.readiness_service"):
+        for _ in range(3):
+            service.warm_up()
+            delays.append(service.retry_at - time.monotonic())
+
+    assert [round(delay) for delay in delays] == [10, 20, 40]
+    assert len(caplog.records) == 3
+    assert [bool(record.exc_info) for record in caplog.records] == [True, False, False]
+
+
+def test_ready_route_turns_from_503_to_200():
+    search_service = FakeSearchService(failures=1)
+    service = make_service(search_service, retry_seconds=0)
+    app = Flask(__name__)
+    app.register_blueprint(api_bp)
+    app.config["READINESS_SERVICE"] = service
+    client = app.test_client()
+
+    service.start()
+    wait_for_state(service, "failed")
+    search_service.release.clear()
+    assert client.get("/ready").status_code == 503
+
+    # That check started the retry, which succeeds
+    search_service.release.set()
+    wait_for_state(service, "done")
+    response = client.get("/ready")
+
+    assert response.status_code == 200
+    assert response.get_json()["ready"] is True
+
+
+def test_preload_runs_once_before_the_warm_up():
+    calls = []
+    service = make_service(FakeSearchService(failures=1), preload=lambda: calls.append(True) or {"keyword_index": 0.0})
+
+    service.warm_up()
+    service.warm_up()
+
+    assert calls == [True]
+    assert service.state == "done"
+
+
+def test_preload_runs_without_warm_up():
+    preloaded = threading.Event()
+    service = make_service(FakeSearchService(), warm_up=False, preload=lambda: preloaded.set() or {})
+
+    service.start()
+
+    assert preloaded.wait(5)
+    assert service.check()[0] is True
@@ -0,0 +1,138 @@
+import os
+import sys
+import asyncio
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import pytest
+
+from services.single_flight import AsyncSingleFlight, SingleFlight
+
+
+class GatedStream:
+    """
+    Stream whose chunks are only produced once the test lets them through.
+    """
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.started = 0
+        self.gate = threading.Semaphore(0)
+
+    def __call__(self):
+        self.started += 1
+        for chunk in self.chunks:
+            self.gate.acquire()
+            yield chunk
+        if self.error:
+            raise self.error
+
+
+def test_identical_streams_share_one_upstream():
+    flight = SingleFlight()
+    produce = GatedStream(["a", "b", "c"])
+    leader, leader_shared = flight.join("key", produce)
+    produce.gate.release()
+    assert next(leader) == "a"
+
+    follower, follower_shared = flight.join("key", produce)
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(follower))
+    reader.start()
+    produce.gate.release()
+    produce.gate.release()
+
+    assert list(leader) == ["b", "c"]
+    reader.join(5)
+    # The follower replays what it missed, then gets the rest live
+    assert received == ["a", "b", "c"]
+    assert (leader_shared, follower_shared, produce.started) == (False, True, 1)
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "followers": 1}
+
+
+def test_finished_stream_is_not_shared():
+    flight = SingleFlight()
+
+    assert list(flight.stream("key", lambda: iter(["a"]))) == ["a"]
+    assert list(flight.stream("key", lambda: iter(["b"]))) == ["b"]
+    assert flight.stats()["leaders"] == 2
+
+
+def test_error_reaches_every_subscriber():
+    flight = SingleFlight()
+    produce = GatedStream(["a"], error=RuntimeError("upstream failed"))
+    leader = flight.stream("key", produce)
+    produce.gate.release()
+    next(leader)
+    follower = flight.stream("key", produce)
+
+    with pytest.raises(RuntimeError):
+        list(leader)
+    with pytest.raises(RuntimeError):
+        list(follower)
+
+
+def test_leader_that_disconnects_finishes_the_stream_for_followers():
+    flight = SingleFlight()
+    produce = GatedStream(["a", "b"])
+    leader = flight.stream("key", produce)
+    produce.gate.release()
+    next(leader)
+    follower = flight.stream("key", produce)
+
+    produce.gate.release()
+    leader.close()
+
+    assert list(follower) == ["a", "b"]
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_async_identical_streams_share_one_upstream():
+    started = []
+
+    async def produce():
+        started.append(True)
+        for chunk in ("a", "b"):
+            await asyncio.sleep(0)
+            yield chunk
+
+    async def main():
+        flight = AsyncSingleFlight()
+        leader, leader_shared = flight.join("key", produce)
+        follower, follower_shared = flight.join("key", produce)
+        results = await asyncio.gather(collect(leader), collect(follower))
+        return results, (leader_shared, follower_shared), flight.stats()
+
+    results, shared, stats = asyncio.run(main())
+
+    assert results == [["a", "b"], ["a", "b"]]
+    assert shared == (False, True)
+    assert started == [True]
+    assert stats == {"in_flight": 0, "leaders": 1, "followers": 1}
+
+
+def test_async_stream_is_cancelled_when_the_last_subscriber_leaves():
+    async def main():
+        stopped = asyncio.Event()
+
+        async def produce():
+            try:
+                while True:
+                    await asyncio.sleep(0)
+                    yield "chunk"
+            finally:
+                stopped.set()
+
+        flight = AsyncSingleFlight()
+        stream = flight.stream("key", produce)
+        assert await anext(stream) == "chunk"
+        await stream.aclose()
+        await asyncio.wait_for(stopped.wait(), 5)
+        return flight.stats()["in_flight"]
+
+    assert asyncio.run(main()) == 0
+
+
+async def collect(stream) -> list:
+    return [chunk async for chunk in stream]
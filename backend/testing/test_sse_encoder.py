@@ -0,0 +1,117 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from services.sse_encoder import SSEEncoder, HEARTBEAT
+
+
+def slow(chunks, delay):
+    for chunk in chunks:
+        time.sleep(delay)
+        yield chunk
+
+
+async def aslow(chunks, delay):
+    for chunk in chunks:
+        await asyncio.sleep(delay)
+        yield chunk
+
+
+def test_first_chunk_is_sent_alone_and_the_rest_coalesced():
+    encoder = SSEEncoder(coalesce_bytes=0, coalesce_ms=1000, heartbeat=0)
+
+    frames = list(encoder.encode(iter(["a", "b", "c", "d"])))
+
+    assert frames == [b'id: 1\ndata: {"text":"a"}\n\n', b'id: 4\ndata: {"text":"bcd"}\n\n']
+
+
+def test_byte_limit_flushes_the_buffer():
+    encoder = SSEEncoder(coalesce_bytes=4, coalesce_ms=0, heartbeat=0)
+
+    frames = list(encoder.encode(iter(["x", "ab", "cd", "e"])))
+
+    assert frames == [
+        b'id: 1\ndata: {"text":"x"}\n\n',
+        b'id: 5\ndata: {"text":"abcd"}\n\n',
+        b'id: 6\ndata: {"text":"e"}\n\n'
+    ]
+
+
+def test_buffer_is_flushed_after_the_time_window_while_the_model_is_quiet():
+    async def stream():
+        yield "a"
+        yield "b"
+        await asyncio.sleep(0.2)
+        yield "c"
+
+    async def receive():
+        start = time.perf_counter()
+        return [(frame, time.perf_counter() - start) async for frame in encoder.aencode(stream())]
+
+    encoder = SSEEncoder(coalesce_bytes=0, coalesce_ms=20, heartbeat=0)
+    received = asyncio.run(receive())
+
+    assert [frame for frame, _ in received] == [
+        b'id: 1\ndata: {"text":"a"}\n\n',
+        b'id: 2\ndata: {"text":"b"}\n\n',
+        b'id: 3\ndata: {"text":"c"}\n\n'
+    ]
+    # "b" did not wait for "c"
+    assert received[1][1] < 0.15
+
+
+def test_sync_stream_flushes_an_expired_window_when_the_next_chunk_arrives():
+    def stream():
+        yield "a"
+        yield "b"
+        time.sleep(0.1)
+        yield "c"
+        yield "d"
+
+    encoder = SSEEncoder(coalesce_bytes=0, coalesce_ms=20, heartbeat=0)
+    threads = threading.active_count()
+
+    frames = []
+    for frame in encoder.encode(stream()):
+        frames.append(frame)
+        # No helper thread reads the stream
+        assert threading.active_count() == threads
+
+    assert frames == [
+        b'id: 1\ndata: {"text":"a"}\n\n',
+        b'id: 3\ndata: {"text":"bc"}\n\n',
+        b'id: 4\ndata: {"text":"d"}\n\n'
+    ]
+
+
+def test_heartbeats_while_idle():
+    encoder = SSEEncoder(coalesce_bytes=0, coalesce_ms=0, heartbeat=0.05)
+
+    frames = asyncio.run(collect(encoder.aencode(aslow(["late"], 0.18))))
+
+    assert frames.count(HEARTBEAT) >= 2
+    assert frames[-1] == b'id: 4\ndata: {"text":"late"}\n\n'
+
+
+def test_sync_heartbeat_is_sent_when_a_buffered_chunk_arrives_late():
+    encoder = SSEEncoder(coalesce_bytes=1024, coalesce_ms=0, heartbeat=0.05)
+
+    frames = list(encoder.encode(slow(["first", "late"], 0.06)))
+
+    assert frames == [b'id: 5\ndata: {"text":"first"}\n\n', HEARTBEAT, b'id: 9\ndata: {"text":"late"}\n\n']
+
+
+def test_resume_skips_text_the_client_already_has():
+    encoder = SSEEncoder(coalesce_bytes=0, coalesce_ms=0, heartbeat=0)
+
+    frames = list(encoder.encode(iter(["Hello", " wor", "ld"]), offset=7))
+
+    assert frames == [b'id: 9\ndata: {"text":"or"}\n\n', b'id: 11\ndata: {"text":"ld"}\n\n']
+
+
+async def collect(generator):
+    return [frame async for frame in generator]
@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+import importlib
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from startup_profiler import StartupProfiler
+
+
+def write_package(directory: str):
+    # slowpkg.parent spends 20ms of its own and imports slowpkg.child, which takes 50ms
+    package = os.path.join(directory, "slowpkg")
+    os.makedirs(package)
+    modules = {
+        "__init__.py": "",
+        "parent.py": "import time\nimport slowpkg.child\ntime.sleep(0.02)\n",
+        "child.py": "import time\ntime.sleep(0.05)\n"
+    }
+    for name, source in modules.items():
+        with open(os.path.join(package, name), "w") as module:
+            module.write(source)
+
+
+def profile_import(name: str) -> StartupProfiler:
+    with tempfile.TemporaryDirectory() as directory:
+        write_package(directory)
+        sys.path.insert(0, directory)
+        profiler = StartupProfiler.install()
+        try:
+            importlib.import_module(name)
+        finally:
+            profiler.app_created()
+            sys.path.remove(directory)
+            for module in [module for module in sys.modules if module.split(".")[0] == "slowpkg"]:
+                del sys.modules[module]
+    return profiler
+
+
+def test_children_count_towards_cumulative_but_not_self_time():
+    profiler = profile_import("slowpkg.parent")
+
+    assert profiler.cumulative["slowpkg.child"] >= 0.05
+    assert profiler.self_seconds["slowpkg.child"] == profiler.cumulative["slowpkg.child"]
+    assert profiler.cumulative["slowpkg.parent"] >= profiler.cumulative["slowpkg.child"] + 0.02
+    assert 0.02 <= profiler.self_seconds["slowpkg.parent"] < profiler.cumulative["slowpkg.child"]
+
+
+def test_report_sums_own_time_per_package():
+    profiler = profile_import("slowpkg.parent")
+
+    report = profiler.report()
+    packages = dict(report["packages"])
+
+    own = sum(seconds for name, seconds in profiler.self_seconds.items() if name.startswith("slowpkg"))
+    assert abs(packages["slowpkg"] - own) < 1e-9
+    assert report["modules"][0][0] == "slowpkg.parent"
+    assert abs(report["import_seconds"] - sum(profiler.self_seconds.values())) < 1e-9
+    assert report["first_request_seconds"] is None
+
+
+def test_imports_after_app_created_are_not_timed():
+    profiler = profile_import("slowpkg")
+
+    assert profiler not in sys.meta_path
+    assert set(profiler.cumulative) == {"slowpkg"}
+
+
+def test_only_the_first_request_is_recorded():
+    profiler = StartupProfiler()
+    profiler.app_created()
+
+    profiler.request_started()
+    first = profiler.first_request
+    profiler.request_started()
+
+    assert profiler.first_request == first
+    assert profiler.report()["first_request_seconds"] >= profiler.report()["create_app_seconds"]
+
+
+def test_heavy_dependencies_are_not_imported_by_the_app_module():
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+    script = (
+        "import sys; sys.path.insert(0, sys.argv[1]); import app; "
+        "print(' '.join(name for name in ('chromadb', 'google.genai', 'opentelemetry.sdk.trace', 'PyPDF2') "
+        "if name in sys.modules))"
+    )
+
+    loaded = subprocess.run([sys.executable, "-c", script, source], capture_output=True, text=True, check=True)
+
+    assert loaded.stdout.split() == []
@@ -0,0 +1,44 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from services.tracing import TRACER, configure_tracing, in_current_context
+from services.llm_service import LLMService
+from services.llm_backend import SimulatedBackend
+from models.document import Document
+
+exporter = configure_tracing("memory")
+
+
+def test_llm_call_is_a_child_span_with_a_first_chunk_event():
+    exporter.clear()
+    backend = SimulatedBackend(ttft=0, token_delay=0, tokens=5, error_rate=0, rate_limit=0)
+    service = LLMService(backend, "simulated", "Be brief.", context_cache_ttl=0)
+
+    with TRACER.start_as_current_span("request") as request_span:
+        chunks = list(service.query("question", [Document("doc", {}, "1")]))
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    generate = spans["llm.generate"]
+    assert generate.parent.span_id == request_span.get_span_context().span_id
+    assert [event.name for event in generate.events] == ["first_chunk"]
+    assert generate.attributes["llm.chunks"] == len(chunks)
+    assert generate.attributes["llm.outcome"] == "ok"
+
+
+def test_context_follows_work_onto_other_threads():
+    exporter.clear()
+
+    def work():
+        with TRACER.start_as_current_span("background"):
+            pass
+
+    with TRACER.start_as_current_span("request") as request_span:
+        thread = threading.Thread(target=in_current_context(work))
+        thread.start()
+        thread.join()
+
+    background = next(span for span in exporter.get_finished_spans() if span.name == "background")
+    assert background.parent.span_id == request_span.get_span_context().span_id
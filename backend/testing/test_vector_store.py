@@ -0,0 +1,115 @@
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models.document import Document
+from services import vector_store
+from services.vector_store import ReadWriteLock, VectorStore
+from services.document_service import DocumentService
+
+
+def embed(texts):
+    return [[float(len(text)), 1.0] for text in texts]
+
+
+def count_walks(monkeypatch) -> list:
+    walks = []
+    directory_size = vector_store._directory_size
+
+    def counting(path):
+        walks.append(path)
+        return directory_size(path)
+
+    monkeypatch.setattr(vector_store, "_directory_size", counting)
+    return walks
+
+
+def test_stats_are_measured_once_per_ttl(monkeypatch):
+    walks = count_walks(monkeypatch)
+    with tempfile.TemporaryDirectory() as directory:
+        store = VectorStore(directory, stats_ttl=60)
+        store.collection("documents")
+
+        first = store.stats()
+        with store.writing("documents"):
+            store.collection("documents").add(ids=["1"], documents=["text"], embeddings=[[1.0, 2.0]])
+        second = store.stats()
+
+        assert len(walks) == 1
+        assert first["collections"]["documents"]["count"] == 0
+        # Generations are always current, counts until the next measurement
+        assert second["collections"]["documents"]["count"] == 0
+        assert second["collections"]["documents"]["generation"] == first["collections"]["documents"]["generation"] + 1
+
+
+def test_stats_are_measured_again_after_ttl(monkeypatch):
+    walks = count_walks(monkeypatch)
+    with tempfile.TemporaryDirectory() as directory:
+        store = VectorStore(directory, stats_ttl=0)
+        collection = store.collection("documents")
+
+        store.stats()
+        collection.add(ids=["1"], documents=["text"], embeddings=[[1.0, 2.0]])
+        stats = store.stats()
+
+        assert len(walks) == 2
+        assert stats["collections"]["documents"]["count"] == 1
+
+
+def test_stats_do_not_count_during_a_write():
+    with tempfile.TemporaryDirectory() as directory:
+        store = VectorStore(directory, stats_ttl=0)
+        store.collection("documents")
+        measured = threading.Event()
+        reader = threading.Thread(target=lambda: (store.stats(), measured.set()))
+
+        with store.writing("documents"):
+            reader.start()
+            assert not measured.wait(0.2)
+            store.collection("documents").add(ids=["1"], documents=["text"], embeddings=[[1.0, 2.0]])
+        reader.join(5)
+
+        assert measured.is_set()
+        assert store.measured["counts"]["documents"] == 1
+
+
+def test_writer_waits_for_readers():
+    lock = ReadWriteLock()
+    written = threading.Event()
+
+    def write():
+        with lock.writing():
+            written.set()
+
+    with lock.reading():
+        writer = threading.Thread(target=write)
+        writer.start()
+        assert not written.wait(0.1)
+    writer.join(1)
+
+    assert written.is_set()
+
+
+def test_reads_run_while_a_batch_is_embedded():
+    with tempfile.TemporaryDirectory() as directory:
+        store = VectorStore(directory)
+        read_during_embedding = threading.Event()
+
+        def embed_slowly(texts):
+            def read():
+                with store.reading():
+                    read_during_embedding.set()
+
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join(1)
+            return embed(texts)
+
+        service = DocumentService(embedding_function=embed_slowly, vector_store=store, deduplicate=False)
+        service.add_documents([Document("chunk", {"name": "a.pdf"}, "1")])
+
+        assert read_during_embedding.is_set()
+        assert store.collection("documents").count() == 1
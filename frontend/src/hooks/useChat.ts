@@ -7,6 +7,22 @@ const API_BASE_URL = import.meta.env.VITE_API_URL || ''; // Get API URL from .en
     const CHAT_API_ENDPOINT = `${API_BASE_URL}/rag/query`; // Specific endpoint
 const UPLOAD_API_ENDPOINT = `${API_BASE_URL}/document/upload`; // Upload endpoint
 
+// Parses one Server-Sent Event: its text, if any, and whether the answer starts over.
+// Heartbeats have neither. A reset comes when a resumed answer had to be generated again
+const parseEvent = (event: string): { text: string | null; reset: boolean } => {
+    const data = event
+        .split('\n')
+        .filter((line) => line.startsWith('data:'))
+        .map((line) => line.slice(5).replace(/^ /, ''))
+        .join('\n');
+    if (!data) return { text: null, reset: false };
+    const chunkData = JSON.parse(data);
+    return {
+        text: typeof chunkData.text === 'string' ? chunkData.text : null,
+        reset: chunkData.reset === true,
+    };
+};
+
 export const useChat = () => {
     const {refresh } = useAuth();
     const [messages, setMessages] = useState<Message[]>([]);
@@ -110,9 +126,9 @@ export const useChat = () => {
                 for (const part of parts) {
                     if (part.trim()) {
                         try {
-                            const chunkData = JSON.parse(part.trim());
-                            if (chunkData.text) {
-                                assistantMessageContent += chunkData.text;
+                            const { text, reset } = parseEvent(part);
+                            if (text || reset) {
+                                assistantMessageContent = reset ? '' : assistantMessageContent + text;
                                 setMessages((prevMessages) => {
                                     const updatedMessages = [...prevMessages];
                                     const lastMessageIndex = updatedMessages.length - 1;
@@ -132,9 +148,9 @@ export const useChat = () => {
             // Handle final buffer chunk
             if (buffer.trim()) {
                 try {
-                    const chunkData = JSON.parse(buffer.trim());
-                    if (chunkData.text) {
-                        assistantMessageContent += chunkData.text;
+                    const { text, reset } = parseEvent(buffer);
+                    if (text || reset) {
+                        assistantMessageContent = reset ? '' : assistantMessageContent + text;
                         setMessages((prevMessages) => {
                             const updatedMessages = [...prevMessages];
                             const lastMessageIndex = updatedMessages.length - 1;